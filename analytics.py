@@ -0,0 +1,340 @@
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, delete, func, insert, select, update
+
+from models import db, Waste, WasteRequest, RequestRollup, utcnow
+import changes
+import units
+
+# Request trends are answered from request_rollups: per hour, day, week and
+# month bucket of a request's created_at (its cohort) and for all time (one
+# bucket at EPOCH), per industry, waste type and canonical unit (see
+# units.py), the number and quantity of requests and how many were approved
+# or rejected. Every request also counts in an all-industries row
+# (industry_id 0), so trends that are not split by industry read a few
+# hundred rows instead of one per industry. Rows are adjusted in the same
+# transaction as the requests they summarise, so a status change moves its
+# quantity within the request's original bucket.
+#
+# A request is attributed to its waste's current type and unit, its quantity
+# converted to that unit's canonical one: a waste update that changes either
+# moves the contribution of every request of that waste to the new key.
+# `flask analytics rebuild` re-derives everything from the current rows.
+
+HOUR = 'hour'
+DAY = 'day'
+WEEK = 'week'
+MONTH = 'month'
+TOTAL = 'total'
+BUCKETS = (HOUR, DAY, WEEK, MONTH, TOTAL)
+
+# Bucket of the all-time rows
+EPOCH = datetime(1970, 1, 1)
+
+ALL_INDUSTRIES = 0
+
+MEASURES = ('requests', 'requested_quantity', 'approved', 'approved_quantity',
+            'rejected', 'rejected_quantity')
+
+# ?group_by= names and the rollup column each one groups on
+GROUPS = OrderedDict([
+    ('wasteType', RequestRollup.wasteType),
+    ('industry', RequestRollup.industry_id),
+])
+
+MAX_ROWS = 5000
+REBUILD_BATCH_SIZE = 5000
+
+
+class AnalyticsError(ValueError):
+    status_code = 400
+
+
+def truncate(moment, bucket):
+    """Start of the bucket containing `moment`"""
+    if bucket == TOTAL:
+        return EPOCH
+    if bucket == HOUR:
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == WEEK:
+        return day - timedelta(days=day.weekday())
+    if bucket == MONTH:
+        return day.replace(day=1)
+    return day
+
+
+def _measures(values, factor=1.0):
+    quantity = (values['quantity_requested'] or 0.0) * factor
+    status = values['status']
+    return (1, quantity,
+            int(status == 'approved'), quantity if status == 'approved' else 0.0,
+            int(status == 'rejected'), quantity if status == 'rejected' else 0.0)
+
+
+def _keys(values, waste):
+    """Rollup primary keys a request row counts in"""
+    created = values.get('created_at') or utcnow()
+    waste_type, unit = waste
+    return [(grain, industry_id, truncate(created, grain), waste_type, unit)
+            for grain in BUCKETS
+            for industry_id in (values['industry_id'], ALL_INDUSTRIES)]
+
+
+def _waste_key(waste_type, unit):
+    """((wasteType, canonical unit), factor to it)"""
+    canonical, factor = units.lookup(unit)
+    return (waste_type, canonical), factor
+
+
+def _waste_info(connection, batch, waste_ids):
+    """{waste_id: _waste_key()}, preferring values from the batch so wastes
+    deleted in the same flush are still known"""
+    info = {}
+    for change in batch:
+        if change.table == Waste.__tablename__:
+            row = change.new or change.old
+            info[row['id']] = _waste_key(row['wasteType'], row['unit'])
+    missing = [waste_id for waste_id in waste_ids if waste_id not in info]
+    if missing:
+        info.update((waste_id, _waste_key(waste_type, unit))
+                    for waste_id, waste_type, unit in
+                    connection.execute(select(Waste.id, Waste.wasteType, Waste.unit)
+                                       .where(Waste.id.in_(missing))))
+    return info
+
+
+def _moved_wastes(batch):
+    """{waste_id: old _waste_key()} of wastes whose type or canonical unit
+    changed in the batch"""
+    moved = {}
+    for change in batch:
+        if change.table == Waste.__tablename__ and change.op == changes.UPDATE:
+            old = _waste_key(change.old['wasteType'], change.old['unit'])
+            if old != _waste_key(change.new['wasteType'], change.new['unit']):
+                moved[change.new['id']] = old
+    return moved
+
+
+@changes.on_flush
+def apply_changes(session, batch):
+    """Fold request inserts, updates and deletes, and waste type or unit
+    changes, into the rollups"""
+    requests = [change for change in batch if change.table == WasteRequest.__tablename__]
+    moved = _moved_wastes(batch)
+    if not requests and not moved:
+        return
+    connection = session.connection()
+    waste_ids = {values['waste_id'] for change in requests
+                 for values in (change.old, change.new) if values is not None}
+    wastes = _waste_info(connection, batch, waste_ids)
+
+    # Requests of one industry, waste type and unit created within the same
+    # hour share every rollup key, so large batches (cascade deletes, group
+    # commits) are added up per hour before being spread over the grains
+    hours = defaultdict(lambda: [0] * len(MEASURES))
+
+    def add(values, waste, factor, sign):
+        hour = truncate(values.get('created_at') or utcnow(), HOUR)
+        vector = hours[(values['industry_id'], hour, waste)]
+        for index, value in enumerate(_measures(values, factor)):
+            vector[index] += sign * value
+
+    # The requests of a moved waste, as they are after this flush, leave
+    # its old key for the new one. Changes to them in this same flush are
+    # then applied to the old key, where their previous values were counted
+    if moved:
+        rows = connection.execute(
+            select(WasteRequest.waste_id, WasteRequest.industry_id,
+                   WasteRequest.quantity_requested, WasteRequest.status,
+                   WasteRequest.created_at)
+            .where(WasteRequest.waste_id.in_(list(moved)))
+        ).mappings()
+        new = _waste_info(connection, batch, list(moved))
+        for values in rows:
+            add(values, *moved[values['waste_id']], -1)
+            add(values, *new[values['waste_id']], 1)
+        wastes.update(moved)
+
+    for change in requests:
+        for values, sign in ((change.old, -1), (change.new, 1)):
+            if values is not None and values['waste_id'] in wastes:
+                add(values, *wastes[values['waste_id']], sign)
+
+    totals = defaultdict(lambda: [0] * len(MEASURES))
+    for (industry_id, hour, waste), vector in hours.items():
+        values = {'industry_id': industry_id, 'created_at': hour}
+        for key in _keys(values, waste):
+            total = totals[key]
+            for index, value in enumerate(vector):
+                total[index] += value
+
+    for key, vector in totals.items():
+        if any(vector):
+            _bump(connection, key, vector)
+
+
+_KEY = ('grain', 'industry_id', 'bucket', 'wasteType', 'unit')
+
+# Built once: a flush can bump dozens of rows, and constructing the
+# statements dominated the cost of doing so
+_table = RequestRollup.__table__
+_BUMP = (update(_table)
+         .where(*[_table.c[name] == bindparam(f'key_{name}') for name in _KEY])
+         .values({name: _table.c[name] + bindparam(f'delta_{name}') for name in MEASURES}))
+_INSERT = insert(_table)
+
+
+def _bump(connection, key, vector):
+    params = {f'key_{name}': value for name, value in zip(_KEY, key)}
+    params.update((f'delta_{name}', delta) for name, delta in zip(MEASURES, vector))
+    if connection.execute(_BUMP, params).rowcount == 0:
+        connection.execute(_INSERT, dict(zip(_KEY, key), **dict(zip(MEASURES, vector))))
+
+
+def _parse_moment(value, name):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise AnalyticsError(f'{name} must be an ISO date or datetime')
+
+
+def parse_query(args):
+    """Keyword arguments for summarise() from request args"""
+    bucket = args.get('bucket') or DAY
+    if bucket not in BUCKETS:
+        raise AnalyticsError(f'bucket must be one of: {", ".join(BUCKETS)}')
+
+    group_by = [name for name in (args.get('group_by') or '').split(',') if name]
+    for name in group_by:
+        if name not in GROUPS:
+            raise AnalyticsError(f'group_by must be a list of: {", ".join(GROUPS)}')
+
+    start = _parse_moment(args['from'], 'from') if args.get('from') else None
+    end = None
+    if args.get('to'):
+        end = _parse_moment(args['to'], 'to')
+        if len(args['to']) == 10:
+            # A plain date includes the whole day
+            end += timedelta(days=1)
+    if start and end and start >= end:
+        raise AnalyticsError('from must be before to')
+
+    order_by = args.get('order_by') or None
+    if order_by is not None and order_by not in MEASURES + ('approval_rate',):
+        raise AnalyticsError(f'order_by must be one of: {", ".join(MEASURES)}, approval_rate')
+
+    try:
+        limit = int(args.get('limit') or MAX_ROWS)
+        industry_id = int(args['industry_id']) if args.get('industry_id') else None
+    except ValueError:
+        raise AnalyticsError('limit and industry_id must be integers')
+    if not 1 <= limit <= MAX_ROWS:
+        raise AnalyticsError(f'limit must be between 1 and {MAX_ROWS}')
+
+    return {'bucket': bucket, 'group_by': group_by, 'start': start, 'end': end,
+            'waste_type': args.get('wasteType') or None, 'industry_id': industry_id,
+            'order_by': order_by, 'limit': limit}
+
+
+def _approval_rate(row):
+    decided = row['approved'] + row['rejected']
+    return row['approved'] / decided if decided else None
+
+
+def summarise(bucket=DAY, group_by=(), start=None, end=None, waste_type=None,
+              industry_id=None, order_by=None, limit=MAX_ROWS):
+    """Request totals per bucket and group, read from the rollups.
+
+    Quantities are only ever added up within one unit, so rows are always
+    split by unit as well. `start`/`end` select whole buckets: the one
+    containing `start` up to the last one starting before `end` (days when
+    a total is asked for a date range). Rows come oldest bucket first, or
+    largest `order_by` first.
+    """
+    grain = DAY if bucket == TOTAL and (start or end) else bucket
+    groups = [GROUPS[name] for name in group_by] + [RequestRollup.unit]
+    keys = ([RequestRollup.bucket] if bucket != TOTAL else []) + groups
+    sums = [func.sum(getattr(RequestRollup, name)).label(name) for name in MEASURES]
+
+    query = (select(*keys, *sums)
+             .where(RequestRollup.grain == grain, RequestRollup.requests > 0)
+             .group_by(*keys))
+    if industry_id is not None:
+        query = query.where(RequestRollup.industry_id == industry_id)
+    elif 'industry' in group_by:
+        query = query.where(RequestRollup.industry_id != ALL_INDUSTRIES)
+    else:
+        query = query.where(RequestRollup.industry_id == ALL_INDUSTRIES)
+    if start is not None:
+        query = query.where(RequestRollup.bucket >= truncate(start, grain))
+    if end is not None:
+        query = query.where(RequestRollup.bucket < end)
+    if waste_type is not None:
+        query = query.where(RequestRollup.wasteType == waste_type)
+
+    if order_by in MEASURES:
+        query = query.order_by(db.desc(order_by), *keys).limit(limit)
+    elif order_by is None:
+        query = query.order_by(*keys).limit(limit)
+
+    names = (['bucket'] if bucket != TOTAL else []) + \
+        ['industry_id' if name == 'industry' else name for name in group_by] + ['unit']
+    rows = []
+    for row in db.session.execute(query):
+        row = dict(zip(names + list(MEASURES), row))
+        if 'bucket' in row:
+            row['bucket'] = row['bucket'].isoformat()
+        row['approval_rate'] = _approval_rate(row)
+        rows.append(row)
+
+    if order_by == 'approval_rate':
+        rows.sort(key=lambda row: (row[order_by] is not None, row[order_by] or 0),
+                  reverse=True)
+        rows = rows[:limit]
+    return rows
+
+
+def rebuild():
+    """Recompute every rollup row from the requests and their wastes"""
+    session = db.session
+    session.execute(delete(RequestRollup))
+
+    totals = defaultdict(lambda: [0] * len(MEASURES))
+    wastes = {}
+    rows = session.connection().execute(
+        select(WasteRequest.industry_id, WasteRequest.quantity_requested,
+               WasteRequest.status, WasteRequest.created_at, Waste.wasteType, Waste.unit)
+        .join(Waste, Waste.id == WasteRequest.waste_id)
+    ).mappings()
+    for values in rows:
+        waste = (values['wasteType'], values['unit'])
+        if waste not in wastes:
+            wastes[waste] = _waste_key(*waste)
+        waste, factor = wastes[waste]
+        measures = _measures(values, factor)
+        for key in _keys(values, waste):
+            vector = totals[key]
+            for index, value in enumerate(measures):
+                vector[index] += value
+
+    entries = [dict(zip(_KEY, key),
+                    **dict(zip(MEASURES, vector)))
+               for key, vector in totals.items()]
+    for offset in range(0, len(entries), REBUILD_BATCH_SIZE):
+        session.execute(insert(RequestRollup), entries[offset:offset + REBUILD_BATCH_SIZE])
+    session.commit()
+    return len(entries)
+
+
+analytics_cli = AppGroup('analytics', help='Maintain the request analytics rollups.')
+
+
+@analytics_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild the request rollups from the base tables."""
+    count = rebuild()
+    click.echo(f'Request rollups rebuilt ({count} rows).')
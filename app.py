@@ -1,30 +1,97 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_migrate import Migrate
 from models import db, ma
+from config import Config, engine_options, configure_sqlite
+from pagination import PaginationError
+from serializers import FieldsetError, JSONProvider
+from exports import ExportError
+from bulk import BulkInputError
+from batch import BatchError
+from stats import stats_cli
+from search import search_cli
+from analytics import analytics_cli
+from deletion import purge_cli
+from units import units_cli
+import cache
+import instrumentation
+import events
+import ingest
+import deletion
+import batch
 
 from routes.Industries import industries_bp
 from routes.Wastes import wastes_bp
 from routes.Dashboard import dashboard_bp
+from routes.Sync import sync_bp
+from routes.Batch import batch_bp
 
-app = Flask(__name__)
-CORS(app)
+migrate = Migrate()
 
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///ecocycle.db"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
-db.init_app(app)
-ma.init_app(app)
-migrate = Migrate(app, db)
+def handle_bad_request(error):
+    return jsonify({'error': str(error)}), 400
 
-app.register_blueprint(industries_bp)
-app.register_blueprint(wastes_bp)
-app.register_blueprint(dashboard_bp)
 
-@app.route("/api/health", methods=["GET"])
 def health_check():
     return {"status": "healthy", "message": "EcoCycle API is running"}
 
+
+def cache_stats():
+    backend = cache.get_cache()
+    return {"backend": type(backend).__name__ if backend else None,
+            **(backend.stats() if backend else {})}
+
+
+def create_app(config_object=Config, **overrides):
+    """Build the app from `config_object` (environment-driven by default),
+    with keyword `overrides` applied on top"""
+    app = Flask(__name__)
+    app.json = JSONProvider(app)
+    CORS(app)
+
+    app.config.from_object(config_object)
+    app.config.update(overrides)
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config))
+
+    db.init_app(app)
+    ma.init_app(app)
+    migrate.init_app(app, db)
+    cache.init_app(app)
+    instrumentation.init_app(app)
+    events.init_app(app)
+    ingest.init_app(app)
+    deletion.init_app(app)
+    batch.init_app(app)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_sqlite(engine, app.config.get("SQLITE_PRAGMAS"))
+
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(analytics_cli)
+    app.cli.add_command(purge_cli)
+    app.cli.add_command(units_cli)
+
+    app.register_blueprint(industries_bp)
+    app.register_blueprint(wastes_bp)
+    app.register_blueprint(dashboard_bp)
+    app.register_blueprint(sync_bp)
+    app.register_blueprint(batch_bp)
+
+    for error in (PaginationError, ExportError, BulkInputError, FieldsetError,
+                  BatchError):
+        app.register_error_handler(error, handle_bad_request)
+
+    app.add_url_rule("/api/health", view_func=health_check, methods=["GET"])
+    app.add_url_rule("/api/cache/stats", view_func=cache_stats, methods=["GET"])
+
+    return app
+
+
+app = create_app()
+
 if __name__ == "__main__":
-    app.run(port=5555, debug=True)
\ No newline at end of file
+    app.run(port=5555, debug=True)
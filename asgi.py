@@ -0,0 +1,338 @@
+import argparse
+import asyncio
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import request
+from sqlalchemy.engine import make_url
+from werkzeug.exceptions import HTTPException
+
+try:
+    # Needs greenlet installed
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+except ImportError:
+    async_sessionmaker = create_async_engine = None
+
+try:
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+from app import create_app
+from config import Config, configure_sqlite
+from models import db
+import events
+import instrumentation
+
+# ASGI entry point, next to app.py's WSGI one:
+#
+#     pip install greenlet aiosqlite uvicorn     (asyncpg for PostgreSQL)
+#     uvicorn --factory asgi:create_asgi_app --port 5555
+#
+# The read endpoints in ASYNC_ENDPOINTS run on the event loop. Each request
+# gets an AsyncSession on an asyncio engine, and its usual Flask view runs
+# inside AsyncSession.run_sync() with db.session set to that session's sync
+# facade: the view code, and so the responses, ETags and caching, stay the
+# same, while every query awaits the driver and the loop serves other
+# requests in the meantime. The event stream is opened the same way and
+# then waits for events on the loop, so open dashboards hold no threads.
+# Everything else (writes, exports) runs on a pool of ASGI_WSGI_THREADS
+# threads and is streamed back chunk by chunk.
+#
+# Only database waits are non-blocking: with CACHE_BACKEND = 'redis' every
+# cache lookup of an async endpoint blocks the loop while Redis answers.
+
+# Reads that neither write nor stream their response
+ASYNC_ENDPOINTS = frozenset([
+    'industries.get_all_industries',
+    'industries.get_industry',
+    'industries.search_industries',
+    'industries.get_industry_count',
+    'wastes.get_all_wastes',
+    'wastes.get_waste',
+    'wastes.get_wastes_by_type',
+    'wastes.search_wastes',
+    'wastes.get_available_wastes',
+    'wastes.get_total_quantity',
+    'wastes.get_waste_count',
+    'dashboard.get_dashboard_stats',
+    'dashboard.get_request_analytics',
+    'dashboard.get_all_waste_requests',
+])
+
+# Long-lived streams served on the loop (see events.EventStream)
+EVENT_STREAMS = frozenset(['dashboard.stream_events'])
+
+# Keyed by SQLAlchemy backend name
+ASYNC_DRIVERS = {
+    'sqlite': 'aiosqlite',
+    'postgresql': 'asyncpg',
+}
+
+SESSION_KEY = 'ecocycle.async_session'
+
+
+def async_database_uri(config):
+    """ASYNC_DATABASE_URI, or SQLALCHEMY_DATABASE_URI with its async driver"""
+    if config.get('ASYNC_DATABASE_URI'):
+        return config['ASYNC_DATABASE_URI']
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f'No asyncio driver known for {backend}; set ASYNC_DATABASE_URL')
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+def _use_async_session():
+    # Runs after the app context is pushed, so db.session resolves to the
+    # request's AsyncSession until teardown removes it
+    session = request.environ.get(SESSION_KEY)
+    if session is not None:
+        db.session.registry.set(session)
+
+
+def _environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope"""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    # The body is read in full, chunked or not
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+def _start(status, headers):
+    return {'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in headers]}
+
+
+async def _read_body(receive):
+    """The request body, or None if the client went away first"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _watch_disconnect(receive, disconnected):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+    disconnected.set()
+
+
+async def _pump(stream, send):
+    async for chunk in stream:
+        await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+
+
+def _close(iterable):
+    if hasattr(iterable, 'close'):
+        iterable.close()
+
+
+class AsyncAPI:
+    """ASGI application around a Flask app built by create_app()"""
+
+    def __init__(self, app):
+        if create_async_engine is None:
+            raise RuntimeError('Serving over ASGI needs SQLAlchemy asyncio support: '
+                               'pip install greenlet aiosqlite')
+        self.app = app
+        self.engine = create_async_engine(async_database_uri(app.config),
+                                          **app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+        configure_sqlite(self.engine.sync_engine, app.config.get('SQLITE_PRAGMAS'))
+        if app.extensions.get('metrics') is not None:
+            instrumentation.instrument_engine(self.engine.sync_engine)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.executor = ThreadPoolExecutor(app.config.get('ASGI_WSGI_THREADS', 16),
+                                           thread_name_prefix='wsgi')
+        app.before_request(_use_async_session)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+        body = await _read_body(receive)
+        if body is None:
+            return
+        environ = _environ(scope, body)
+        endpoint = self._endpoint(environ)
+        if endpoint in EVENT_STREAMS:
+            await self._serve_events(environ, receive, send)
+        elif endpoint in ASYNC_ENDPOINTS:
+            await self._serve_async(environ, send)
+        else:
+            await self._serve_threaded(environ, receive, send)
+
+    def _endpoint(self, environ):
+        """The endpoint a GET or HEAD is routed to, else None"""
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return None
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            # Not found, method not allowed, or a redirect
+            return None
+        return endpoint
+
+    def _open_app(self, session, environ):
+        """Run the WSGI app in `session` up to its response; (status,
+        headers, iterable), the body not read yet"""
+        environ[SESSION_KEY] = session
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+
+        iterable = self.app(environ, start_response)
+        return started[0], started[1], iterable
+
+    def _call_app(self, session, environ):
+        """Run the WSGI app to completion in `session`; (status, headers, body)"""
+        status, headers, iterable = self._open_app(session, environ)
+        try:
+            body = b''.join(iterable)
+        finally:
+            _close(iterable)
+        return status, headers, body
+
+    async def _serve_async(self, environ, send):
+        async with self.sessions() as session:
+            status, headers, body = await session.run_sync(self._call_app, environ)
+        await send(_start(status, headers))
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _serve_events(self, environ, receive, send):
+        # The view runs like an async endpoint (the snapshot reads the
+        # database) and hands its EventStream over in the environ
+        async with self.sessions() as session:
+            status, headers, iterable = await session.run_sync(self._open_app, environ)
+        stream = environ.get(events.STREAM_KEY)
+        try:
+            await send(_start(status, headers))
+            if stream is None or environ['REQUEST_METHOD'] == 'HEAD':
+                # Refused before streaming (no broker, a bad Last-Event-ID)
+                # or nothing to stream
+                await send({'type': 'http.response.body', 'body': b''.join(iterable)})
+                return
+            pump = asyncio.ensure_future(_pump(stream, send))
+            watcher = asyncio.ensure_future(_watch_disconnect(receive, asyncio.Event()))
+            try:
+                done, _ = await asyncio.wait([pump, watcher],
+                                             return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                pump.cancel()
+                watcher.cancel()
+            if pump in done:
+                pump.result()
+        finally:
+            # Unsubscribes the stream
+            _close(iterable)
+
+    def _stream(self, loop, environ, send, disconnected):
+        """Run the WSGI app on a worker thread, handing its response to the
+        event loop chunk by chunk; stops early once the client has gone"""
+        started = []
+        sent = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+
+        def write(chunk, more_body):
+            if not sent:
+                asyncio.run_coroutine_threadsafe(send(_start(*started)), loop).result()
+                sent.append(True)
+            asyncio.run_coroutine_threadsafe(send({
+                'type': 'http.response.body', 'body': chunk, 'more_body': more_body,
+            }), loop).result()
+
+        iterable = self.app(environ, start_response)
+        try:
+            for chunk in iterable:
+                if disconnected.is_set():
+                    return
+                if chunk:
+                    write(chunk, True)
+            write(b'', False)
+        finally:
+            _close(iterable)
+
+    async def _serve_threaded(self, environ, receive, send):
+        loop = asyncio.get_running_loop()
+        disconnected = threading.Event()
+        watcher = loop.create_task(_watch_disconnect(receive, disconnected))
+        try:
+            await loop.run_in_executor(self.executor, self._stream, loop, environ, send,
+                                       disconnected)
+        finally:
+            watcher.cancel()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+        await self.engine.dispose()
+
+
+def create_asgi_app(config_object=Config, **overrides):
+    """create_app() served over ASGI"""
+    return AsyncAPI(create_app(config_object, **overrides))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the API over ASGI with uvicorn.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5555)
+    args = parser.parse_args()
+
+    if uvicorn is None:
+        sys.exit('uvicorn is not installed: pip install uvicorn')
+    uvicorn.run(create_asgi_app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, g, request
+from werkzeug.test import EnvironBuilder
+
+from models import db
+from serializers import dumps
+import cache
+
+# POST /api/batch runs several GET requests in one round trip. Each one is
+# dispatched through the normal routing, so it gets the same validation,
+# caching, ETags and error responses as when requested on its own, and the
+# responses come back in request order:
+#
+#   {"requests": [{"id": "stats", "path": "/api/dashboard/stats"}, ...]}
+#   {"responses": [{"id": "stats", "status": 200, "headers": {...},
+#                   "body": {...}}, ...]}
+#
+# With BATCH_WORKERS = 0 the sub-requests run one after another in the
+# batch's own app context and session, inside a single read transaction, so
+# every response reflects the same committed state. With BATCH_WORKERS > 1
+# they run concurrently on a thread pool, each with its own session; on
+# PostgreSQL the workers import the batch's snapshot (pg_export_snapshot)
+# and still agree, on SQLite each reads whatever was committed when it ran.
+#
+# Cached responses are served as usual, and may be newer than the snapshot.
+# Streaming endpoints (exports, the event stream) are refused.
+
+logger = logging.getLogger('ecocycle.batch')
+
+# Outer request headers not passed on to the sub-requests
+_OWN_HEADERS = frozenset(['content-type', 'content-length', 'if-none-match',
+                          'if-modified-since'])
+
+
+class BatchError(ValueError):
+    """Raised for a malformed batch body"""
+
+
+def streaming(view):
+    """Mark a view whose response is streamed; /api/batch refuses it"""
+    view.streaming = True
+    return view
+
+
+def parse(payload, limit):
+    """[(id, path, headers)] from a batch body"""
+    items = payload.get('requests') if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        raise BatchError('Body must be an object with a non-empty "requests" list')
+    if len(items) > limit:
+        raise BatchError(f'A batch holds at most {limit} requests')
+
+    parsed, seen = [], set()
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str) \
+                or not item['path'].startswith('/'):
+            raise BatchError(f'requests[{index}] needs a "path" starting with /')
+        if str(item.get('method', 'GET')).upper() != 'GET':
+            raise BatchError(f'requests[{index}]: only GET requests can be batched')
+        headers = item.get('headers') or {}
+        if not isinstance(headers, dict) or \
+                not all(isinstance(value, str) for value in headers.values()):
+            raise BatchError(f'requests[{index}]: headers must map names to strings')
+        item_id = item.get('id', index)
+        if not isinstance(item_id, (str, int)) or isinstance(item_id, bool):
+            raise BatchError(f'requests[{index}]: id must be a string or an integer')
+        if item_id in seen:
+            raise BatchError(f'requests[{index}]: duplicate id {item_id!r}')
+        seen.add(item_id)
+        parsed.append((item_id, item['path'], headers))
+    return parsed
+
+
+def _environ(path, headers):
+    """WSGI environ for a sub-request, based on the batch request"""
+    merged = {name: value for name, value in request.headers.items()
+              if name.lower() not in _OWN_HEADERS}
+    merged.update(headers)
+    builder = EnvironBuilder(path=path, base_url=request.root_url, method='GET',
+                             headers=merged,
+                             environ_base={'REMOTE_ADDR': request.remote_addr})
+    try:
+        return builder.get_environ()
+    finally:
+        builder.close()
+
+
+def _bytes(data):
+    return data if isinstance(data, bytes) else data.encode()
+
+
+def _entry(item_id, status, headers, body):
+    """One encoded response; JSON bodies are spliced in without re-parsing"""
+    head = _bytes(dumps({'id': item_id, 'status': status, 'headers': headers})).rstrip()
+    return head[:-1] + b',"body":' + body + b'}'
+
+
+def _error(item_id, status, message):
+    return _entry(item_id, status, {}, _bytes(dumps({'error': message})).rstrip())
+
+
+def _encode(item_id, response):
+    data = response.get_data()
+    if not data:
+        body = b'null'
+    elif response.is_json:
+        body = data.rstrip()
+    else:
+        body = _bytes(dumps(data.decode('utf-8', 'replace'))).rstrip()
+    headers = {name: value for name, value in response.headers.items()
+               if name != 'Content-Length'}
+    return _entry(item_id, response.status_code, headers, body)
+
+
+def _dispatch(app, item_id, environ):
+    """Run one sub-request; returns (encoded entry, whether it failed)"""
+    with app.request_context(environ):
+        rule = request.url_rule
+        if rule is not None and getattr(app.view_functions[rule.endpoint], 'streaming', False):
+            return _error(item_id, 400, f'{request.path} streams its response '
+                                        f'and cannot be batched'), False
+        try:
+            response = app.full_dispatch_request()
+        except Exception:
+            logger.exception('Batched request to %s failed', request.path)
+            return _error(item_id, 500, 'Internal server error'), True
+        try:
+            return _encode(item_id, response), False
+        finally:
+            response.close()
+
+
+def _begin_snapshot(snapshot_id=None):
+    """Start a read transaction every later query of the session shares.
+    On PostgreSQL returns its exported id, or joins `snapshot_id`."""
+    session = db.session
+    session.rollback()
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        connection = session.connection(
+            execution_options={'isolation_level': 'REPEATABLE READ'})
+        if snapshot_id is not None:
+            connection.exec_driver_sql(f"SET TRANSACTION SNAPSHOT '{snapshot_id}'")
+            return snapshot_id
+        return connection.exec_driver_sql('SELECT pg_export_snapshot()').scalar()
+    connection = session.connection()
+    if dialect == 'sqlite':
+        # pysqlite only opens transactions for writes; the first read after
+        # BEGIN fixes the snapshot
+        connection.exec_driver_sql('BEGIN')
+        connection.exec_driver_sql('SELECT count(*) FROM sqlite_master').scalar()
+    return None
+
+
+def _take_generation():
+    backend = cache.get_cache()
+    g.snapshot_generation = backend.generation() if backend is not None else None
+
+
+def _end_snapshot():
+    g.pop('snapshot_generation', None)
+    db.session.rollback()
+
+
+def _run_sequentially(app, items):
+    entries = []
+    _take_generation()
+    _begin_snapshot()
+    try:
+        for item_id, environ in items:
+            entry, failed = _dispatch(app, item_id, environ)
+            entries.append(entry)
+            if failed:
+                # The transaction may be unusable; carry on in a new one
+                _take_generation()
+                _begin_snapshot()
+    finally:
+        _end_snapshot()
+    return entries
+
+
+def _run_isolated(app, item_id, environ, snapshot_id, generation):
+    with app.app_context():
+        if snapshot_id is not None:
+            g.snapshot_generation = generation
+            _begin_snapshot(snapshot_id)
+        try:
+            return _dispatch(app, item_id, environ)[0]
+        finally:
+            db.session.rollback()
+
+
+def _run_concurrently(app, executor, items):
+    snapshot_id = generation = None
+    if db.engine.dialect.name == 'postgresql':
+        # The batch's transaction keeps the exported snapshot importable
+        # until every worker has started
+        _take_generation()
+        generation = g.snapshot_generation
+        snapshot_id = _begin_snapshot()
+    try:
+        futures = [executor.submit(_run_isolated, app, item_id, environ, snapshot_id,
+                                   generation)
+                   for item_id, environ in items]
+        return [future.result() for future in futures]
+    finally:
+        _end_snapshot()
+
+
+def run(payload):
+    """The encoded batch response body for a batch request body"""
+    app = current_app._get_current_object()
+    limit = app.config.get('BATCH_MAX_REQUESTS', 20)
+    items = [(item_id, _environ(path, headers))
+             for item_id, path, headers in parse(payload, limit)]
+    executor = app.extensions.get('batch')
+    if executor is not None and len(items) > 1:
+        entries = _run_concurrently(app, executor, items)
+    else:
+        entries = _run_sequentially(app, items)
+    return b'{"responses":[' + b','.join(entries) + b']}\n'
+
+
+def init_app(app):
+    """Create the sub-request thread pool when BATCH_WORKERS > 1"""
+    workers = app.config.get('BATCH_WORKERS', 0)
+    app.extensions['batch'] = (ThreadPoolExecutor(workers, thread_name_prefix='batch')
+                               if workers > 1 else None)
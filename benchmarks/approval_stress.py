@@ -0,0 +1,134 @@
+"""Concurrent approval stress test.
+
+Creates one waste with a fixed stock and more pending requests for it than
+the stock can cover, then has several worker processes (or threads) race to
+approve every request, each in a different order. Afterwards it checks that
+stock never went negative, that no request was approved twice and that the
+stock taken matches the approved requests, and prints throughput per worker
+count.
+
+    python benchmarks/approval_stress.py --workers 1 2 4 8 --requests 400
+    python benchmarks/approval_stress.py --mode thread
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from config import Config  # noqa: E402
+from models import db, Industry, Waste, WasteRequest  # noqa: E402
+
+REQUESTED = 5.0
+
+
+def make_app(path):
+    return create_app(SQLALCHEMY_DATABASE_URI=f"sqlite:///{path}",
+                      SQLITE_PRAGMAS=dict(Config.SQLITE_PRAGMAS, busy_timeout=30000))
+
+
+def prepare(path, requests, stock):
+    app = make_app(path)
+    with app.app_context():
+        db.create_all()
+        industry = Industry(name="Stress", industry_code=1)
+        db.session.add(industry)
+        db.session.flush()
+        waste = Waste(name="Stock", wasteType="Metal", quantity=stock, unit="kg",
+                      industry_id=industry.id)
+        db.session.add(waste)
+        db.session.flush()
+        db.session.add_all([
+            WasteRequest(quantity_requested=REQUESTED, industry_id=industry.id, waste_id=waste.id)
+            for _ in range(requests)
+        ])
+        db.session.commit()
+        return [r.id for r in WasteRequest.query.all()]
+
+
+def approve_all(path, ids, seed, results):
+    app = make_app(path)
+    client = app.test_client()
+    order = list(ids)
+    random.Random(seed).shuffle(order)
+    counts = {}
+    for request_id in order:
+        response = client.patch(f"/api/dashboard/waste-requests/{request_id}/status",
+                                json={"status": "approved"})
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+    results.put(counts) if hasattr(results, "put") else results.append(counts)
+
+
+def run(workers, requests, mode):
+    handle, path = tempfile.mkstemp(suffix=".db")
+    os.close(handle)
+    stock = REQUESTED * requests / 2
+    ids = prepare(path, requests, stock)
+
+    if mode == "process":
+        results = multiprocessing.Queue()
+        runners = [multiprocessing.Process(target=approve_all, args=(path, ids, n, results))
+                   for n in range(workers)]
+    else:
+        results = []
+        runners = [threading.Thread(target=approve_all, args=(path, ids, n, results))
+                   for n in range(workers)]
+
+    started = time.perf_counter()
+    for runner in runners:
+        runner.start()
+    collected = [results.get() for _ in runners] if mode == "process" else None
+    for runner in runners:
+        runner.join()
+    elapsed = time.perf_counter() - started
+    collected = collected or results
+
+    totals = {}
+    for counts in collected:
+        for code, count in counts.items():
+            totals[code] = totals.get(code, 0) + count
+
+    app = make_app(path)
+    with app.app_context():
+        remaining = db.session.get(Waste, 1).quantity
+        approved = WasteRequest.query.filter_by(status="approved").count()
+    os.remove(path)
+
+    report = {
+        "mode": mode,
+        "workers": workers,
+        "attempts": workers * requests,
+        "responses": {str(code): count for code, count in sorted(totals.items())},
+        "approved": approved,
+        "remaining_stock": remaining,
+        "seconds": round(elapsed, 3),
+        "attempts_per_second": round(workers * requests / elapsed, 1),
+        "ok": (remaining >= 0
+               and remaining == stock - approved * REQUESTED
+               and totals.get(200, 0) == approved),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--mode", choices=["process", "thread"], default="process")
+    args = parser.parse_args()
+
+    reports = [run(workers, args.requests, args.mode) for workers in args.workers]
+    print(json.dumps(reports, indent=2))
+    if not all(report["ok"] for report in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
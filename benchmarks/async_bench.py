@@ -0,0 +1,248 @@
+"""Concurrent reads: threaded WSGI server vs the ASGI mode (asgi.py).
+
+Starts each server in a subprocess on a generated SQLite database (the
+threaded Werkzeug server, as serve.py falls back to, and uvicorn serving
+asgi.create_asgi_app), then keeps --concurrency keep-alive connections
+busy with list, search and stats reads for --duration seconds per level.
+Reports throughput and latency, and the server's resident memory and
+thread count sampled during the run (from /proc, so on Linux only).
+The response cache is off unless --cache is given.
+
+Local SQLite reads never wait on a network, so both servers are bound by
+the GIL; --db-latency-ms adds a wait before each SQL statement to stand
+in for a database server's round trip.
+
+    pip install greenlet aiosqlite uvicorn
+    python benchmarks/async_bench.py --concurrency 16 64 256 --db-latency-ms 5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from datagen import make_database  # noqa: E402
+
+PATHS = [
+    "/api/industries?limit=20&fields=name,industry_code,description",
+    "/api/wastes?limit=20",
+    "/api/wastes/type/Plastic?limit=20",
+    "/api/wastes/search?q=metal&limit=20",
+    "/api/industries/search?q=recycling&limit=20&fields=name,industry_code",
+    "/api/dashboard/waste-requests?status=pending&limit=20",
+    "/api/dashboard/stats",
+    "/api/wastes/total-quantity",
+]
+
+MODES = ("wsgi", "asgi")
+
+
+def add_latency(engine, seconds):
+    """Wait `seconds` before each SQL statement, like a round trip to a
+    database server: the request thread sleeps under WSGI, while under
+    ASGI the wait is awaited and the event loop moves on"""
+    from sqlalchemy import event
+    from sqlalchemy.util import await_only
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def delay(connection, cursor, statement, parameters, context, executemany):
+        if engine.dialect.is_async:
+            await_only(asyncio.sleep(seconds))
+        else:
+            time.sleep(seconds)
+
+
+def serve(mode, port, path, cache, latency):
+    """Run one server in this process until killed"""
+    overrides = {"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}",
+                 "CACHE_BACKEND": "memory" if cache else ""}
+    if mode == "wsgi":
+        from werkzeug.serving import make_server
+        from app import create_app
+        from models import db
+        app = create_app(**overrides)
+        if latency:
+            with app.app_context():
+                add_latency(db.engine, latency)
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        make_server("127.0.0.1", port, app, threaded=True).serve_forever()
+    else:
+        import uvicorn
+        from asgi import create_asgi_app
+        api = create_asgi_app(**overrides)
+        if latency:
+            add_latency(api.engine.sync_engine, latency)
+        uvicorn.run(api, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def _proc_status(pid):
+    """{'rss_mb', 'peak_rss_mb', 'threads'} of a process, or {} off Linux"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            fields = dict(line.split(":", 1) for line in status)
+    except OSError:
+        return {}
+    return {"rss_mb": round(int(fields["VmRSS"].split()[0]) / 1024, 1),
+            "peak_rss_mb": round(int(fields["VmHWM"].split()[0]) / 1024, 1),
+            "threads": int(fields["Threads"])}
+
+
+async def _request(reader, writer, path):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n".encode())
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    headers = {}
+    for line in head.split(b"\r\n")[1:]:
+        if line:
+            name, _, value = line.partition(b":")
+            headers[name.strip().lower()] = value.strip()
+    if b"content-length" in headers:
+        await reader.readexactly(int(headers[b"content-length"]))
+    elif headers.get(b"transfer-encoding") == b"chunked":
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    return status, headers.get(b"connection", b"").lower() != b"close"
+
+
+async def _client(port, offset, deadline, latencies, errors):
+    # Werkzeug's server closes the connection after each response; the
+    # reconnect is part of the measured latency, as it is for real clients
+    index = offset
+    connection = None
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection("127.0.0.1", port)
+            status, keep_alive = await _request(*connection, PATHS[index % len(PATHS)])
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            errors.append(None)
+            keep_alive = False
+        else:
+            if status != 200:
+                errors.append(status)
+            latencies.append((time.perf_counter() - started) * 1000)
+            index += 1
+        if not keep_alive and connection is not None:
+            connection[1].close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+async def _sample(pid, samples, stop):
+    while not stop.is_set():
+        samples.append(_proc_status(pid))
+        try:
+            await asyncio.wait_for(stop.wait(), 0.1)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def load(port, pid, concurrency, duration):
+    latencies, errors, samples = [], [], []
+    stop = asyncio.Event()
+    sampler = asyncio.ensure_future(_sample(pid, samples, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*[_client(port, n, started + duration, latencies, errors)
+                           for n in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+    latencies.sort()
+    samples = [sample for sample in samples if sample]
+    report = {"concurrency": concurrency, "requests": len(latencies), "errors": len(errors),
+              "req_per_s": round(len(latencies) / elapsed, 1),
+              "p50_ms": round(latencies[len(latencies) // 2], 2) if latencies else None,
+              "p95_ms": round(latencies[int(len(latencies) * 0.95)], 2) if latencies else None}
+    if samples:
+        report["max_rss_mb"] = max(sample["rss_mb"] for sample in samples)
+        report["peak_rss_mb"] = samples[-1]["peak_rss_mb"]
+        report["max_threads"] = max(sample["threads"] for sample in samples)
+    return report
+
+
+def _wait_until_up(port, process, timeout=30):
+    import http.client
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/api/health")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def run(mode, path, port, args):
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", mode,
+                                "--port", str(port), "--database", path,
+                                "--db-latency-ms", str(args.db_latency_ms)]
+                               + (["--cache"] if args.cache else []))
+    try:
+        _wait_until_up(port, process)
+        baseline = _proc_status(process.pid)
+        asyncio.run(load(port, process.pid, 8, 1))
+        for concurrency in args.concurrency:
+            report = asyncio.run(load(port, process.pid, concurrency, args.duration))
+            print(json.dumps({"mode": mode, "idle_rss_mb": baseline.get("rss_mb"), **report}),
+                  flush=True)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--industries", type=int, default=1000)
+    parser.add_argument("--wastes", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="seconds of load per concurrency level")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--port", type=int, default=5590)
+    parser.add_argument("--cache", action="store_true", help="keep the response cache on")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0,
+                        help="simulated database round trip per SQL statement")
+    parser.add_argument("--database", help="reuse an existing generated SQLite database")
+    parser.add_argument("--serve", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.database, args.cache, args.db_latency_ms / 1000)
+        return
+
+    path = args.database
+    if path is None:
+        handle, path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        os.remove(path)
+        make_database(path, args.industries, args.wastes, args.requests)
+    try:
+        for mode in args.modes:
+            run(mode, os.path.abspath(path), args.port, args)
+    finally:
+        if args.database is None:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Dashboard load: separate GETs vs one POST /api/batch.
+
+Loads the five dashboard panels (stats, weekly trend, top industries,
+pending requests, recent wastes) either as five requests or as one batch,
+sequentially (BATCH_WORKERS = 0) and on a thread pool. --rtt-ms adds a
+simulated network round trip per HTTP call, since the test client has none.
+
+    python benchmarks/batch_bench.py --wastes 20000 --requests 100000 --rtt-ms 20
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import create_app  # noqa: E402
+from datagen import make_database  # noqa: E402
+
+PANELS = [
+    "/api/dashboard/stats",
+    "/api/dashboard/analytics?group_by=wasteType&bucket=week",
+    "/api/dashboard/analytics?group_by=industry&bucket=total&order_by=requested_quantity&limit=10",
+    "/api/dashboard/waste-requests?status=pending&limit=20",
+    "/api/wastes?limit=20",
+]
+
+
+def _percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def measure(load, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        load()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {"p50_ms": round(_percentile(samples, 0.5), 2),
+            "p95_ms": round(_percentile(samples, 0.95), 2),
+            "mean_ms": round(sum(samples) / len(samples), 2)}
+
+
+def run(path, workers, iterations, rtt):
+    app = create_app(SQLALCHEMY_DATABASE_URI=f"sqlite:///{path}", CACHE_BACKEND="",
+                     BATCH_WORKERS=workers,
+                     SQLALCHEMY_ENGINE_OPTIONS={"connect_args": {"check_same_thread": False}})
+    client = app.test_client()
+    body = {"requests": [{"id": index, "path": panel} for index, panel in enumerate(PANELS)]}
+
+    def separate():
+        for panel in PANELS:
+            time.sleep(rtt)
+            assert client.get(panel).status_code == 200
+
+    def batched():
+        time.sleep(rtt)
+        response = client.post("/api/batch", json=body)
+        assert all(entry["status"] == 200 for entry in response.get_json()["responses"])
+
+    separate()
+    batched()
+    report = {"workers": workers, "rtt_ms": rtt * 1000,
+              "separate": measure(separate, iterations),
+              "batch": measure(batched, iterations)}
+    executor = app.extensions.get("batch")
+    if executor is not None:
+        executor.shutdown()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--industries", type=int, default=1000)
+    parser.add_argument("--wastes", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 4],
+                        help="BATCH_WORKERS values to compare")
+    parser.add_argument("--database", help="reuse an existing generated SQLite database")
+    args = parser.parse_args()
+
+    path = args.database
+    if path is None:
+        handle, path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        os.remove(path)
+        make_database(path, args.industries, args.wastes, args.requests)
+    try:
+        for workers in args.workers:
+            print(json.dumps(run(os.path.abspath(path), workers, args.iterations,
+                                 args.rtt_ms / 1000)))
+    finally:
+        if args.database is None:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
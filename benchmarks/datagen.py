@@ -0,0 +1,189 @@
+"""Synthetic dataset generator.
+
+Fills a database with N industries, M wastes and K waste requests using Core
+bulk inserts, then rebuilds the derived tables. Activity is skewed the way
+real traffic is: a few industries own most of the wastes, a few waste types
+dominate, and most requests go to a small set of popular wastes (Zipf-like
+weights, exponent --skew; 0 means uniform). The same seed always produces
+the same data.
+
+    python benchmarks/datagen.py --industries 1000 --wastes 100000 --requests 500000 \\
+        --database /tmp/ecocycle-bench.db
+
+Without --database it writes to the app's configured DATABASE_URL.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import flask_migrate  # noqa: E402
+from sqlalchemy import func, insert, select  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db, Industry, Waste, WasteRequest, utcnow  # noqa: E402
+import analytics  # noqa: E402
+import stats  # noqa: E402
+import units  # noqa: E402
+import versions  # noqa: E402
+
+BATCH_SIZE = 10000
+# Requests are spread evenly over this many days before now
+HISTORY_DAYS = 180
+
+SECTORS = ["Steel", "Plastics", "Recycling", "Organics", "Glass", "Metals", "Paper",
+           "Textiles", "Agri", "Chemicals", "Timber", "Electronics"]
+SUFFIXES = ["Ltd", "Works", "Group", "Co", "Industries", "Solutions", "Recovery", "KE"]
+WASTE_TYPES = ["Metal", "Plastic", "Organic", "Glass", "Paper", "Textile", "E-waste",
+               "Chemical", "Wood", "Rubber"]
+MATERIALS = {
+    "Metal": ["Scrap Metal", "Aluminium Offcuts", "Copper Wire", "Steel Shavings"],
+    "Plastic": ["Plastic Pellets", "PET Bottles", "HDPE Film", "PVC Offcuts"],
+    "Organic": ["Food Waste", "Crop Residue", "Sawdust", "Coffee Grounds"],
+    "Glass": ["Glass Shards", "Cullet", "Bottle Glass"],
+    "Paper": ["Cardboard", "Office Paper", "Newsprint"],
+    "Textile": ["Fabric Offcuts", "Cotton Waste", "Yarn Ends"],
+    "E-waste": ["Circuit Boards", "Cables", "Batteries"],
+    "Chemical": ["Spent Solvent", "Used Oil"],
+    "Wood": ["Pallets", "Timber Offcuts"],
+    "Rubber": ["Tyre Crumb", "Rubber Offcuts"],
+}
+# Unit, share of wastes
+UNITS = [("kg", 80), ("tonnes", 12), ("litres", 8)]
+# Status, share of requests
+STATUSES = [("pending", 70), ("approved", 20), ("rejected", 10)]
+
+
+def zipf_weights(count, skew):
+    """Cumulative weights where item i gets 1 / (i + 1) ** skew"""
+    return list(itertools.accumulate(1.0 / (rank + 1) ** skew for rank in range(count)))
+
+
+def _pick(rng, values, cum_weights, k):
+    return rng.choices(values, cum_weights=cum_weights, k=k)
+
+
+def _max_id(model):
+    return db.session.execute(select(func.max(model.id))).scalar() or 0
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(model), rows[start:start + BATCH_SIZE])
+    db.session.commit()
+
+
+def generate(industries, wastes, requests, seed=0, skew=1.0, days=HISTORY_DAYS):
+    """Append the dataset to the current app's database; returns a summary.
+
+    Core inserts bypass the change hub, so the stats store, request rollups
+    and table versions are rebuilt at the end rather than maintained row by row.
+    """
+    rng = random.Random(seed)
+    started = time.perf_counter()
+
+    first_industry = _max_id(Industry) + 1
+    first_code = (db.session.execute(select(func.max(Industry.industry_code))).scalar() or 0) + 1
+    _insert(Industry, [{
+        "name": f"{rng.choice(SECTORS)} {rng.choice(SUFFIXES)} {n}",
+        "industry_code": first_code + n,
+        "description": f"{rng.choice(SECTORS)} producer, site {n}",
+    } for n in range(industries)])
+    industry_ids = list(range(first_industry, first_industry + industries))
+    # Shuffle so the heavy hitters are not simply the oldest ids
+    rng.shuffle(industry_ids)
+    industry_weights = zipf_weights(industries, skew)
+
+    first_waste = _max_id(Waste) + 1
+    owners = _pick(rng, industry_ids, industry_weights, wastes)
+    types = _pick(rng, WASTE_TYPES, zipf_weights(len(WASTE_TYPES), skew), wastes)
+    unit_names = _pick(rng, [unit for unit, _ in UNITS],
+                       list(itertools.accumulate(share for _, share in UNITS)), wastes)
+    rows = [{
+        "name": rng.choice(MATERIALS[waste_type]),
+        "wasteType": waste_type,
+        # A tail of exhausted stock keeps /available meaningful
+        "quantity": 0.0 if rng.random() < 0.1 else round(rng.lognormvariate(5, 1.2), 1),
+        "unit": unit,
+        "notes": f"Batch {n}" if rng.random() < 0.3 else None,
+        "industry_id": owner,
+    } for n, (owner, waste_type, unit) in enumerate(zip(owners, types, unit_names))]
+    for row in rows:
+        row.update(units.canonical(row["unit"], row["quantity"]))
+    _insert(Waste, rows)
+    waste_ids = list(range(first_waste, first_waste + wastes))
+    rng.shuffle(waste_ids)
+
+    if wastes:
+        targets = _pick(rng, waste_ids, zipf_weights(wastes, skew), requests)
+        requesters = _pick(rng, industry_ids, industry_weights, requests)
+        statuses = _pick(rng, [status for status, _ in STATUSES],
+                         list(itertools.accumulate(share for _, share in STATUSES)), requests)
+        now = utcnow()
+        _insert(WasteRequest, [{
+            "quantity_requested": round(rng.uniform(1, 200), 1),
+            "status": status,
+            "details": "Request for recycling",
+            "industry_id": requester,
+            "waste_id": waste_id,
+            "created_at": now - datetime.timedelta(seconds=rng.uniform(0, days * 86400)),
+        } for waste_id, requester, status in zip(targets, requesters, statuses)])
+
+    stats.rebuild()
+    analytics.rebuild()
+    versions.bump(db.session.connection(),
+                  [versions.INDUSTRIES, versions.WASTES, versions.WASTE_REQUESTS])
+    db.session.commit()
+
+    return {
+        "industries": industries,
+        "wastes": wastes,
+        "requests": requests if wastes else 0,
+        "seed": seed,
+        "skew": skew,
+        "days": days,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def make_database(path, industries, wastes, requests, seed=0, skew=1.0, days=HISTORY_DAYS,
+                  **config):
+    """Create a migrated SQLite database at `path` filled by generate()"""
+    app = create_app(SQLALCHEMY_DATABASE_URI=f"sqlite:///{path}", **config)
+    with app.app_context():
+        flask_migrate.upgrade(directory=os.path.join(ROOT, "migrations"))
+        summary = generate(industries, wastes, requests, seed, skew, days)
+        db.session.remove()
+    return app, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--industries", type=int, default=1000)
+    parser.add_argument("--wastes", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--days", type=int, default=HISTORY_DAYS,
+                        help="spread request creation times over this many days")
+    parser.add_argument("--database", help="SQLite file to create and migrate")
+    args = parser.parse_args()
+
+    counts = (args.industries, args.wastes, args.requests, args.seed, args.skew, args.days)
+    if args.database:
+        _, summary = make_database(os.path.abspath(args.database), *counts)
+    else:
+        with create_app().app_context():
+            summary = generate(*counts)
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
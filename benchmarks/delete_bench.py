@@ -0,0 +1,166 @@
+"""Large delete benchmark: cascade vs soft delete with background purge.
+
+Builds an industry owning most of the wastes and requests, then deletes it
+while writer threads keep submitting waste requests for another industry.
+Reports how long the DELETE call took, how long until every child row was
+gone, and the writers' latency percentiles and worst case over that window
+(the stall a large delete causes).
+
+    python benchmarks/delete_bench.py --wastes 5000 --requests 50000 --writers 1
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, insert, select  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db, Industry, Waste, WasteRequest  # noqa: E402
+import stats  # noqa: E402
+import analytics  # noqa: E402
+
+BIG, SMALL = 1, 2
+
+
+def prepare(app, wastes, requests):
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(Industry), [
+            {"name": "Big", "industry_code": 1}, {"name": "Small", "industry_code": 2}])
+        # Every tenth waste belongs to the industry that is kept
+        db.session.execute(insert(Waste), [{
+            "name": f"Waste {n}", "wasteType": "Metal", "quantity": 100.0, "unit": "kg",
+            "canonical_unit": "kg", "canonical_quantity": 100.0,
+            "industry_id": SMALL if n % 10 == 0 else BIG,
+        } for n in range(wastes)])
+        db.session.execute(insert(WasteRequest), [{
+            "quantity_requested": 1.0, "status": "pending",
+            "industry_id": SMALL if n % 10 == 0 else BIG, "waste_id": n % wastes + 1,
+        } for n in range(requests)])
+        db.session.commit()
+        stats.rebuild()
+        analytics.rebuild()
+        return db.session.execute(select(Waste.id).where(Waste.industry_id == SMALL)).scalar()
+
+
+def writer(app, stop, waste_id, latencies, failures):
+    client = app.test_client()
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            response = client.post("/api/dashboard/waste-requests", json={
+                "industry_id": SMALL, "waste_id": waste_id, "quantity_requested": 1.0})
+        except OperationalError:
+            failures.append(1)
+            continue
+        if response.status_code == 201:
+            latencies.append(time.perf_counter() - started)
+        else:
+            failures.append(response.status_code)
+        time.sleep(0.005)
+
+
+def _children_left(app):
+    with app.app_context():
+        try:
+            return db.session.execute(
+                select(func.count()).select_from(Waste).where(Waste.industry_id == BIG)
+            ).scalar() + db.session.execute(
+                select(func.count()).select_from(Industry).where(Industry.id == BIG)
+            ).scalar()
+        finally:
+            db.session.remove()
+
+
+def _percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] if samples else None
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def run(mode, wastes, requests, writers, batch_size, pause):
+    handle, path = tempfile.mkstemp(suffix=".db")
+    os.close(handle)
+    app = create_app(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{path}",
+        SQLALCHEMY_ENGINE_OPTIONS={"connect_args": {"check_same_thread": False}},
+        CACHE_BACKEND="",
+        EVENTS_BROKER="",
+        DELETE_MODE=mode,
+        PURGE_BATCH_SIZE=batch_size,
+        PURGE_PAUSE_MS=pause,
+    )
+    app.logger.disabled = True
+    waste_id = prepare(app, wastes, requests)
+
+    stop = threading.Event()
+    latencies, failures = [], []
+    threads = [threading.Thread(target=writer, args=(app, stop, waste_id, latencies, failures))
+               for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)
+    latencies.clear()
+
+    started = time.perf_counter()
+    response = app.test_client().delete(f"/api/industries/{BIG}")
+    answered = time.perf_counter() - started
+    while _children_left(app):
+        time.sleep(0.05)
+    finished = time.perf_counter() - started
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+    purger = app.extensions.get("purge")
+    if purger is not None:
+        purger.close()
+    with app.app_context():
+        db.engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "status": response.status_code,
+        "delete_call_ms": _ms(answered),
+        "all_rows_gone_ms": _ms(finished),
+        "writes": len(latencies),
+        "write_p50_ms": _ms(_percentile(latencies, 0.5)),
+        "write_p99_ms": _ms(_percentile(latencies, 0.99)),
+        "write_max_ms": _ms(latencies[-1] if latencies else None),
+        "write_failures": len(failures),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wastes", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--writers", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="PURGE_BATCH_SIZE for the soft mode")
+    parser.add_argument("--pause", type=int, default=20,
+                        help="PURGE_PAUSE_MS for the soft mode")
+    parser.add_argument("--modes", nargs="+", choices=["cascade", "soft"],
+                        default=["cascade", "soft"])
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        print(json.dumps(run(mode, args.wastes, args.requests, args.writers, args.batch_size,
+                             args.pause)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Waste request submission benchmark: one commit per request vs group commit.
+
+Submitter threads POST /api/dashboard/waste-requests as fast as they can for
+a fixed duration, once with the default write path and once with
+INGEST_MODE (see ingest.py). Reports accepted submissions/s, latency
+percentiles, refusals (503) and failures, and checks that every acknowledged
+request id exists in the database.
+
+    python benchmarks/ingest_bench.py --threads 16 --seconds 10 --synchronous FULL
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, insert, select  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from app import create_app  # noqa: E402
+from config import Config  # noqa: E402
+from models import db, Industry, Waste, WasteRequest  # noqa: E402
+import stats  # noqa: E402
+import analytics  # noqa: E402
+
+MODES = {
+    "direct": {"INGEST_MODE": False},
+    "group": {"INGEST_MODE": True},
+}
+
+
+def prepare(app, industries, wastes):
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(Industry), [
+            {"name": f"Bench {n}", "industry_code": n + 1} for n in range(industries)])
+        db.session.execute(insert(Waste), [{
+            "name": f"Waste {n}", "wasteType": "Metal", "quantity": 100.0,
+            "unit": "kg", "canonical_unit": "kg", "canonical_quantity": 100.0, "industry_id": n % industries + 1,
+        } for n in range(wastes)])
+        db.session.commit()
+        stats.rebuild()
+        analytics.rebuild()
+
+
+def submitter(app, deadline, result, seed, industries, wastes):
+    client = app.test_client()
+    n = seed
+    while time.monotonic() < deadline:
+        n += 1
+        started = time.perf_counter()
+        try:
+            response = client.post("/api/dashboard/waste-requests", json={
+                "industry_id": n % industries + 1, "waste_id": n % wastes + 1,
+                "quantity_requested": 1.0, "details": "bench",
+            })
+        except OperationalError:
+            result["failed"] += 1
+            continue
+        if response.status_code == 201:
+            result["latencies"].append(time.perf_counter() - started)
+            result["ids"].append(response.get_json()["request_id"])
+        elif response.status_code == 503:
+            result["refused"] += 1
+        else:
+            result["failed"] += 1
+
+
+def _percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] if samples else None
+
+
+def run(mode, threads, seconds, synchronous, industries, wastes):
+    handle, path = tempfile.mkstemp(suffix=".db")
+    os.close(handle)
+    app = create_app(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{path}",
+        SQLITE_PRAGMAS=dict(Config.SQLITE_PRAGMAS, synchronous=synchronous),
+        SQLALCHEMY_ENGINE_OPTIONS={"connect_args": {"check_same_thread": False}},
+        CACHE_BACKEND="",
+        EVENTS_BROKER="",
+        **MODES[mode],
+    )
+    app.logger.disabled = True
+    prepare(app, industries, wastes)
+
+    results = [{"latencies": [], "ids": [], "refused": 0, "failed": 0} for _ in range(threads)]
+    workers = []
+    deadline = time.monotonic() + seconds
+    for n, result in enumerate(results):
+        workers.append(threading.Thread(
+            target=submitter, args=(app, deadline, result, n * 1000003, industries, wastes)))
+    started = time.monotonic()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.monotonic() - started
+
+    ingester = app.extensions.get("ingest")
+    if ingester is not None:
+        ingester.close()
+
+    acknowledged = [request_id for result in results for request_id in result["ids"]]
+    with app.app_context():
+        stored = db.session.execute(
+            select(func.count()).select_from(WasteRequest)
+            .where(WasteRequest.id.in_(acknowledged))
+        ).scalar() if acknowledged else 0
+        db.engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    latencies = sorted(sample for result in results for sample in result["latencies"])
+    return {
+        "mode": mode,
+        "threads": threads,
+        "synchronous": synchronous,
+        "seconds": round(elapsed, 2),
+        "accepted_per_second": round(len(acknowledged) / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        "accepted": len(acknowledged),
+        "refused": sum(result["refused"] for result in results),
+        "failed": sum(result["failed"] for result in results),
+        "acknowledged_but_missing": len(acknowledged) - stored,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--synchronous", default="FULL",
+                        help="SQLite synchronous pragma; FULL syncs every commit")
+    parser.add_argument("--industries", type=int, default=100)
+    parser.add_argument("--wastes", type=int, default=2000)
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES),
+                        default=["direct", "group"])
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        print(json.dumps(run(mode, args.threads, args.seconds, args.synchronous,
+                             args.industries, args.wastes)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Matching engine benchmark.
+
+Generates --wastes synthetic wastes (benchmarks/datagen.py), builds the
+in-memory inventory index and times plans for random demands with each
+strategy. Reports index build time and plan latency percentiles.
+
+    python benchmarks/matching_bench.py --wastes 100000 --plans 5000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import matching  # noqa: E402
+from models import db  # noqa: E402
+from datagen import make_database, WASTE_TYPES, UNITS  # noqa: E402
+
+
+def _percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--industries", type=int, default=1000)
+    parser.add_argument("--wastes", type=int, default=100000)
+    parser.add_argument("--plans", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    handle, path = tempfile.mkstemp(suffix=".db")
+    os.close(handle)
+    os.remove(path)
+    try:
+        app, dataset = make_database(path, args.industries, args.wastes, 0, args.seed)
+        rng = random.Random(args.seed)
+        report = {"dataset": dataset}
+        with app.app_context():
+            index = matching.InventoryIndex()
+            started = time.perf_counter()
+            index.load()
+            report["index_build_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+            demands = [(rng.choice(WASTE_TYPES), rng.choice(UNITS)[0],
+                        round(rng.lognormvariate(6, 1.5), 1), rng.randint(1, args.industries))
+                       for _ in range(args.plans)]
+            for strategy in matching.STRATEGIES:
+                samples, sources, short = [], 0, 0
+                for waste_type, unit, quantity, industry_id in demands:
+                    t0 = time.perf_counter()
+                    plan = index.plan(waste_type, unit, quantity, strategy,
+                                      exclude_industry=industry_id)
+                    samples.append((time.perf_counter() - t0) * 1e6)
+                    sources += len(plan.sources)
+                    short += plan.allocated < quantity - matching.EPSILON
+                samples.sort()
+                report[strategy] = {
+                    "p50_us": round(_percentile(samples, 0.50), 1),
+                    "p99_us": round(_percentile(samples, 0.99), 1),
+                    "max_us": round(samples[-1], 1),
+                    "mean_sources": round(sources / len(demands), 2),
+                    "short_plans": short,
+                }
+            db.engine.dispose()
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""Per-route benchmark for every industries, wastes and dashboard endpoint.
+
+Generates a dataset with benchmarks/datagen.py (or reuses --database), then
+drives each route through the Flask test client and reports, per route:
+
+  p50/p95/p99/mean latency, throughput, SQL statements per request and the
+  peak Python memory allocated while handling one request.
+
+Output is JSON including the git commit, so runs can be diffed:
+
+    python benchmarks/route_bench.py --wastes 50000 --requests 200000 -o before.json
+    git checkout my-branch
+    python benchmarks/route_bench.py --wastes 50000 --requests 200000 -o after.json
+
+The response cache is off unless --cache is given, so results reflect the
+query and serialization work. Write routes run against the same database.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import event, select  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db, Industry, Waste, WasteRequest  # noqa: E402
+from datagen import make_database, WASTE_TYPES  # noqa: E402
+
+BLUEPRINTS = ("industries", "wastes", "dashboard")
+# Routes left out on purpose, with the reason reported next to "uncovered"
+EXCLUDED = {
+    "GET /api/dashboard/events": "a Server-Sent Events stream that never completes, "
+                                 "so it has no per-request latency to report",
+}
+# Requests per route with tracemalloc on; they are excluded from the timings
+MEMORY_SAMPLES = 5
+
+
+class Dataset:
+    """Ids and values the routes are called with, drawn from the database"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        session = db.session
+        self.industry_ids = session.execute(select(Industry.id)).scalars().all()
+        self.waste_ids = session.execute(select(Waste.id)).scalars().all()
+        self.pending_ids = session.execute(
+            select(WasteRequest.id).where(WasteRequest.status == "pending")
+        ).scalars().all()
+        rng.shuffle(self.pending_ids)
+        self.codes = itertools.count(
+            (session.execute(select(db.func.max(Industry.industry_code))).scalar() or 0) + 1)
+        self.created_industries = []
+        self.created_wastes = []
+
+    def industry(self):
+        return self.rng.choice(self.industry_ids)
+
+    def waste(self):
+        return self.rng.choice(self.waste_ids)
+
+    def waste_type(self):
+        return self.rng.choice(WASTE_TYPES)
+
+    def demand(self):
+        return {"wasteType": self.waste_type(), "unit": "kg",
+                "quantity": self.rng.choice([50, 500, 5000]),
+                "strategy": self.rng.choice(["fewest", "nearest"])}
+
+    def pending(self, count=1):
+        taken, self.pending_ids = self.pending_ids[:count], self.pending_ids[count:]
+        return taken
+
+    def new_industry(self):
+        code = next(self.codes)
+        return {"name": f"Bench {code}", "industry_code": code, "description": "bench"}
+
+    def new_waste(self):
+        return {"name": "Bench waste", "wasteType": self.waste_type(), "quantity": 10.0,
+                "unit": "kg", "industry_id": self.industry()}
+
+
+def _created(bucket):
+    def collect(response):
+        data = response.get_json(silent=True) or {}
+        if "id" in data:
+            bucket.append(data["id"])
+    return collect
+
+
+def _pop(bucket, fallback):
+    return bucket.pop() if bucket else fallback()
+
+
+# (name, method, rule, build(data) -> (url, json body), iterations factor).
+# Creates run before the matching deletes, which remove what they made.
+def routes(data):
+    return [
+        ("industries.list", "GET", "/api/industries", lambda: ("/api/industries", None), 1),
+        ("industries.list_sparse", "GET", "/api/industries",
+         lambda: ("/api/industries?fields=id,name", None), 1),
+        ("industries.detail", "GET", "/api/industries/<int:id>",
+         lambda: (f"/api/industries/{data.industry()}", None), 1),
+        ("industries.search", "GET", "/api/industries/search",
+         lambda: (f"/api/industries/search?q={data.rng.choice(['steel', 'recy', 'glass works'])}",
+                  None), 1),
+        ("industries.count", "GET", "/api/industries/count",
+         lambda: ("/api/industries/count", None), 1),
+        ("industries.create", "POST", "/api/industries",
+         lambda: ("/api/industries", data.new_industry()), 1),
+        ("industries.bulk", "POST", "/api/industries/bulk",
+         lambda: ("/api/industries/bulk", [data.new_industry() for _ in range(100)]), 0.1),
+        ("industries.update", "PUT", "/api/industries/<int:id>",
+         lambda: (f"/api/industries/{data.industry()}", {"description": "updated"}), 1),
+        ("wastes.list", "GET", "/api/wastes", lambda: ("/api/wastes", None), 1),
+        ("wastes.list_sparse", "GET", "/api/wastes",
+         lambda: ("/api/wastes?fields=name,quantity,unit&expand=industry", None), 1),
+        ("wastes.list_by_industry", "GET", "/api/wastes",
+         lambda: (f"/api/wastes?industry_id={data.industry()}", None), 1),
+        ("wastes.export", "GET", "/api/wastes/export",
+         lambda: (f"/api/wastes/export?format=ndjson&wasteType={data.waste_type()}", None), 0.05),
+        ("wastes.detail", "GET", "/api/wastes/<int:id>",
+         lambda: (f"/api/wastes/{data.waste()}", None), 1),
+        ("wastes.by_type", "GET", "/api/wastes/type/<waste_type>",
+         lambda: (f"/api/wastes/type/{data.waste_type()}", None), 1),
+        ("wastes.search", "GET", "/api/wastes/search",
+         lambda: (f"/api/wastes/search?q={data.rng.choice(['metal', 'plastic pel', 'cull'])}",
+                  None), 1),
+        ("wastes.available", "GET", "/api/wastes/available",
+         lambda: ("/api/wastes/available", None), 1),
+        ("wastes.total_quantity", "GET", "/api/wastes/total-quantity",
+         lambda: ("/api/wastes/total-quantity", None), 1),
+        ("wastes.count", "GET", "/api/wastes/count", lambda: ("/api/wastes/count", None), 1),
+        ("wastes.match", "GET", "/api/wastes/match",
+         lambda: ("/api/wastes/match?" + "&".join(f"{key}={value}"
+                                                  for key, value in data.demand().items()),
+                  None), 1),
+        ("wastes.create", "POST", "/api/wastes", lambda: ("/api/wastes", data.new_waste()), 1),
+        ("wastes.bulk", "POST", "/api/wastes/bulk",
+         lambda: ("/api/wastes/bulk", [data.new_waste() for _ in range(100)]), 0.1),
+        ("wastes.update", "PUT", "/api/wastes/<int:id>",
+         lambda: (f"/api/wastes/{data.waste()}", {"notes": "updated"}), 1),
+        ("wastes.delete", "DELETE", "/api/wastes/<int:id>",
+         lambda: (f"/api/wastes/{_pop(data.created_wastes, data.waste)}", None), 1),
+        ("industries.delete", "DELETE", "/api/industries/<int:id>",
+         lambda: (f"/api/industries/{_pop(data.created_industries, data.industry)}", None), 1),
+        ("dashboard.stats", "GET", "/api/dashboard/stats",
+         lambda: ("/api/dashboard/stats", None), 1),
+        ("dashboard.analytics_trend", "GET", "/api/dashboard/analytics",
+         lambda: ("/api/dashboard/analytics?group_by=wasteType&bucket=week", None), 1),
+        ("dashboard.analytics_top", "GET", "/api/dashboard/analytics",
+         lambda: ("/api/dashboard/analytics?group_by=industry&bucket=total"
+                  "&order_by=requested_quantity&limit=10", None), 1),
+        ("dashboard.requests", "GET", "/api/dashboard/waste-requests",
+         lambda: ("/api/dashboard/waste-requests", None), 1),
+        ("dashboard.requests_pending", "GET", "/api/dashboard/waste-requests",
+         lambda: ("/api/dashboard/waste-requests?status=pending", None), 1),
+        ("dashboard.requests_export", "GET", "/api/dashboard/waste-requests/export",
+         lambda: (f"/api/dashboard/waste-requests/export?format=ndjson"
+                  f"&industry_id={data.industry()}", None), 0.2),
+        ("dashboard.create_request", "POST", "/api/dashboard/waste-requests",
+         lambda: ("/api/dashboard/waste-requests",
+                  {"industry_id": data.industry(), "waste_id": data.waste(),
+                   "quantity_requested": 1.0}), 1),
+        ("dashboard.create_matched", "POST", "/api/dashboard/waste-requests/match",
+         lambda: ("/api/dashboard/waste-requests/match",
+                  dict(data.demand(), industry_id=data.industry())), 1),
+        ("dashboard.set_status", "PATCH", "/api/dashboard/waste-requests/<int:id>/status",
+         lambda: (f"/api/dashboard/waste-requests/{(data.pending() or [0])[0]}/status",
+                  {"status": data.rng.choice(["approved", "rejected"])}), 1),
+        ("dashboard.set_statuses", "PATCH", "/api/dashboard/waste-requests/status",
+         lambda: ("/api/dashboard/waste-requests/status",
+                  {"mode": "best_effort",
+                   "items": [{"id": request_id, "status": "rejected"}
+                             for request_id in data.pending(20)]}), 0.2),
+    ]
+
+
+def _collectors(data):
+    return {
+        "industries.create": _created(data.created_industries),
+        "wastes.create": _created(data.created_wastes),
+    }
+
+
+def _percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def bench_route(client, build, method, iterations, statements, collect=None):
+    def call():
+        url, body = build()
+        response = client.open(url, method=method, json=body)
+        response.get_data()
+        if collect:
+            collect(response)
+        return response.status_code
+
+    peak = 0
+    for _ in range(MEMORY_SAMPLES):
+        tracemalloc.start()
+        call()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    samples, counts, codes = [], [], {}
+    started = time.perf_counter()
+    for _ in range(iterations):
+        before = len(statements)
+        t0 = time.perf_counter()
+        code = call()
+        samples.append((time.perf_counter() - t0) * 1000)
+        counts.append(len(statements) - before)
+        codes[str(code)] = codes.get(str(code), 0) + 1
+    elapsed = time.perf_counter() - started
+
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "p50_ms": round(_percentile(samples, 0.50), 3),
+        "p95_ms": round(_percentile(samples, 0.95), 3),
+        "p99_ms": round(_percentile(samples, 0.99), 3),
+        "mean_ms": round(sum(samples) / len(samples), 3),
+        "requests_per_second": round(iterations / elapsed, 1),
+        "queries_per_request": round(sum(counts) / len(counts), 2),
+        "max_queries": max(counts),
+        "peak_memory_kib": round(peak / 1024, 1),
+        "status_codes": codes,
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _uncovered(app, covered):
+    """Blueprint routes (method, rule) the harness does not exercise"""
+    missing = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint.split(".")[0] not in BLUEPRINTS:
+            continue
+        for method in sorted(rule.methods - {"HEAD", "OPTIONS"}):
+            route = f"{method} {rule.rule}"
+            if (method, rule.rule) not in covered and route not in EXCLUDED:
+                missing.append(route)
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--industries", type=int, default=1000)
+    parser.add_argument("--wastes", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--database", help="reuse an existing generated SQLite database")
+    parser.add_argument("--routes", nargs="*", help="only run routes whose name contains one of these")
+    parser.add_argument("--cache", action="store_true", help="keep the response cache enabled")
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    config = {} if args.cache else {"CACHE_BACKEND": ""}
+    path = None
+    if args.database:
+        app = create_app(SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.abspath(args.database)}",
+                         **config)
+        dataset = {"database": args.database}
+    else:
+        handle, path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        os.remove(path)
+        app, dataset = make_database(path, args.industries, args.wastes, args.requests,
+                                     args.seed, args.skew, **config)
+
+    try:
+        report = {
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "dataset": dataset,
+            "iterations": args.iterations,
+            "cache": args.cache,
+            "routes": {},
+        }
+        client = app.test_client()
+        with app.app_context():
+            statements = []
+            event.listen(db.engine, "before_cursor_execute",
+                         lambda *_: statements.append(1))
+            data = Dataset(random.Random(args.seed))
+            db.session.remove()
+
+            table = routes(data)
+            collectors = _collectors(data)
+            for name, method, rule, build, factor in table:
+                if args.routes and not any(part in name for part in args.routes):
+                    continue
+                iterations = max(1, int(args.iterations * factor))
+                report["routes"][name] = {"method": method, "rule": rule, **bench_route(
+                    client, build, method, iterations, statements, collectors.get(name))}
+            report["uncovered"] = _uncovered(app, {(method, rule) for _, method, rule, _, _ in table})
+            report["excluded"] = EXCLUDED
+            db.engine.dispose()
+    finally:
+        if path:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Search benchmark: legacy ILIKE scan vs. the search backends.
+
+Builds a throw-away SQLite database with the real migrations (so the FTS5
+tables and triggers exist), fills it with N synthetic industries and wastes,
+then times the same queries through:
+
+  legacy_ilike   the old `Industry.name.ilike('%q%')` query, all matches
+  like_backend   search.LikeBackend, one ranked page
+  fts_backend    search.SQLiteFTSBackend (FTS5 + bm25), one ranked page
+
+    python benchmarks/search_bench.py --rows 100000 1000000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import flask_migrate  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db, Industry, Waste  # noqa: E402
+import search  # noqa: E402
+
+SYLLABLES = ["eco", "plas", "tic", "met", "al", "steel", "glass", "bio", "cyc", "le",
+             "re", "gen", "agri", "paper", "pulp", "fab", "core", "green", "loop", "tex"]
+PAGE_SIZE = 50
+
+
+def make_app(path):
+    return create_app(SQLALCHEMY_DATABASE_URI=f"sqlite:///{path}")
+
+
+def vocabulary(rng, size=5000):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))))
+    return sorted(words)
+
+
+def populate(rows, words, rng, batch=10000):
+    for start in range(0, rows, batch):
+        count = min(batch, rows - start)
+        db.session.execute(insert(Industry), [{
+            "name": " ".join(rng.choices(words, k=2)),
+            "industry_code": start + n,
+            "description": " ".join(rng.choices(words, k=8)),
+        } for n in range(count)])
+        db.session.execute(insert(Waste), [{
+            "name": " ".join(rng.choices(words, k=2)),
+            "wasteType": rng.choice(["Metal", "Plastic", "Glass", "Organic", "Paper"]),
+            "quantity": rng.uniform(0, 1000),
+            "unit": "kg",
+            "notes": " ".join(rng.choices(words, k=6)),
+            "industry_id": rng.randint(1, start + count),
+        } for _ in range(count)])
+        db.session.commit()
+
+
+def timed(fn, queries):
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def run(rows, query_count):
+    rng = random.Random(rows)
+    handle, path = tempfile.mkstemp(suffix=".db")
+    os.close(handle)
+    os.remove(path)
+    app = make_app(path)
+    try:
+        with app.app_context():
+            flask_migrate.upgrade(directory=os.path.join(ROOT, "migrations"))
+            words = vocabulary(rng)
+            started = time.perf_counter()
+            populate(rows, words, rng)
+            load_seconds = time.perf_counter() - started
+
+            # Mix of whole words and 4-letter prefixes
+            queries = [w if n % 2 else w[:4] for n, w in enumerate(rng.sample(words, query_count))]
+            index = search.INDEXES["industries"]
+            like = search.LikeBackend()
+            fts = search.SQLiteFTSBackend()
+            assert fts.available(index), "FTS tables missing; migrations did not run"
+
+            report = {
+                "rows": rows,
+                "load_seconds": round(load_seconds, 1),
+                "legacy_ilike": timed(
+                    lambda q: Industry.query.filter(Industry.name.ilike(f"%{q}%")).all(), queries),
+                "like_backend": timed(
+                    lambda q: like.search(index, search.tokenize(q), PAGE_SIZE, None), queries),
+                "fts_backend": timed(
+                    lambda q: fts.search(index, search.tokenize(q), PAGE_SIZE, None), queries),
+            }
+            db.session.remove()
+        return report
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps([run(rows, args.queries) for rows in args.rows], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import csv
+import io
+import json
+import tempfile
+from itertools import islice
+
+from flask import request
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Industry, Waste
+import changes
+import units
+
+BATCH_SIZE = 1000
+
+
+class BulkInputError(ValueError):
+    """Raised when the uploaded payload cannot be parsed at all"""
+
+
+class RowError(ValueError):
+    """A single row failed validation"""
+
+
+def _text_stream(stream):
+    if isinstance(stream, tempfile.SpooledTemporaryFile):
+        # Werkzeug spools uploads into one; before Python 3.11 it lacks
+        # readable() and friends, so wrap the file it spools to instead
+        stream = stream._file
+    return io.TextIOWrapper(stream, encoding='utf-8', newline='')
+
+
+def _ndjson_rows(text):
+    for line in text:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield RowError('Invalid JSON')
+
+
+def read_rows():
+    """Iterate over the uploaded rows.
+
+    Accepts a JSON array body, a CSV or NDJSON body (by Content-Type), or a
+    multipart upload in the `file` field (format from the file extension or
+    `?format=`). CSV and NDJSON are read lazily from the stream.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        fmt = request.args.get('format') or upload.filename.rsplit('.', 1)[-1].lower()
+        stream = upload.stream
+    else:
+        fmt = {
+            'application/json': 'json',
+            'text/csv': 'csv',
+            'application/x-ndjson': 'ndjson',
+        }.get(request.mimetype)
+        stream = request.stream
+
+    if fmt == 'json':
+        data = json.load(stream) if upload is not None else request.get_json(silent=True)
+        if not isinstance(data, list):
+            raise BulkInputError('Expected a JSON array of objects')
+        return iter(data)
+    if fmt == 'csv':
+        return csv.DictReader(_text_stream(stream))
+    if fmt == 'ndjson':
+        return _ndjson_rows(_text_stream(stream))
+    raise BulkInputError('Send a JSON array, CSV or NDJSON')
+
+
+def _text(data, key, required=False, max_length=None):
+    value = data.get(key)
+    if value in (None, ''):
+        if required:
+            raise RowError(f'{key} is required')
+        return None
+    value = str(value)
+    if max_length and len(value) > max_length:
+        raise RowError(f'{key} must be at most {max_length} characters')
+    return value
+
+
+def _number(data, key, cast, default=None):
+    value = data.get(key)
+    if value in (None, ''):
+        return default
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{key} must be a number')
+
+
+def _industry_row(data):
+    code = _number(data, 'industry_code', int)
+    if code is None:
+        raise RowError('industry_code is required')
+    return {
+        'name': _text(data, 'name', required=True, max_length=100),
+        'industry_code': code,
+        'description': _text(data, 'description') or '',
+    }
+
+
+def _waste_row(data):
+    row = {
+        'name': _text(data, 'name', required=True, max_length=100),
+        'wasteType': _text(data, 'wasteType', required=True, max_length=50),
+        'quantity': _number(data, 'quantity', float, default=0.0),
+        'unit': _text(data, 'unit', required=True, max_length=20),
+        'notes': _text(data, 'notes'),
+        'industry_id': _number(data, 'industry_id', int),
+        'industry_code': _number(data, 'industry_code', int),
+    }
+    if row['industry_id'] is None and row['industry_code'] is None:
+        raise RowError('industry_id or industry_code is required')
+    row.update(units.canonical(row['unit'], row['quantity']))
+    return row
+
+
+class Result:
+    def __init__(self):
+        self.inserted = 0
+        self.errors = []
+
+    def fail(self, number, message):
+        self.errors.append({'row': number, 'error': message})
+
+    def to_dict(self):
+        return {
+            'inserted': self.inserted,
+            'failed': len(self.errors),
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+        }
+
+
+def _batches(rows, validate, result):
+    """Yield lists of (row_number, values) that passed per-row validation"""
+    numbered = enumerate(rows, start=1)
+    while True:
+        chunk = list(islice(numbered, BATCH_SIZE))
+        if not chunk:
+            return
+        valid = []
+        for number, data in chunk:
+            try:
+                if isinstance(data, RowError):
+                    raise data
+                if not isinstance(data, dict):
+                    raise RowError('Expected an object')
+                valid.append((number, validate(data)))
+            except RowError as error:
+                result.fail(number, str(error))
+        yield valid
+
+
+def _insert(model, batch, result):
+    """Insert one validated batch in its own transaction"""
+    if not batch:
+        return
+    values = [row for _, row in batch]
+    session = db.session
+    try:
+        ids = session.execute(
+            insert(model).returning(model.id, sort_by_parameter_order=True), values
+        ).scalars().all()
+        keys = [attr.key for attr in model.__mapper__.column_attrs]
+        changes.record(session, [
+            changes.Change(model.__tablename__, changes.INSERT, None,
+                           {**{key: row.get(key) for key in keys}, 'id': row_id})
+            for row_id, row in zip(ids, values)
+        ])
+        session.commit()
+    except IntegrityError:
+        # Lost a race with a concurrent writer; report the whole batch
+        session.rollback()
+        for number, _ in batch:
+            result.fail(number, 'Conflicts with a concurrent change, retry this row')
+        return
+    result.inserted += len(batch)
+
+
+def import_industries(rows):
+    result = Result()
+    seen_codes = set()
+
+    for batch in _batches(rows, _industry_row, result):
+        codes = {row['industry_code'] for _, row in batch}
+        existing = set(db.session.execute(
+            select(Industry.industry_code).where(Industry.industry_code.in_(codes))
+        ).scalars())
+
+        accepted = []
+        for number, row in batch:
+            code = row['industry_code']
+            if code in existing or code in seen_codes:
+                result.fail(number, f'Industry with code {code} already exists')
+                continue
+            seen_codes.add(code)
+            accepted.append((number, row))
+        _insert(Industry, accepted, result)
+
+    return result
+
+
+def import_wastes(rows):
+    result = Result()
+
+    for batch in _batches(rows, _waste_row, result):
+        ids = {row['industry_id'] for _, row in batch if row['industry_id'] is not None}
+        codes = {row['industry_code'] for _, row in batch if row['industry_code'] is not None}
+        known_ids = set(db.session.execute(
+            select(Industry.id).where(Industry.id.in_(ids), Industry.deleted_at.is_(None))
+        ).scalars()) if ids else set()
+        id_by_code = dict(db.session.execute(
+            select(Industry.industry_code, Industry.id)
+            .where(Industry.industry_code.in_(codes), Industry.deleted_at.is_(None))
+        ).all()) if codes else {}
+
+        accepted = []
+        for number, row in batch:
+            code = row.pop('industry_code')
+            if row['industry_id'] is None:
+                row['industry_id'] = id_by_code.get(code)
+                if row['industry_id'] is None:
+                    result.fail(number, f'Industry with code {code} not found')
+                    continue
+            elif row['industry_id'] not in known_ids:
+                result.fail(number, f'Industry with id {row["industry_id"]} not found')
+                continue
+            accepted.append((number, row))
+        _insert(Waste, accepted, result)
+
+    return result
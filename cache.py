@@ -0,0 +1,411 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, has_app_context, request, make_response
+
+from sqlalchemy import func, select
+
+from models import db, Industry, Waste, WasteRequest, ChangeLog
+import changes
+
+try:
+    import redis
+except ImportError:  # only needed for CACHE_BACKEND = 'redis'
+    redis = None
+
+# Read-through cache for hot GET responses. Each entry is tagged with the
+# rows it was built from ('wastes:7') and the collections whose membership
+# decides what it lists ('industries:3/wastes', 'wastes?wasteType=Metal').
+# After every commit the changed rows are turned into the same tags and only
+# the entries carrying them are dropped.
+#
+# Commits made by other processes reach a per-process backend through
+# change_log (see sync.py): before each lookup the entries written since the
+# last one are read, and the changed rows, as they are now, are turned into
+# tags the same way. A deleted row no longer has a parent, but every entry
+# listing it also carries its row tag. More than FOLLOW_MAX_CHANGES at once
+# clear the whole cache instead. The Redis backend is shared, so every
+# process' commits already reach it.
+
+INDUSTRIES = Industry.__tablename__
+WASTES = Waste.__tablename__
+WASTE_REQUESTS = WasteRequest.__tablename__
+
+FOLLOW_MAX_CHANGES = 1000
+
+
+def row_tag(table, row_id):
+    return f'{table}:{row_id}'
+
+
+def children_tag(table, row_id, children):
+    """Membership of a parent's child collection, e.g. industries:3/wastes"""
+    return f'{table}:{row_id}/{children}'
+
+
+def filter_tag(table, key, value):
+    return f'{table}?{key}={value}'
+
+
+class CacheBackend:
+    """Stores (body, status, mimetype) entries under a key with a set of tags.
+
+    `generation()` must change whenever something is invalidated; `set()`
+    drops the entry if it changed since the caller read it, so a response
+    built from data that was replaced mid-request is never stored.
+    """
+
+    # Whether every process writing the database invalidates this backend
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Last change_log seq followed, None until the first lookup
+        self.log_seq = None
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0,
+                         'expirations': 0, 'invalidations': 0}
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def generation(self):
+        raise NotImplementedError
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, tags, generation):
+        raise NotImplementedError
+
+    def invalidate(self, tags):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """Per-process LRU with a TTL and a tag -> keys index"""
+
+    def __init__(self, max_entries=2048, ttl=300):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._generation = 0
+
+    def generation(self):
+        return self._generation
+
+    def _drop(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                self._drop(key)
+                self.counters['expirations'] += 1
+                entry = None
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[0]
+
+    def set(self, key, value, tags, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.counters['evictions'] += 1
+
+    def invalidate(self, tags):
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._drop(key)
+                    self.counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tags.clear()
+
+
+class RedisBackend(CacheBackend):
+    """Shared across workers. Entries expire with the TTL; Redis' own
+    maxmemory policy takes care of size. Hit/miss counters are per process."""
+
+    shared = True
+
+    def __init__(self, url, ttl=300, prefix='ecocycle:cache:'):
+        super().__init__()
+        if redis is None:
+            raise RuntimeError('CACHE_BACKEND = "redis" needs the redis package')
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, key):
+        return self.prefix + 'entry:' + hashlib.sha1(key.encode()).hexdigest()
+
+    def _tag(self, tag):
+        return self.prefix + 'tag:' + tag
+
+    def generation(self):
+        return int(self.client.get(self.prefix + 'generation') or 0)
+
+    def get(self, key):
+        raw = self.client.get(self._key(key))
+        if raw is None:
+            self.count('misses')
+            return None
+        self.count('hits')
+        return pickle.loads(raw)
+
+    def set(self, key, value, tags, generation):
+        entry = self._key(key)
+        pipe = self.client.pipeline()
+        pipe.set(entry, pickle.dumps(value), ex=self.ttl)
+        for tag in tags:
+            pipe.sadd(self._tag(tag), entry)
+            pipe.expire(self._tag(tag), self.ttl)
+        # Best effort: a commit landing between this check and the writes
+        # above leaves an entry that lives at most until the TTL
+        if self.generation() == generation:
+            pipe.execute()
+
+    def invalidate(self, tags):
+        pipe = self.client.pipeline()
+        pipe.incr(self.prefix + 'generation')
+        for tag in tags:
+            pipe.smembers(self._tag(tag))
+        members = pipe.execute()[1:]
+        keys = set().union(*members) if members else set()
+        tag_keys = [self._tag(tag) for tag in tags]
+        if keys or tag_keys:
+            self.client.delete(*keys, *tag_keys)
+        self.count('invalidations', len(keys))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+        self.client.incr(self.prefix + 'generation')
+
+
+# Keyed by the CACHE_BACKEND config value; each factory gets the app config
+BACKENDS = {
+    'memory': lambda config: MemoryBackend(config.get('CACHE_MAX_ENTRIES', 2048),
+                                           config.get('CACHE_TTL', 300)),
+    'redis': lambda config: RedisBackend(config['CACHE_REDIS_URL'],
+                                         config.get('CACHE_TTL', 300)),
+}
+
+
+def register_backend(name, factory):
+    BACKENDS[name] = factory
+
+
+def init_app(app):
+    name = app.config.get('CACHE_BACKEND', 'memory')
+    app.extensions['response_cache'] = BACKENDS[name](app.config) if name else None
+
+
+def get_cache():
+    return current_app.extensions.get('response_cache')
+
+
+def _cache_key():
+    args = '&'.join(f'{key}={value}' for key, value in sorted(request.args.items(multi=True)))
+    return f'{request.endpoint}|{request.path}|{args}'
+
+
+def _current_rows(table, row_ids):
+    model = {WASTES: Waste, WASTE_REQUESTS: WasteRequest}.get(table)
+    if model is None or not row_ids:
+        return []
+    columns = [model.id, model.industry_id] + \
+        ([model.wasteType] if model is Waste else [model.waste_id])
+    return db.session.execute(select(*columns).where(model.id.in_(row_ids))).mappings().all()
+
+
+def follow_log(cache):
+    """Invalidate what commits of other processes changed since the last call"""
+    seen = cache.log_seq
+    if seen is None:
+        # Nothing was cached before the first lookup
+        cache.log_seq = db.session.execute(select(func.max(ChangeLog.seq))).scalar() or 0
+        return
+    entries = db.session.execute(
+        select(ChangeLog.seq, ChangeLog.table_name, ChangeLog.row_id)
+        .where(ChangeLog.seq > seen)
+        .order_by(ChangeLog.seq)
+        .limit(FOLLOW_MAX_CHANGES + 1)
+    ).all()
+    if not entries:
+        return
+    if len(entries) > FOLLOW_MAX_CHANGES:
+        latest = db.session.execute(select(func.max(ChangeLog.seq))).scalar()
+        cache.clear()
+        cache.log_seq = max(cache.log_seq, latest)
+        return
+
+    tags = set()
+    row_ids = {}
+    for _, table, row_id in entries:
+        tags.add(row_tag(table, row_id))
+        row_ids.setdefault(table, []).append(row_id)
+    tags |= changed_tags(changes.Change(table, changes.UPDATE, None, dict(values))
+                         for table, ids in row_ids.items()
+                         for values in _current_rows(table, ids))
+    cache.invalidate(tags)
+    cache.log_seq = max(cache.log_seq, entries[-1].seq)
+
+
+def cached(tags):
+    """Serve a GET from the response cache, filling it on a miss.
+
+    `tags(kwargs, payload)` returns the tags for a freshly built 200 response
+    (payload is its JSON), or None to skip caching this request. Entries are
+    keyed on the path and query string and dropped by their tags.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            if cache is None:
+                return view(*args, **kwargs)
+
+            if not cache.shared:
+                follow_log(cache)
+            key = _cache_key()
+            entry = cache.get(key)
+            if entry is not None:
+                body, status, mimetype = entry
+                response = make_response(body, status)
+                response.mimetype = mimetype
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            # Start a fresh read transaction after taking the generation, so
+            # any commit this response misses also bumps the generation. A
+            # batch (see batch.py) took it before starting its snapshot.
+            generation = g.get('snapshot_generation')
+            if generation is None:
+                generation = cache.generation()
+                db.session.rollback()
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                entry_tags = tags(kwargs, response.get_json())
+                if entry_tags is not None:
+                    cache.set(key, (response.get_data(), 200, response.mimetype),
+                              frozenset(entry_tags), generation)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def _waste_tags(item):
+    tags = {row_tag(WASTES, item['id']),
+            children_tag(WASTES, item['id'], WASTE_REQUESTS)}
+    if item.get('industry'):
+        tags.add(row_tag(INDUSTRIES, item['industry']['id']))
+    for waste_request in item.get('waste_requests') or ():
+        tags.add(row_tag(WASTE_REQUESTS, waste_request['id']))
+        if waste_request.get('industry'):
+            tags.add(row_tag(INDUSTRIES, waste_request['industry']['id']))
+    return tags
+
+
+def _industry_tags(item):
+    tags = {row_tag(INDUSTRIES, item['id']),
+            children_tag(INDUSTRIES, item['id'], WASTES),
+            children_tag(INDUSTRIES, item['id'], WASTE_REQUESTS)}
+    for waste in item.get('wastes') or ():
+        tags.add(row_tag(WASTES, waste['id']))
+    for waste_request in item.get('waste_requests') or ():
+        tags.add(row_tag(WASTE_REQUESTS, waste_request['id']))
+        if waste_request.get('waste'):
+            tags.add(row_tag(WASTES, waste_request['waste']['id']))
+    return tags
+
+
+def industry_tags(kwargs, payload):
+    return _industry_tags(payload)
+
+
+def waste_tags(kwargs, payload):
+    return _waste_tags(payload)
+
+
+def waste_list_tags(kwargs, payload):
+    """Tags for a page of wastes filtered by industry and/or type"""
+    waste_type = kwargs.get('waste_type') or request.args.get('wasteType')
+    industry_id = request.args.get('industry_id')
+    if request.args.get('available') or not (waste_type or industry_id):
+        # Membership depends on every quantity or on every insert
+        return None
+    if industry_id and not industry_id.isdigit():
+        return None
+    tags = set()
+    if waste_type:
+        tags.add(filter_tag(WASTES, 'wasteType', waste_type))
+    if industry_id:
+        tags.add(children_tag(INDUSTRIES, int(industry_id), WASTES))
+    for item in payload['items']:
+        tags |= _waste_tags(item)
+    return tags
+
+
+def changed_tags(batch):
+    """Tags made stale by a batch of changes.Change"""
+    tags = set()
+    for change in batch:
+        for values in (change.old, change.new):
+            if values is None:
+                continue
+            tags.add(row_tag(change.table, values['id']))
+            if change.table == WASTES:
+                tags.add(children_tag(INDUSTRIES, values['industry_id'], WASTES))
+                tags.add(filter_tag(WASTES, 'wasteType', values['wasteType']))
+            elif change.table == WASTE_REQUESTS:
+                tags.add(children_tag(WASTES, values['waste_id'], WASTE_REQUESTS))
+                tags.add(children_tag(INDUSTRIES, values['industry_id'], WASTE_REQUESTS))
+    return tags
+
+
+@changes.on_commit
+def invalidate_changes(batch):
+    if not has_app_context():
+        return
+    cache = get_cache()
+    if cache is not None:
+        cache.invalidate(changed_tags(batch))
@@ -0,0 +1,125 @@
+from collections import namedtuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, attributes
+
+from models import Industry, Waste, WasteRequest
+
+INSERT = 'insert'
+UPDATE = 'update'
+DELETE = 'delete'
+
+# One row-level change. `old`/`new` map column keys to values; `old` is None
+# for inserts and `new` is None for deletes.
+Change = namedtuple('Change', ['table', 'op', 'old', 'new'])
+
+TRACKED_MODELS = (Industry, Waste, WasteRequest)
+
+_flush_handlers = []
+_commit_handlers = []
+
+
+def on_flush(handler):
+    """Register handler(session, changes), run inside the writing transaction.
+
+    Handlers may write through session.connection() so derived data commits
+    or rolls back together with the rows that caused it.
+    """
+    _flush_handlers.append(handler)
+    return handler
+
+
+def on_commit(handler):
+    """Register handler(changes), run once the transaction has committed"""
+    _commit_handlers.append(handler)
+    return handler
+
+
+def record(session, changes):
+    """Report changes to every subscriber.
+
+    Called automatically for ORM flushes. Code that writes with Core or bulk
+    statements (which bypass the unit of work) must call this itself.
+    """
+    if not changes:
+        return
+    for handler in _flush_handlers:
+        handler(session, changes)
+    session.info.setdefault('pending_changes', []).extend(changes)
+
+
+def _column_keys(obj):
+    return [attr.key for attr in inspect(obj).mapper.column_attrs]
+
+
+def _snapshot(obj):
+    state = inspect(obj)
+    return {key: state.dict.get(key) for key in _column_keys(obj)}
+
+
+def _diff(obj):
+    old, new = {}, {}
+    changed = False
+    for key in _column_keys(obj):
+        history = attributes.get_history(obj, key)
+        if history.added or history.deleted:
+            changed = True
+            new[key] = history.added[0] if history.added else None
+            old[key] = history.deleted[0] if history.deleted else None
+        else:
+            value = history.unchanged[0] if history.unchanged else None
+            old[key] = new[key] = value
+    return (old, new) if changed else None
+
+
+def _tracked(obj):
+    return isinstance(obj, TRACKED_MODELS)
+
+
+# Load the previous value whenever a tracked column is assigned, even if the
+# instance was expired, so subscribers always see accurate old values.
+for _model in TRACKED_MODELS:
+    for _attr in _model.__mapper__.column_attrs:
+        event.listen(getattr(_model, _attr.key), 'set',
+                     lambda target, value, oldvalue, initiator: None,
+                     active_history=True)
+
+
+@event.listens_for(Session, 'before_flush')
+def _load_deleted(session, flush_context, instances):
+    # Make sure rows about to be deleted are loaded while they still exist
+    for obj in session.deleted:
+        if _tracked(obj):
+            for key in _column_keys(obj):
+                getattr(obj, key)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect(session, flush_context):
+    # Still pre-flush state here: new/dirty/deleted and attribute history
+    changes = []
+    for obj in session.new:
+        if _tracked(obj):
+            changes.append(Change(obj.__tablename__, INSERT, None, _snapshot(obj)))
+    for obj in session.dirty:
+        if _tracked(obj) and obj not in session.deleted:
+            diff = _diff(obj)
+            if diff:
+                changes.append(Change(obj.__tablename__, UPDATE, diff[0], diff[1]))
+    for obj in session.deleted:
+        if _tracked(obj):
+            changes.append(Change(obj.__tablename__, DELETE, _snapshot(obj), None))
+    record(session, changes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch(session):
+    changes = session.info.pop('pending_changes', None)
+    if changes:
+        for handler in _commit_handlers:
+            handler(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop('pending_changes', None)
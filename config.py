@@ -0,0 +1,139 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def _database_url():
+    url = os.environ.get('DATABASE_URL', 'sqlite:///ecocycle.db')
+    # Some hosts still hand out the pre-SQLAlchemy-1.4 scheme
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+class Config:
+    """Settings read from the environment; pass overrides to create_app()"""
+    SQLALCHEMY_DATABASE_URI = _database_url()
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Applied to every new SQLite connection (see configure_sqlite)
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'mmap_size': _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+        # Negative values are KiB, so this is a 64 MiB page cache
+        'cache_size': _env_int('SQLITE_CACHE_SIZE', -64000),
+        # SQLite only enforces foreign keys, ON DELETE CASCADE included,
+        # when asked to on each connection
+        'foreign_keys': 'ON',
+    }
+
+    # Pool settings for server databases (PostgreSQL, MySQL, ...)
+    DB_POOL_SIZE = _env_int('DB_POOL_SIZE', 10)
+    DB_MAX_OVERFLOW = _env_int('DB_MAX_OVERFLOW', 20)
+    DB_POOL_TIMEOUT = _env_int('DB_POOL_TIMEOUT', 30)
+    DB_POOL_RECYCLE = _env_int('DB_POOL_RECYCLE', 1800)
+    DB_POOL_PRE_PING = _env_bool('DB_POOL_PRE_PING', True)
+
+    # Per-request timing, Server-Timing headers and /api/metrics (see
+    # instrumentation.py); requests running more SQL statements than
+    # QUERY_BUDGET log a warning (0 disables the check)
+    INSTRUMENTATION = _env_bool('INSTRUMENTATION', False)
+    QUERY_BUDGET = _env_int('QUERY_BUDGET', 20)
+
+    # Seconds before the matching index (see matching.py) is reloaded to
+    # pick up writes made by other processes; 0 never reloads
+    MATCHING_INDEX_TTL = _env_int('MATCHING_INDEX_TTL', 60)
+
+    # Group-commit ingestion of POST /api/dashboard/waste-requests (see
+    # ingest.py): submissions are queued and written INGEST_BATCH_SIZE at a
+    # time, waiting up to INGEST_MAX_DELAY_MS for a batch to fill; a full
+    # queue answers 503 right away
+    INGEST_MODE = _env_bool('INGEST_MODE', False)
+    INGEST_BATCH_SIZE = _env_int('INGEST_BATCH_SIZE', 500)
+    INGEST_MAX_DELAY_MS = _env_int('INGEST_MAX_DELAY_MS', 5)
+    INGEST_QUEUE_SIZE = _env_int('INGEST_QUEUE_SIZE', 5000)
+    INGEST_ACK_TIMEOUT = _env_int('INGEST_ACK_TIMEOUT', 10)
+    INGEST_REFERENCE_TTL = _env_int('INGEST_REFERENCE_TTL', 300)
+    # SQLite only: PRAGMA synchronous for the writer's connections. FULL
+    # makes an acknowledged submission survive a power loss under WAL;
+    # NORMAL (SQLITE_SYNCHRONOUS's default) only survives a process crash
+    INGEST_SYNCHRONOUS = os.environ.get('INGEST_SYNCHRONOUS', 'FULL')
+
+    # Deleting an industry or waste (see deletion.py): 'cascade' removes it
+    # and its children in one transaction; 'soft' hides it, answers 202 and
+    # purges the children in the background, PURGE_BATCH_SIZE rows per
+    # transaction with PURGE_PAUSE_MS between batches
+    DELETE_MODE = os.environ.get('DELETE_MODE', 'cascade')
+    PURGE_BATCH_SIZE = _env_int('PURGE_BATCH_SIZE', 500)
+    PURGE_PAUSE_MS = _env_int('PURGE_PAUSE_MS', 20)
+
+    # POST /api/batch (see batch.py): at most BATCH_MAX_REQUESTS GETs per
+    # batch; 0 workers runs them in turn in one snapshot, more runs them
+    # concurrently on a pool of that size
+    BATCH_MAX_REQUESTS = _env_int('BATCH_MAX_REQUESTS', 20)
+    BATCH_WORKERS = _env_int('BATCH_WORKERS', 0)
+
+    # ASGI serving (see asgi.py): the read endpoints run on the event loop
+    # over an asyncio engine, for ASYNC_DATABASE_URI or else the async
+    # driver of SQLALCHEMY_DATABASE_URI; everything else runs on a pool of
+    # ASGI_WSGI_THREADS threads
+    ASYNC_DATABASE_URI = os.environ.get('ASYNC_DATABASE_URL')
+    ASGI_WSGI_THREADS = _env_int('ASGI_WSGI_THREADS', 16)
+
+    # Live change feed (see events.py): 'local' (one process), 'redis'
+    # (across workers), or '' to disable /api/dashboard/events
+    EVENTS_BROKER = os.environ.get('EVENTS_BROKER', 'local')
+    EVENTS_REDIS_URL = os.environ.get('EVENTS_REDIS_URL', 'redis://localhost:6379/0')
+    EVENTS_HEARTBEAT = _env_int('EVENTS_HEARTBEAT', 15)
+
+    # Response cache (see cache.py): 'memory', 'redis', or '' to disable
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_TTL = _env_int('CACHE_TTL', 300)
+    CACHE_MAX_ENTRIES = _env_int('CACHE_MAX_ENTRIES', 2048)
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database URL"""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        # The driver-level timeout covers the connect itself; busy_timeout
+        # (set per connection) covers every statement afterwards
+        busy_timeout = config['SQLITE_PRAGMAS'].get('busy_timeout') or 0
+        return {'connect_args': {'timeout': busy_timeout / 1000}}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+def configure_sqlite(engine, pragmas):
+    """Run `pragmas` on each new connection of a SQLite engine"""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            if value is not None:
+                cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
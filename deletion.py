@@ -0,0 +1,245 @@
+import atexit
+import logging
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, event, or_, select, union, update
+from sqlalchemy.orm import Session
+
+from models import db, Industry, Waste, WasteRequest, utcnow
+import changes
+
+# Deleting an industry deletes its wastes and requests, and deleting a waste
+# deletes its requests. The foreign keys cascade in the database
+# (ON DELETE CASCADE) and the relationships are passive, so the ORM never
+# loads the children: when a flush deletes an industry or waste, its children
+# are removed just before with two set-based DELETE ... RETURNING statements,
+# and the returned rows are reported to the change hub like any other write.
+#
+# With DELETE_MODE = 'soft' the delete routes only stamp deleted_at and
+# answer 202. An industry's wastes are stamped in the same transaction, so
+# every read path and reference check that skips soft-deleted wastes also
+# skips those of a soft-deleted industry, and no new request can be made
+# against them. The rows disappear from reads, the dashboard counters and
+# the sync feed (as deletions) at once; a purge thread then removes the
+# children PURGE_BATCH_SIZE rows per transaction, pausing PURGE_PAUSE_MS
+# between batches so other writers get the lock, and finally the row
+# itself. Until then the waste requests stay readable and counted, and a
+# soft-deleted industry keeps its industry_code.
+
+logger = logging.getLogger('ecocycle.deletion')
+
+CASCADE = 'cascade'
+SOFT = 'soft'
+
+
+def _delete_rows(connection, model, criterion):
+    """DELETE matching rows; returns their column values as Changes"""
+    attrs = model.__mapper__.column_attrs
+    keys = [attr.key for attr in attrs]
+    rows = connection.execute(
+        delete(model.__table__).where(criterion)
+        .returning(*[attr.columns[0] for attr in attrs])
+    ).all()
+    return [changes.Change(model.__tablename__, changes.DELETE, dict(zip(keys, row)), None)
+            for row in rows]
+
+
+def delete_children(session, industry_ids=(), waste_ids=(), keep=()):
+    """Delete the wastes and requests under the given industries and
+    wastes, reporting them to the change hub; `keep` lists (table, id)
+    pairs the caller deletes itself. Returns the number of rows deleted."""
+    connection = session.connection()
+    industry_ids, waste_ids = list(industry_ids), list(waste_ids)
+    kept = {model: [row_id for table, row_id in keep if table == model.__tablename__]
+            for model in (Waste, WasteRequest)}
+
+    def criterion(model, *terms):
+        terms = [term for term in terms if term is not None]
+        clause = or_(*terms)
+        if kept[model]:
+            clause = clause & model.id.not_in(kept[model])
+        return clause
+
+    owned_wastes = select(Waste.id).where(Waste.industry_id.in_(industry_ids))
+    # Requests first: the analytics rollups still find their wastes
+    requests = _delete_rows(connection, WasteRequest, criterion(
+        WasteRequest,
+        WasteRequest.industry_id.in_(industry_ids) if industry_ids else None,
+        WasteRequest.waste_id.in_(owned_wastes) if industry_ids else None,
+        WasteRequest.waste_id.in_(waste_ids) if waste_ids else None))
+    changes.record(session, requests)
+    wastes = []
+    if industry_ids:
+        wastes = _delete_rows(connection, Waste,
+                              criterion(Waste, Waste.industry_id.in_(industry_ids)))
+        changes.record(session, wastes)
+    return len(requests) + len(wastes)
+
+
+@event.listens_for(Session, 'before_flush')
+def _delete_children(session, flush_context, instances):
+    # Runs before the flush deletes the parents, so nothing is left for
+    # ON DELETE CASCADE to remove behind the change hub's back
+    industries = [obj.id for obj in session.deleted if isinstance(obj, Industry)]
+    wastes = [obj.id for obj in session.deleted if isinstance(obj, Waste)]
+    if industries or wastes:
+        # Children loaded into the session are deleted (and reported) by the flush
+        keep = [(obj.__tablename__, obj.id) for obj in session.deleted
+                if isinstance(obj, (Waste, WasteRequest))]
+        delete_children(session, industries, wastes, keep)
+
+
+def soft_deletes():
+    return current_app.config.get('DELETE_MODE', CASCADE) == SOFT
+
+
+def _stamp_wastes(session, industry_id, now):
+    """Soft-delete the live wastes of an industry, reporting them to the
+    change hub"""
+    attrs = Waste.__mapper__.column_attrs
+    keys = [attr.key for attr in attrs]
+    rows = session.connection().execute(
+        update(Waste.__table__)
+        .where(Waste.industry_id == industry_id, Waste.deleted_at.is_(None))
+        .values(deleted_at=now)
+        .returning(*[attr.columns[0] for attr in attrs])
+    ).all()
+    stamped = []
+    for row in rows:
+        new = dict(zip(keys, row))
+        stamped.append(changes.Change(Waste.__tablename__, changes.UPDATE,
+                                      dict(new, deleted_at=None), new))
+    changes.record(session, stamped)
+
+
+def soft_delete(obj):
+    """Hide an industry (with its wastes) or a waste now and leave the rest
+    to the purge"""
+    now = utcnow()
+    obj.deleted_at = now
+    if isinstance(obj, Industry):
+        _stamp_wastes(db.session, obj.id, now)
+    db.session.commit()
+    purger = current_app.extensions.get('purge')
+    if purger is not None:
+        purger.wake()
+
+
+def purge_step(batch_size):
+    """Delete up to `batch_size` rows owned by soft-deleted industries and
+    wastes in one transaction: requests, then wastes, then the deleted rows
+    themselves. Returns the number deleted, 0 once nothing is left."""
+    session = db.session
+    connection = session.connection()
+    # Each part can use an index (the partial deleted_at ones among them)
+    industries = select(Industry.id).where(Industry.deleted_at.is_not(None))
+    wastes = union(select(Waste.id).where(Waste.deleted_at.is_not(None)),
+                   select(Waste.id).where(Waste.industry_id.in_(industries)))
+    steps = (
+        (WasteRequest, or_(WasteRequest.industry_id.in_(industries),
+                           WasteRequest.waste_id.in_(wastes))),
+        (Waste, Waste.id.in_(wastes)),
+        (Industry, Industry.id.in_(industries)),
+    )
+    try:
+        for model, criterion in steps:
+            ids = connection.execute(
+                select(model.id).where(criterion).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                continue
+            # Children written since the earlier steps ran
+            if model is Industry:
+                delete_children(session, industry_ids=ids)
+            elif model is Waste:
+                delete_children(session, waste_ids=ids)
+            deleted = _delete_rows(connection, model, model.id.in_(ids))
+            changes.record(session, deleted)
+            session.commit()
+            return len(deleted)
+    except Exception:
+        session.rollback()
+        raise
+    session.rollback()
+    return 0
+
+
+def purge(batch_size, pause=0.0):
+    """Run purge steps until nothing is left; returns the rows deleted"""
+    total = 0
+    while True:
+        deleted = purge_step(batch_size)
+        if not deleted:
+            return total
+        total += deleted
+        time.sleep(pause)
+
+
+class Purger:
+    """Background thread that purges whenever a soft delete wakes it"""
+
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = app.config.get('PURGE_BATCH_SIZE', 500)
+        self.pause = app.config.get('PURGE_PAUSE_MS', 20) / 1000.0
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._closing = False
+
+    def wake(self):
+        self._start()
+        self._wake.set()
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='purge', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def close(self, timeout=5):
+        """Stop after the current batch; the rest is purged on the next run"""
+        self._closing = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._closing:
+                return
+            with self.app.app_context():
+                try:
+                    while not self._closing and purge_step(self.batch_size):
+                        time.sleep(self.pause)
+                except Exception:
+                    logger.exception('Purging soft-deleted rows failed')
+
+
+def init_app(app):
+    """Start purging in the background when DELETE_MODE is 'soft'"""
+    mode = app.config.get('DELETE_MODE', CASCADE)
+    if mode not in (CASCADE, SOFT):
+        raise ValueError(f'DELETE_MODE must be {CASCADE!r} or {SOFT!r}, not {mode!r}')
+    app.extensions['purge'] = Purger(app) if mode == SOFT else None
+
+
+purge_cli = AppGroup('purge', help='Remove soft-deleted industries and wastes.')
+
+
+@purge_cli.command('run')
+@click.option('--batch-size', default=500, show_default=True,
+              help='Rows deleted per transaction.')
+def run_command(batch_size):
+    """Purge everything soft-deleted now, in batches."""
+    count = purge(batch_size)
+    click.echo(f'Purged {count} rows.')
@@ -0,0 +1,327 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+from flask import current_app, has_app_context
+
+from models import WasteRequest
+import changes
+import stats
+
+try:
+    import redis
+except ImportError:  # only needed for EVENTS_BROKER = 'redis'
+    redis = None
+
+# Live change feed for dashboards. After each commit the batch is turned into
+# a few small events (stats deltas, request created/approved/rejected) and
+# published to a broker. Subscribers (one per open SSE stream) each get a
+# bounded queue; a recent-events ring lets reconnecting clients resume from
+# Last-Event-ID.
+#
+# Waiting is done with threading primitives, so under gevent (patched
+# threading) an idle stream costs a greenlet, not an OS thread. Under ASGI
+# (see asgi.py) streams wait on the event loop instead, with get_async().
+
+STATS = 'stats'
+REQUEST_CREATED = 'request.created'
+REQUEST_UPDATED = 'request.updated'
+REQUEST_DELETED = 'request.deleted'
+# Sent when a subscriber missed events and should refetch
+RESYNC = 'resync'
+
+# Events kept for Last-Event-ID replay, and per subscriber backlog
+HISTORY_SIZE = 1000
+QUEUE_SIZE = 500
+
+# Where the events view leaves its EventStream for asgi.py
+STREAM_KEY = 'ecocycle.event_stream'
+
+
+class Event:
+    def __init__(self, id, type, data):
+        self.id = id
+        self.type = type
+        self.data = data
+
+    def to_dict(self):
+        return {'id': self.id, 'type': self.type, 'data': self.data}
+
+    def encode(self):
+        """SSE wire format"""
+        event_id = f'id: {self.id}\n' if self.id is not None else ''
+        return f'{event_id}event: {self.type}\ndata: {json.dumps(self.data)}\n\n'
+
+
+class Subscription:
+    def __init__(self, hub):
+        self._hub = hub
+        self._events = deque()
+        self._ready = threading.Condition(hub._lock)
+        # Set while get_async() waits; called with the hub lock held
+        self._wakeup = None
+        self.lagged = False
+        self.closed = False
+
+    def _notify(self):
+        self._ready.notify()
+        if self._wakeup is not None:
+            self._wakeup()
+
+    def _push(self, event):
+        # Called with the hub lock held
+        if len(self._events) >= QUEUE_SIZE:
+            # Too slow to keep up: drop the backlog and ask for a resync
+            self._events.clear()
+            self.lagged = True
+        self._events.append(event)
+        self._notify()
+
+    def get(self, timeout):
+        """Next event, or None once `timeout` seconds pass without one"""
+        with self._ready:
+            if not self._events and not self.closed:
+                self._ready.wait(timeout)
+            if self.lagged:
+                self.lagged = False
+                self._events.clear()
+                return Event(self._hub.last_id, RESYNC, {})
+            return self._events.popleft() if self._events else None
+
+    async def get_async(self, timeout):
+        """get() for an asyncio stream: waits on the running loop, not a thread"""
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        with self._ready:
+            if self._events or self.closed or self.lagged:
+                ready.set()
+            else:
+                self._wakeup = lambda: loop.call_soon_threadsafe(ready.set)
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._ready:
+                self._wakeup = None
+        return self.get(0)
+
+    def close(self):
+        self._hub._unsubscribe(self)
+
+
+class LocalHub:
+    """In-process fan-out with a replay ring; brokers feed it"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=HISTORY_SIZE)
+        self.last_id = 0
+
+    def deliver(self, event):
+        with self._lock:
+            self.last_id = max(self.last_id, event.id)
+            self._history.append(event)
+            for subscriber in self._subscribers:
+                subscriber._push(event)
+
+    def subscribe(self, last_event_id=None):
+        """Subscribe, replaying what came after `last_event_id` if the
+        history still reaches back that far (else start with a resync)"""
+        subscription = Subscription(self)
+        with self._lock:
+            if last_event_id is not None and last_event_id < self.last_id:
+                if not self._history or self._history[0].id > last_event_id + 1:
+                    subscription.lagged = True
+                else:
+                    subscription._events.extend(
+                        event for event in self._history if event.id > last_event_id)
+            elif last_event_id is not None and last_event_id > self.last_id:
+                # Ids from before a restart mean nothing now
+                subscription.lagged = True
+            self._subscribers.add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscription.closed = True
+            self._subscribers.discard(subscription)
+            subscription._notify()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+
+class Broker:
+    """Moves events from publishers to every process's LocalHub.
+
+    Subclasses implement `publish(type, data)`; they must assign increasing
+    ids and end up calling `hub.deliver(event)` in every process.
+    """
+
+    def __init__(self):
+        self.hub = LocalHub()
+
+    def publish(self, type, data):
+        raise NotImplementedError
+
+    def subscribe(self, last_event_id=None):
+        return self.hub.subscribe(last_event_id)
+
+
+class LocalBroker(Broker):
+    """Single-process stand-in: publishes straight to this process's hub"""
+
+    def __init__(self):
+        super().__init__()
+        self._ids = 0
+        self._id_lock = threading.Lock()
+
+    def publish(self, type, data):
+        with self._id_lock:
+            self._ids += 1
+            event = Event(self._ids, type, data)
+        self.hub.deliver(event)
+
+
+class RedisBroker(Broker):
+    """Cross-worker broker over Redis pub/sub. Ids come from a shared
+    counter; a listener thread per process feeds the local hub."""
+
+    # Take the id and publish in one step so ids arrive in order
+    PUBLISH = ("local id = redis.call('INCR', KEYS[1]) "
+               "redis.call('PUBLISH', KEYS[2], id .. ' ' .. ARGV[1]) "
+               "return id")
+
+    def __init__(self, url, channel='ecocycle:events'):
+        super().__init__()
+        if redis is None:
+            raise RuntimeError('EVENTS_BROKER = "redis" needs the redis package')
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+        self._publish = self.client.register_script(self.PUBLISH)
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def publish(self, type, data):
+        self._publish(keys=[self.channel + ':id', self.channel],
+                      args=[json.dumps({'type': type, 'data': data})])
+
+    def subscribe(self, last_event_id=None):
+        self._start()
+        return super().subscribe(last_event_id)
+
+    def _start(self):
+        with self._start_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    event_id, payload = message['data'].split(b' ', 1)
+                    payload = json.loads(payload)
+                    self.hub.deliver(Event(int(event_id), payload['type'], payload['data']))
+            except redis.RedisError:
+                time.sleep(1)
+
+
+class EventStream:
+    """The SSE body of one subscriber: the reconnect delay, an optional
+    snapshot, then events, with a keepalive comment every `heartbeat`
+    seconds without one. Iterate it on a worker thread or greenlet, or
+    `async for` over it on an event loop."""
+
+    def __init__(self, subscription, heartbeat, snapshot=None):
+        self.subscription = subscription
+        self.heartbeat = heartbeat
+        self.snapshot = snapshot
+
+    def _head(self):
+        yield 'retry: 3000\n\n'
+        if self.snapshot is not None:
+            yield self.snapshot.encode()
+
+    @staticmethod
+    def _encode(event):
+        return event.encode() if event is not None else ': keepalive\n\n'
+
+    def __iter__(self):
+        yield from self._head()
+        while True:
+            yield self._encode(self.subscription.get(self.heartbeat))
+
+    async def __aiter__(self):
+        for chunk in self._head():
+            yield chunk
+        while True:
+            yield self._encode(await self.subscription.get_async(self.heartbeat))
+
+    def close(self):
+        self.subscription.close()
+
+
+# Keyed by the EVENTS_BROKER config value; each factory gets the app config
+BROKERS = {
+    'local': lambda config: LocalBroker(),
+    'redis': lambda config: RedisBroker(config['EVENTS_REDIS_URL']),
+}
+
+
+def register_broker(name, factory):
+    BROKERS[name] = factory
+
+
+def init_app(app):
+    name = app.config.get('EVENTS_BROKER', 'local')
+    app.extensions['events'] = BROKERS[name](app.config) if name else None
+
+
+def get_broker():
+    return current_app.extensions.get('events')
+
+
+def _request_data(values):
+    return {key: values[key] for key in
+            ('id', 'status', 'quantity_requested', 'industry_id', 'waste_id')}
+
+
+def events_for(batch):
+    """[(type, data)] describing a committed batch of changes"""
+    events = []
+    counts, units = stats.deltas(batch)
+    if counts or units:
+        events.append((STATS, {
+            'counts': counts,
+            'quantities': {unit: quantity for unit, (quantity, _) in units.items()},
+        }))
+    for change in batch:
+        if change.table != WasteRequest.__tablename__:
+            continue
+        if change.op == changes.INSERT:
+            events.append((REQUEST_CREATED, _request_data(change.new)))
+        elif change.op == changes.DELETE:
+            events.append((REQUEST_DELETED, {'id': change.old['id']}))
+        elif change.old['status'] != change.new['status']:
+            events.append((REQUEST_UPDATED, dict(_request_data(change.new),
+                                                 previous_status=change.old['status'])))
+    return events
+
+
+@changes.on_commit
+def publish_changes(batch):
+    if not has_app_context():
+        return
+    broker = get_broker()
+    if broker is None:
+        return
+    for type, data in events_for(batch):
+        broker.publish(type, data)
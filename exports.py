@@ -0,0 +1,87 @@
+import csv
+import io
+
+from flask import request, stream_with_context, current_app
+
+from models import db
+from serializers import dumps
+
+EXPORT_BATCH_SIZE = 1000
+
+# Requests nested in each exported waste; the rest are paged from the
+# requests export with the waste's waste_requests_next cursor, so a batch
+# never holds more than EXPORT_BATCH_SIZE * (EXPORT_NESTED_LIMIT + 1) of them
+EXPORT_NESTED_LIMIT = 100
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+    'csv': 'text/csv',
+}
+
+
+class ExportError(ValueError):
+    """Raised for an unsupported ?format= value"""
+
+
+def _partitions(stmt):
+    # yield_per streams rows from the cursor in fixed-size batches, so only
+    # one batch is ever held in memory
+    result = db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for partition in result.partitions():
+        yield partition
+
+
+def _ndjson(stmt, dump):
+    for partition in _partitions(stmt):
+        yield b''.join(_encode(item) for item in dump(partition))
+
+
+def _json_array(stmt, dump):
+    yield b'['
+    first = True
+    for partition in _partitions(stmt):
+        chunk = b','.join(_encode(item).rstrip(b'\n') for item in dump(partition))
+        yield chunk if first else b',' + chunk
+        first = False
+    yield b']\n'
+
+
+def _csv(stmt, header):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for partition in _partitions(stmt):
+        writer.writerows(partition)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _encode(item):
+    data = dumps(item)
+    return data if isinstance(data, bytes) else data.encode()
+
+
+def stream_export(stmt, dump, name):
+    """Stream the rows of `stmt` in the format picked by `?format=`.
+
+    NDJSON and JSON items have the same shape as the list endpoints (built by
+    `dump`). CSV writes the selected columns as they are, one row per line.
+    """
+    fmt = request.args.get('format', 'ndjson').lower()
+    if fmt not in FORMATS:
+        raise ExportError(f'format must be one of: {", ".join(FORMATS)}')
+
+    if fmt == 'csv':
+        body = _csv(stmt, [column.name for column in stmt.selected_columns])
+    elif fmt == 'json':
+        body = _json_array(stmt, dump)
+    else:
+        body = _ndjson(stmt, dump)
+
+    response = current_app.response_class(stream_with_context(body), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={name}.{fmt}'
+    return response
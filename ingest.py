@@ -0,0 +1,302 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, insert, select
+
+from models import db, Industry, Waste, WasteRequest, utcnow
+import changes
+
+# Group-commit ingestion for waste request submissions (INGEST_MODE). The
+# request thread checks the industry and waste ids against a cached id set,
+# queues the submission and waits; one writer thread per app takes what is
+# queued (up to INGEST_BATCH_SIZE, waiting at most INGEST_MAX_DELAY_MS for
+# more) and inserts it in a single transaction. A submission is acknowledged
+# only after the commit that contains it, so a 201 always means saved. On
+# SQLite the writer's connections run with PRAGMA synchronous =
+# INGEST_SYNCHRONOUS (FULL by default), so that commit is synced to disk
+# even in WAL mode, where the app-wide NORMAL would not sync it.
+#
+# When the queue is full new submissions are refused straight away
+# (backpressure). A submission still queued when its wait runs out is
+# withdrawn and refused, so it is never saved after the client was told it
+# was not. On shutdown the queue is drained before the process exits.
+
+logger = logging.getLogger('ecocycle.ingest')
+
+QUEUED = 'queued'
+WRITING = 'writing'
+DONE = 'done'
+FAILED = 'failed'
+WITHDRAWN = 'withdrawn'
+
+
+class IngestError(Exception):
+    status_code = 503
+
+
+class QueueFull(IngestError):
+    """Raised when the queue is full or the writer is shutting down"""
+
+
+class ReferenceNotFound(IngestError):
+    status_code = 404
+
+
+class Submission:
+    def __init__(self, values):
+        self.values = values
+        self.state = QUEUED
+        self.request_id = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class ReferenceCache:
+    """Known industry and waste ids. Commits made by this process keep it
+    current; ids missing from it are looked up before being refused."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._ids = {}
+        self.loaded_at = None
+
+    def load(self):
+        ids = {model.__tablename__: set(db.session.execute(
+                   select(model.id).where(model.deleted_at.is_(None))).scalars())
+               for model in (Industry, Waste)}
+        with self._lock:
+            self._ids = ids
+            self.loaded_at = time.monotonic()
+
+    def exists(self, model, row_id):
+        if self.loaded_at is None or (self.ttl and time.monotonic() - self.loaded_at > self.ttl):
+            self.load()
+        with self._lock:
+            if row_id in self._ids[model.__tablename__]:
+                return True
+        found = db.session.execute(select(model.id).where(
+            model.id == row_id, model.deleted_at.is_(None))).scalar()
+        if found is not None:
+            with self._lock:
+                self._ids[model.__tablename__].add(found)
+        return found is not None
+
+    def apply(self, batch):
+        with self._lock:
+            for change in batch:
+                ids = self._ids.get(change.table)
+                if ids is None:
+                    continue
+                if change.op == changes.INSERT:
+                    ids.add(change.new['id'])
+                elif change.op == changes.DELETE or change.new.get('deleted_at') is not None:
+                    ids.discard(change.old['id'])
+
+
+class Ingester:
+    def __init__(self, app):
+        config = app.config
+        self.app = app
+        self.batch_size = config.get('INGEST_BATCH_SIZE', 500)
+        self.max_delay = config.get('INGEST_MAX_DELAY_MS', 5) / 1000.0
+        self.ack_timeout = config.get('INGEST_ACK_TIMEOUT', 10)
+        self.references = ReferenceCache(config.get('INGEST_REFERENCE_TTL', 300))
+        self._queue = queue.Queue(maxsize=config.get('INGEST_QUEUE_SIZE', 5000))
+        self._state_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._writer = None
+        self._closing = False
+
+    def submit(self, industry_id, waste_id, quantity, details):
+        """Queue a request and wait for its commit; returns the new id"""
+        if not self.references.exists(Industry, industry_id) or \
+                not self.references.exists(Waste, waste_id):
+            raise ReferenceNotFound('Selected Industry or Waste not found')
+        # Release this thread's read transaction before waiting
+        db.session.rollback()
+
+        submission = Submission({
+            'quantity_requested': quantity,
+            'details': details,
+            'status': 'pending',
+            'industry_id': industry_id,
+            'waste_id': waste_id,
+        })
+        self._start()
+        if self._closing:
+            raise QueueFull('Submissions are paused, please retry')
+        try:
+            self._queue.put_nowait(submission)
+        except queue.Full:
+            raise QueueFull('Too many submissions, please retry shortly')
+
+        if not submission.done.wait(self.ack_timeout):
+            with self._state_lock:
+                if submission.state == QUEUED:
+                    submission.state = WITHDRAWN
+                    raise IngestError('Submission timed out before it was saved, please retry')
+            # Already being written: the outcome is moments away
+            submission.done.wait()
+        if submission.error is not None:
+            raise submission.error
+        return submission.request_id
+
+    def _start(self):
+        if self._writer is not None:
+            return
+        with self._start_lock:
+            if self._writer is None:
+                self._sync_writes(db.engine)
+                self._writer = threading.Thread(target=self._run, name='ingest-writer',
+                                                daemon=True)
+                self._writer.start()
+                atexit.register(self.close)
+
+    def _sync_writes(self, engine):
+        """Give the writer thread's SQLite connections INGEST_SYNCHRONOUS,
+        restoring SQLITE_PRAGMAS' setting when they go back to the pool"""
+        level = self.app.config.get('INGEST_SYNCHRONOUS')
+        default = (self.app.config.get('SQLITE_PRAGMAS') or {}).get('synchronous')
+        if engine.dialect.name != 'sqlite' or not level:
+            return
+
+        @event.listens_for(engine, 'checkout')
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            if threading.current_thread() is self._writer:
+                _set_synchronous(dbapi_connection, level)
+                connection_record.info['ingest_synchronous'] = True
+
+        @event.listens_for(engine, 'checkin')
+        def checkin(dbapi_connection, connection_record):
+            if connection_record.info.pop('ingest_synchronous', False) and \
+                    dbapi_connection is not None and default:
+                _set_synchronous(dbapi_connection, default)
+
+    def close(self, timeout=30):
+        """Refuse new submissions, write everything queued, stop the writer"""
+        self._closing = True
+        if self._writer is not None:
+            self._writer.join(timeout)
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def _collect(self):
+        """The next batch; None once closing and the queue is empty"""
+        try:
+            first = self._queue.get(timeout=0.2)
+        except queue.Empty:
+            return None if self._closing else []
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        with self._state_lock:
+            batch = [submission for submission in batch if submission.state == QUEUED]
+            for submission in batch:
+                submission.state = WRITING
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            if batch:
+                with self.app.app_context():
+                    self._write(batch)
+
+    def _write(self, batch):
+        session = db.session
+        try:
+            # References may have been deleted since they were checked
+            industries = set(session.execute(select(Industry.id).where(
+                Industry.id.in_({s.values['industry_id'] for s in batch}),
+                Industry.deleted_at.is_(None))).scalars())
+            wastes = set(session.execute(select(Waste.id).where(
+                Waste.id.in_({s.values['waste_id'] for s in batch}),
+                Waste.deleted_at.is_(None))).scalars())
+            valid = []
+            for submission in batch:
+                if submission.values['industry_id'] in industries and \
+                        submission.values['waste_id'] in wastes:
+                    valid.append(submission)
+                else:
+                    _finish(submission, error=ReferenceNotFound(
+                        'Selected Industry or Waste not found'))
+            if not valid:
+                return
+
+            now = utcnow()
+            rows = [dict(submission.values, created_at=now, updated_at=now)
+                    for submission in valid]
+            ids = session.execute(
+                insert(WasteRequest).returning(WasteRequest.id, sort_by_parameter_order=True),
+                rows
+            ).scalars().all()
+            changes.record(session, [
+                changes.Change(WasteRequest.__tablename__, changes.INSERT, None,
+                               dict(row, id=request_id))
+                for request_id, row in zip(ids, rows)
+            ])
+            session.commit()
+        except Exception:
+            session.rollback()
+            logger.exception('Group commit of %d waste requests failed', len(batch))
+            for submission in batch:
+                if not submission.done.is_set():
+                    _finish(submission, error=IngestError(
+                        'Could not save the request, please retry'))
+            return
+
+        for submission, request_id in zip(valid, ids):
+            _finish(submission, request_id=request_id)
+
+
+def _set_synchronous(dbapi_connection, level):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f'PRAGMA synchronous={level}')
+    cursor.close()
+
+
+def _finish(submission, request_id=None, error=None):
+    submission.request_id = request_id
+    submission.error = error
+    submission.state = FAILED if error is not None else DONE
+    submission.done.set()
+
+
+def init_app(app):
+    """Enable group-commit ingestion when INGEST_MODE is on"""
+    app.extensions['ingest'] = Ingester(app) if app.config.get('INGEST_MODE') else None
+
+
+def get_ingester():
+    return current_app.extensions.get('ingest')
+
+
+@changes.on_commit
+def apply_changes(batch):
+    if not has_app_context():
+        return
+    ingester = current_app.extensions.get('ingest')
+    if ingester is not None and ingester.references.loaded_at is not None:
+        ingester.references.apply(batch)
@@ -0,0 +1,219 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+# Opt-in (INSTRUMENTATION = True) per-request timing. SQL statements are
+# counted and timed through cursor events, serialization is timed around the
+# jsonify calls of the models.py schemas (through TimedJSONMixin) and the
+# fast serializers (minus any SQL it triggers, so lazy loads show up as DB
+# time). Each response gets a Server-Timing
+# header and one structured log line; totals feed per-endpoint histograms
+# served from /api/metrics in Prometheus text format. Metrics are per process.
+#
+# Timings live in the WSGI environ rather than on `g`, which is shared by
+# the sub-requests /api/batch dispatches inside its own app context.
+
+logger = logging.getLogger('ecocycle.perf')
+
+ENVIRON_KEY = 'ecocycle.perf'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+
+
+def current():
+    """The RequestTimings of the active request, or None"""
+    if has_request_context():
+        return request.environ.get(ENVIRON_KEY)
+    return None
+
+
+@contextmanager
+def timed_serialization():
+    """Add the enclosed time, excluding SQL run meanwhile, to serialization"""
+    timings = current()
+    if timings is None:
+        yield
+        return
+    db_before = timings.db_seconds
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        timings.serialize_seconds += elapsed - (timings.db_seconds - db_before)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._perf_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = current()
+    started = getattr(context, '_perf_started', None)
+    if timings is not None and started is not None:
+        timings.queries += 1
+        timings.db_seconds += time.perf_counter() - started
+
+
+class TimedJSONMixin:
+    """Schema mixin that counts jsonify() as serialization time"""
+
+    def jsonify(self, *args, **kwargs):
+        with timed_serialization():
+            return super().jsonify(*args, **kwargs)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    """Histograms per (endpoint, method, metric name)"""
+
+    SERIES = {
+        'ecocycle_request_duration_seconds': ('Total request handling time', DURATION_BUCKETS),
+        'ecocycle_request_db_seconds': ('Time spent executing SQL', DURATION_BUCKETS),
+        'ecocycle_request_serialize_seconds': ('Time spent serializing responses',
+                                               DURATION_BUCKETS),
+        'ecocycle_request_queries': ('SQL statements per request', QUERY_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, endpoint, method, values):
+        with self._lock:
+            for name, value in values.items():
+                key = (name, endpoint, method)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(self.SERIES[name][1])
+                histogram.observe(value)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (description, _) in self.SERIES.items():
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+                for (series, endpoint, method), histogram in sorted(self._histograms.items()):
+                    if series != name:
+                        continue
+                    labels = f'endpoint="{endpoint}",method="{method}"'
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.total:.6f}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _server_timing(timings, total):
+    return ', '.join([
+        f'db;dur={timings.db_seconds * 1000:.2f};desc="{timings.queries} queries"',
+        f'ser;dur={timings.serialize_seconds * 1000:.2f}',
+        f'total;dur={total * 1000:.2f}',
+    ])
+
+
+def instrument_engine(engine):
+    """Count and time the SQL statements `engine` runs"""
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def init_app(app):
+    """Install the hooks and /api/metrics when INSTRUMENTATION is on"""
+    if not app.config.get('INSTRUMENTATION'):
+        return
+
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+    metrics = Metrics()
+    app.extensions['metrics'] = metrics
+    budget = app.config.get('QUERY_BUDGET')
+
+    with app.app_context():
+        for engine in app.extensions['sqlalchemy'].engines.values():
+            instrument_engine(engine)
+
+    @app.before_request
+    def start_timing():
+        request.environ[ENVIRON_KEY] = RequestTimings()
+
+    @app.after_request
+    def report_timing(response):
+        timings = request.environ.pop(ENVIRON_KEY, None)
+        if timings is None:
+            return response
+        total = time.perf_counter() - timings.started
+        endpoint = request.endpoint or 'unmatched'
+        response.headers['Server-Timing'] = _server_timing(timings, total)
+
+        metrics.observe(endpoint, request.method, {
+            'ecocycle_request_duration_seconds': total,
+            'ecocycle_request_db_seconds': timings.db_seconds,
+            'ecocycle_request_serialize_seconds': timings.serialize_seconds,
+            'ecocycle_request_queries': timings.queries,
+        })
+
+        record = {
+            'event': 'request',
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'queries': timings.queries,
+            'db_ms': round(timings.db_seconds * 1000, 2),
+            'serialize_ms': round(timings.serialize_seconds * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+        }
+        if budget and timings.queries > budget:
+            record['event'] = 'query_budget_exceeded'
+            record['query_budget'] = budget
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
+        return response
+
+    def metrics_view():
+        body = metrics.render()
+        cache = app.extensions.get('response_cache')
+        if cache is not None:
+            for name, value in sorted(cache.stats().items()):
+                body += (f'# TYPE ecocycle_cache_{name}_total counter\n'
+                         f'ecocycle_cache_{name}_total {value}\n')
+        return app.response_class(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    app.add_url_rule('/api/metrics', view_func=metrics_view, methods=['GET'])
@@ -0,0 +1,220 @@
+from collections import defaultdict
+
+from sqlalchemy import select, update
+
+from models import db, Waste, WasteRequest
+import changes
+import units
+
+PENDING = 'pending'
+APPROVED = 'approved'
+REJECTED = 'rejected'
+
+STATUSES = (PENDING, APPROVED, REJECTED)
+
+# Allowed status changes. Approved and rejected are final, so a request can
+# only ever decrement stock once.
+TRANSITIONS = {
+    PENDING: {APPROVED, REJECTED},
+    APPROVED: set(),
+    REJECTED: set(),
+}
+
+# How often a batch is re-planned when a concurrent writer got in between
+MAX_ATTEMPTS = 3
+
+
+class StatusError(ValueError):
+    status_code = 400
+
+
+class InvalidStatus(StatusError):
+    pass
+
+
+class InvalidTransition(StatusError):
+    status_code = 409
+
+
+class InsufficientStock(StatusError):
+    status_code = 409
+
+
+class RequestNotFound(StatusError):
+    status_code = 404
+
+
+class ConcurrentUpdate(StatusError):
+    status_code = 409
+
+
+class _Conflict(Exception):
+    """A conditional UPDATE matched fewer rows than planned"""
+
+
+def _columns(model):
+    return [attr.columns[0] for attr in model.__mapper__.column_attrs]
+
+
+def _row(model, row):
+    return {attr.key: getattr(row, attr.key) for attr in model.__mapper__.column_attrs}
+
+
+def check_transition(current, new_status):
+    if new_status not in STATUSES:
+        raise InvalidStatus(f'Status must be one of: {", ".join(STATUSES)}')
+    if new_status not in TRANSITIONS.get(current, ()):
+        raise InvalidTransition(f'Request is already {current}')
+
+
+class Outcome:
+    def __init__(self, request_id, status, error=None):
+        self.request_id = request_id
+        self.status = status
+        self.error = error
+
+    def to_dict(self):
+        if self.error is not None:
+            return {'id': self.request_id, 'ok': False, 'error': str(self.error)}
+        return {'id': self.request_id, 'ok': True, 'status': self.status}
+
+
+class _Plan:
+    def __init__(self, items):
+        session = db.session
+        request_ids = {request_id for request_id, _ in items}
+        self.requests = {
+            row.id: _row(WasteRequest, row)
+            for row in session.execute(
+                select(*_columns(WasteRequest)).where(WasteRequest.id.in_(request_ids))
+            )
+        }
+        waste_ids = {record['waste_id'] for record in self.requests.values()}
+        self.wastes = {
+            row.id: _row(Waste, row)
+            for row in session.execute(
+                select(*_columns(Waste)).where(Waste.id.in_(waste_ids))
+            )
+        } if waste_ids else {}
+
+        # Walk the items in order against the rows read above, so earlier
+        # approvals use up stock before later ones see it
+        self.taken = defaultdict(float)
+        self.outcomes = []
+        current = {request_id: record['status'] for request_id, record in self.requests.items()}
+        for request_id, new_status in items:
+            try:
+                record = self.requests.get(request_id)
+                if record is None:
+                    raise RequestNotFound(f'Waste request {request_id} not found')
+                check_transition(current[request_id], new_status)
+                if new_status == APPROVED:
+                    self._take(record)
+                current[request_id] = new_status
+                self.outcomes.append(Outcome(request_id, new_status))
+            except StatusError as error:
+                self.outcomes.append(Outcome(request_id, new_status, error))
+
+    def _take(self, record):
+        quantity = record['quantity_requested'] or 0.0
+        waste = self.wastes.get(record['waste_id'])
+        stock = waste['quantity'] if waste else None
+        total = self.taken[record['waste_id']] + quantity
+        if stock is None or stock < total:
+            raise InsufficientStock('Insufficient waste quantity in stock')
+        self.taken[record['waste_id']] = total
+
+    @property
+    def failed(self):
+        return any(outcome.error is not None for outcome in self.outcomes)
+
+    def apply(self):
+        """Write the accepted outcomes with one conditional UPDATE per waste
+        and per status change; raises _Conflict if any of them lost a race."""
+        session = db.session
+        recorded = []
+
+        for waste_id, total in self.taken.items():
+            factor = units.lookup(self.wastes[waste_id]['unit'])[1]
+            row = session.execute(
+                update(Waste)
+                .where(Waste.id == waste_id, Waste.quantity >= total)
+                .values(quantity=Waste.quantity - total,
+                        canonical_quantity=(Waste.quantity - total) * factor)
+                .returning(*_columns(Waste))
+                .execution_options(synchronize_session=False)
+            ).one_or_none()
+            if row is None:
+                raise _Conflict()
+            new_waste = _row(Waste, row)
+            recorded.append(changes.Change(
+                Waste.__tablename__, changes.UPDATE,
+                dict(new_waste, quantity=new_waste['quantity'] + total,
+                     canonical_quantity=(new_waste['quantity'] + total) * factor),
+                new_waste))
+
+        grouped = defaultdict(list)
+        for outcome in self.outcomes:
+            if outcome.error is None:
+                old_status = self.requests[outcome.request_id]['status']
+                grouped[(old_status, outcome.status)].append(outcome.request_id)
+
+        for (old_status, new_status), request_ids in grouped.items():
+            updated = session.execute(
+                update(WasteRequest)
+                .where(WasteRequest.id.in_(request_ids), WasteRequest.status == old_status)
+                .values(status=new_status)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if updated != len(request_ids):
+                raise _Conflict()
+            for request_id in request_ids:
+                old_request = self.requests[request_id]
+                recorded.append(changes.Change(
+                    WasteRequest.__tablename__, changes.UPDATE,
+                    old_request, dict(old_request, status=new_status)))
+
+        changes.record(session, recorded)
+
+
+def set_statuses(items, atomic=True):
+    """Apply a list of (request_id, new_status) in one transaction.
+
+    Requests and wastes are read with one query each, stock is allocated per
+    waste in item order, and the result is written set-based: one
+    conditional UPDATE per affected waste and per status change. Conditional
+    UPDATEs keep concurrent callers (other threads, other gunicorn workers)
+    from approving a request twice or pushing stock below zero; if one loses
+    a race the batch is re-planned from fresh rows.
+
+    With `atomic`, nothing is written unless every item is valid. Otherwise
+    valid items are applied and invalid ones reported. Returns
+    (outcomes, applied).
+    """
+    session = db.session
+    for _ in range(MAX_ATTEMPTS):
+        try:
+            plan = _Plan(items)
+            if plan.failed and atomic:
+                session.rollback()
+                return plan.outcomes, False
+            plan.apply()
+            session.commit()
+            return plan.outcomes, any(outcome.error is None for outcome in plan.outcomes)
+        except _Conflict:
+            session.rollback()
+        except Exception:
+            session.rollback()
+            raise
+    raise ConcurrentUpdate('Stock or status changed concurrently, please retry')
+
+
+def set_status(request_id, new_status):
+    """Move a single waste request to `new_status`, taking stock when approving.
+
+    Raises the item's StatusError if it cannot be applied.
+    """
+    outcomes, _ = set_statuses([(request_id, new_status)])
+    if outcomes[0].error is not None:
+        raise outcomes[0].error
+    return new_status
@@ -0,0 +1,56 @@
+from sqlalchemy.orm import joinedload, load_only, selectinload
+
+from models import (
+    Industry, Waste, WasteRequest,
+    IndustrySchema, WasteSchema, WasteRequestSchema,
+)
+
+# Each schema nests a known set of relationships. Loading them up front keeps
+# the query count of a route fixed, instead of one lazy load per row and per
+# nested relationship while Marshmallow walks the objects.
+#
+# Collections use selectinload (one extra `IN (...)` query per relationship,
+# no row multiplication under LIMIT); many-to-one references use joinedload
+# (folded into the parent query). A sparse Fieldset (see serializers.py)
+# narrows this to its columns and relationships.
+
+
+def _industry_options():
+    return {
+        'wastes': selectinload(Industry.wastes.and_(Waste.deleted_at.is_(None))),
+        # IndustrySchema.waste_requests nests the request's waste
+        'waste_requests': selectinload(Industry.waste_requests).joinedload(WasteRequest.waste),
+    }
+
+
+def _waste_options():
+    return {
+        'industry': joinedload(Waste.industry),
+        # WasteSchema.waste_requests nests the request's industry
+        'waste_requests': selectinload(Waste.waste_requests).joinedload(WasteRequest.industry),
+    }
+
+
+def _waste_request_options():
+    return {
+        'waste': joinedload(WasteRequest.waste),
+        'industry': joinedload(WasteRequest.industry),
+    }
+
+
+_STRATEGIES = {
+    IndustrySchema: _industry_options,
+    WasteSchema: _waste_options,
+    WasteRequestSchema: _waste_request_options,
+}
+
+
+def eager_options(schema, fieldset=None):
+    """Loader options for everything `schema` (limited to `fieldset`, if
+    given) will touch while dumping"""
+    options = _STRATEGIES[type(schema)]()
+    if fieldset is None:
+        return tuple(options.values())
+    model = type(schema).Meta.model
+    return (load_only(*[getattr(model, key) for key in fieldset.keys]),) + \
+        tuple(option for name, option in options.items() if name in fieldset)
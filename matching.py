@@ -0,0 +1,334 @@
+import threading
+import time
+from bisect import bisect_left, insort
+
+from flask import current_app, has_app_context
+from sqlalchemy import select
+
+from models import db, Waste, WasteRequest
+import changes
+import units
+
+FEWEST = 'fewest'
+NEAREST = 'nearest'
+STRATEGIES = (FEWEST, NEAREST)
+
+MAX_SOURCES = 10
+# How often a plan is re-made when stock moved under it before saving
+MAX_ATTEMPTS = 3
+# Quantities are floats; anything below this counts as fully allocated
+EPSILON = 1e-9
+
+
+class MatchError(ValueError):
+    status_code = 400
+
+
+class StockChanged(MatchError):
+    status_code = 409
+
+
+class Source:
+    """A lot to take from; `available` and `take` are in the lot's own unit,
+    `canonical_take` in the canonical unit of its dimension"""
+
+    def __init__(self, waste_id, industry_id, unit, available, take, canonical_take):
+        self.waste_id = waste_id
+        self.industry_id = industry_id
+        self.unit = unit
+        self.available = available
+        self.take = take
+        self.canonical_take = canonical_take
+
+    def to_dict(self):
+        return {'waste_id': self.waste_id, 'industry_id': self.industry_id,
+                'unit': self.unit, 'available': self.available, 'take': self.take}
+
+
+class Plan:
+    def __init__(self, waste_type, unit, quantity, strategy, sources):
+        self.waste_type = waste_type
+        self.unit = unit
+        self.quantity = quantity
+        self.strategy = strategy
+        self.sources = sources
+
+    @property
+    def allocated(self):
+        """Total taken, in the demand's unit"""
+        _, factor = units.lookup(self.unit)
+        return sum((source.canonical_take for source in self.sources), 0.0) / factor
+
+    def to_dict(self):
+        allocated = self.allocated
+        return {
+            'wasteType': self.waste_type,
+            'unit': self.unit,
+            'requested': self.quantity,
+            'allocated': allocated,
+            'shortfall': max(self.quantity - allocated, 0.0),
+            'strategy': self.strategy,
+            'sources': [source.to_dict() for source in self.sources],
+        }
+
+
+def _canonical(unit, quantity, canonical_unit=None, canonical_quantity=None):
+    """(canonical unit, canonical quantity) of a lot; the stored columns
+    when set, else converted here (rows written before they existed)"""
+    if canonical_unit is None or canonical_quantity is None:
+        values = units.canonical(unit, quantity)
+        return values['canonical_unit'], values['canonical_quantity']
+    return canonical_unit, canonical_quantity
+
+
+class InventoryIndex:
+    """Available wastes (quantity > 0) per (wasteType, canonical unit), each
+    bucket a list of (canonical quantity, id) kept sorted so plans are a few
+    bisects. Demands are converted to the same canonical unit, so 1000 kg can
+    be drawn from a lot of 2 t."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._buckets = {}
+        self._wastes = {}
+        self._backlog = None
+        self.loaded_at = None
+
+    def _add(self, waste_id, waste_type, unit, quantity, industry_id,
+             canonical_unit=None, canonical_quantity=None):
+        if quantity is None or quantity <= 0:
+            return
+        canonical_unit, canonical_quantity = _canonical(unit, quantity, canonical_unit,
+                                                        canonical_quantity)
+        self._wastes[waste_id] = (waste_type, canonical_unit, canonical_quantity, industry_id,
+                                  unit, quantity)
+        insort(self._buckets.setdefault((waste_type, canonical_unit), []),
+               (canonical_quantity, waste_id))
+
+    def _remove(self, waste_id):
+        entry = self._wastes.pop(waste_id, None)
+        if entry is None:
+            return
+        waste_type, canonical_unit, canonical_quantity = entry[:3]
+        items = self._buckets[(waste_type, canonical_unit)]
+        del items[bisect_left(items, (canonical_quantity, waste_id))]
+
+    def _apply(self, waste_id, values):
+        self._remove(waste_id)
+        if values is not None and values.get('deleted_at') is None:
+            self._add(waste_id, values['wasteType'], values['unit'],
+                      values['quantity'], values['industry_id'],
+                      values.get('canonical_unit'), values.get('canonical_quantity'))
+
+    def load(self):
+        """Rebuild from the database. Changes committed while the rows are
+        read are queued and replayed on top, in commit order."""
+        with self._load_lock:
+            with self._lock:
+                self._backlog = []
+            # Plain Core rows via the connection skip ORM result processing
+            table = Waste.__table__
+            rows = db.session.connection().execute(
+                select(table.c.id, table.c.wasteType, table.c.unit, table.c.quantity,
+                       table.c.industry_id, table.c.canonical_unit, table.c.canonical_quantity)
+                .where(table.c.quantity > db.literal_column('0'), table.c.deleted_at.is_(None))
+            ).all()
+            with self._lock:
+                self._buckets, self._wastes = {}, {}
+                for (waste_id, waste_type, unit, quantity, industry_id, canonical_unit,
+                     canonical_quantity) in rows:
+                    canonical_unit, canonical_quantity = _canonical(
+                        unit, quantity, canonical_unit, canonical_quantity)
+                    self._wastes[waste_id] = (waste_type, canonical_unit, canonical_quantity,
+                                              industry_id, unit, quantity)
+                    self._buckets.setdefault((waste_type, canonical_unit), []).append(
+                        (canonical_quantity, waste_id))
+                for items in self._buckets.values():
+                    items.sort()
+                for waste_id, values in self._backlog:
+                    self._apply(waste_id, values)
+                self._backlog = None
+                self.loaded_at = time.monotonic()
+
+    def apply(self, waste_id, values):
+        """Reflect a committed waste; `values` is its new row, None if deleted"""
+        with self._lock:
+            if self._backlog is not None:
+                self._backlog.append((waste_id, values))
+            self._apply(waste_id, values)
+
+    def plan(self, waste_type, unit, quantity, strategy=FEWEST, max_sources=MAX_SOURCES,
+             exclude_industry=None):
+        """Plan `quantity` of `waste_type` in `unit` from lots in any unit of
+        the same dimension; each source is given in its lot's own unit"""
+        canonical_unit, factor = units.lookup(unit)
+        with self._lock:
+            items = self._buckets.get((waste_type, canonical_unit), [])
+            usable = (lambda waste_id: self._wastes[waste_id][3] != exclude_industry) \
+                if exclude_industry is not None else None
+            choose = _fewest if strategy == FEWEST else _nearest
+            picks = choose(items, quantity * factor, max_sources, usable)
+            sources = [self._source(waste_id, available, take)
+                       for available, waste_id, take in picks]
+        return Plan(waste_type, unit, quantity, strategy, sources)
+
+    def _source(self, waste_id, canonical_available, canonical_take):
+        _, _, _, industry_id, unit, quantity = self._wastes[waste_id]
+        # Emptying a lot takes its stored quantity exactly, with no rounding
+        take = quantity if canonical_take >= canonical_available \
+            else canonical_take * quantity / canonical_available
+        return Source(waste_id, industry_id, unit, quantity, take, canonical_take)
+
+
+def parse_demand(data):
+    """(wasteType, unit, quantity, strategy, max_sources) from request data"""
+    waste_type, unit = data.get('wasteType'), data.get('unit')
+    if not waste_type or not unit:
+        raise MatchError('wasteType and unit are required')
+    try:
+        quantity = float(data.get('quantity'))
+    except (TypeError, ValueError):
+        raise MatchError('quantity must be a number')
+    if not quantity > 0:
+        raise MatchError('quantity must be greater than 0')
+    strategy = data.get('strategy') or FEWEST
+    if strategy not in STRATEGIES:
+        raise MatchError(f'strategy must be one of: {", ".join(STRATEGIES)}')
+    try:
+        max_sources = int(data.get('max_sources') or MAX_SOURCES)
+    except (TypeError, ValueError):
+        raise MatchError('max_sources must be an integer')
+    if not 1 <= max_sources <= 50:
+        raise MatchError('max_sources must be between 1 and 50')
+    return waste_type, unit, quantity, strategy, max_sources
+
+
+def _next_free(items, index, step, taken, usable):
+    """Index of the nearest item from `index` in direction `step` that is not
+    taken and may be used, or None"""
+    while 0 <= index < len(items):
+        waste_id = items[index][1]
+        if waste_id not in taken and (usable is None or usable(waste_id)):
+            return index
+        index += step
+    return None
+
+
+def _fewest(items, quantity, max_sources, usable):
+    """Fewest sources: take the largest lots until one lot can cover the rest,
+    then the smallest lot that does, so big lots are not split needlessly."""
+    picks, taken, remaining = [], set(), quantity
+    top = len(items) - 1
+    while remaining > EPSILON and len(picks) < max_sources:
+        fit = _next_free(items, bisect_left(items, (remaining, 0)), 1, taken, usable)
+        if fit is not None:
+            available, waste_id = items[fit]
+            picks.append((available, waste_id, remaining))
+            break
+        top = _next_free(items, top, -1, taken, usable)
+        if top is None:
+            break
+        available, waste_id = items[top]
+        taken.add(waste_id)
+        picks.append((available, waste_id, available))
+        remaining -= available
+    return picks
+
+
+def _nearest(items, quantity, max_sources, usable):
+    """Nearest fit: repeatedly take the lot closest in size to what is still
+    needed, emptying lots that fit instead of cutting into larger ones."""
+    picks, taken, remaining = [], set(), quantity
+    while remaining > EPSILON and len(picks) < max_sources:
+        split = bisect_left(items, (remaining, 0))
+        above = _next_free(items, split, 1, taken, usable)
+        below = _next_free(items, split - 1, -1, taken, usable)
+        if above is None and below is None:
+            break
+        if below is None or (above is not None
+                             and items[above][0] - remaining <= remaining - items[below][0]):
+            available, waste_id = items[above]
+            picks.append((available, waste_id, remaining))
+            break
+        available, waste_id = items[below]
+        taken.add(waste_id)
+        picks.append((available, waste_id, available))
+        remaining -= available
+    return picks
+
+
+def get_index():
+    """This app's index, (re)loaded on first use and after MATCHING_INDEX_TTL.
+
+    The index follows commits made by this process; the TTL bounds how long
+    changes made by other workers can go unseen.
+    """
+    index = current_app.extensions.get('inventory_index')
+    if index is None:
+        index = current_app.extensions.setdefault('inventory_index', InventoryIndex())
+    ttl = current_app.config.get('MATCHING_INDEX_TTL', 60)
+    if index.loaded_at is None or (ttl and time.monotonic() - index.loaded_at > ttl):
+        index.load()
+    return index
+
+
+@changes.on_commit
+def apply_changes(batch):
+    if not has_app_context():
+        return
+    index = current_app.extensions.get('inventory_index')
+    if index is None or index.loaded_at is None:
+        return
+    for change in batch:
+        if change.table == Waste.__tablename__:
+            row = change.new or change.old
+            index.apply(row['id'], change.new)
+
+
+def _check(plan):
+    """Re-read the planned wastes; returns the ids whose stock moved"""
+    if not plan.sources:
+        return set()
+    current = {waste_id: (unit, quantity) for waste_id, unit, quantity in db.session.execute(
+        select(Waste.id, Waste.unit, Waste.quantity)
+        .where(Waste.id.in_([source.waste_id for source in plan.sources]))
+    ).all()}
+    return {source.waste_id for source in plan.sources
+            if current.get(source.waste_id) != (source.unit, source.available)}
+
+
+def create_requests(industry_id, waste_type, unit, quantity, strategy=FEWEST,
+                    max_sources=MAX_SOURCES, details=''):
+    """Plan a demand and save it as one pending WasteRequest per source,
+    each for a quantity in its waste's own unit.
+
+    The planned lots are re-read before saving; lots whose stock changed
+    (e.g. by another worker) are refreshed in the index and the plan redone.
+    Returns (plan, requests).
+    """
+    index = get_index()
+    for _ in range(MAX_ATTEMPTS):
+        plan = index.plan(waste_type, unit, quantity, strategy, max_sources,
+                          exclude_industry=industry_id)
+        stale = _check(plan)
+        if not stale:
+            break
+        rows = {row['id']: dict(row) for row in db.session.execute(
+            select(Waste.id, Waste.wasteType, Waste.unit, Waste.quantity, Waste.industry_id,
+                   Waste.canonical_unit, Waste.canonical_quantity, Waste.deleted_at)
+            .where(Waste.id.in_(stale))
+        ).mappings()}
+        for waste_id in stale:
+            index.apply(waste_id, rows.get(waste_id))
+    else:
+        raise StockChanged('Stock changed concurrently, please retry')
+
+    requests = [
+        WasteRequest(quantity_requested=source.take, details=details, status='pending',
+                     industry_id=industry_id, waste_id=source.waste_id)
+        for source in plan.sources
+    ]
+    db.session.add_all(requests)
+    db.session.commit()
+    return plan, requests
@@ -0,0 +1,125 @@
+"""Canonical waste quantities
+
+Revision ID: 02ee7abbb362
+Revises: 7aa0cf93fd27
+Create Date: 2026-10-18 19:40:08.513370
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '02ee7abbb362'
+down_revision = '7aa0cf93fd27'
+branch_labels = None
+depends_on = None
+
+# The unit registry of units.py as of this revision: (spellings, canonical
+# unit, factor). Later additions are applied with `flask units backfill`.
+UNITS = [
+    (['kg', 'kgs', 'kilo', 'kilos', 'kilogram', 'kilograms'], 'kg', 1.0),
+    (['g', 'gram', 'grams'], 'kg', 0.001),
+    (['t', 'tonne', 'tonnes', 'metric ton', 'metric tons'], 'kg', 1000.0),
+    (['lb', 'lbs', 'pound', 'pounds'], 'kg', 0.45359237),
+    (['l', 'ltr', 'litre', 'litres', 'liter', 'liters'], 'l', 1.0),
+    (['ml', 'millilitre', 'millilitres', 'milliliter', 'milliliters'], 'l', 0.001),
+    (['m3', 'm³', 'cubic metre', 'cubic metres', 'cubic meter', 'cubic meters'], 'l', 1000.0),
+    (['gal', 'gallon', 'gallons'], 'l', 3.785411784),
+    (['pc', 'pcs', 'piece', 'pieces', 'unit', 'units', 'item', 'items', 'each'], 'pcs', 1.0),
+]
+
+
+def _lookup(unit):
+    name = (unit or '').strip().lower()
+    for spellings, canonical, factor in UNITS:
+        if name in spellings:
+            return canonical, factor
+    return name, 1.0
+
+
+ROLLUP_KEY = ['grain', 'industry_id', 'bucket', 'wasteType', 'unit']
+ROLLUP_COUNTS = ['requests', 'approved', 'rejected']
+ROLLUP_QUANTITIES = ['requested_quantity', 'approved_quantity', 'rejected_quantity']
+
+
+def _canonicalize_rollups(connection):
+    """Merge request_rollups rows into canonical units, converting their
+    quantities, through a scratch table"""
+    columns = ROLLUP_KEY + ROLLUP_COUNTS + ROLLUP_QUANTITIES
+    rollups = sa.table('request_rollups', *[sa.column(name) for name in columns])
+    present = connection.execute(sa.select(rollups.c.unit).distinct()).scalars().all()
+    conversions = {unit: _lookup(unit) for unit in present}
+    if all(conversions[unit] == (unit, 1.0) for unit in present):
+        return
+
+    unit = sa.case({raw: canonical for raw, (canonical, _) in conversions.items()},
+                   value=rollups.c.unit, else_=rollups.c.unit)
+    factor = sa.case({raw: factor for raw, (_, factor) in conversions.items()},
+                     value=rollups.c.unit, else_=1.0)
+    keys = [rollups.c[name] for name in ROLLUP_KEY[:-1]] + [unit]
+    merged = sa.select(
+        *keys,
+        *[sa.func.sum(rollups.c[name]) for name in ROLLUP_COUNTS],
+        *[sa.func.sum(rollups.c[name] * factor) for name in ROLLUP_QUANTITIES],
+    ).group_by(*keys)
+
+    scratch = op.create_table(
+        'request_rollups_canonical',
+        sa.Column('grain', sa.String(length=10)),
+        sa.Column('industry_id', sa.Integer()),
+        sa.Column('bucket', sa.DateTime()),
+        sa.Column('wasteType', sa.String(length=50)),
+        sa.Column('unit', sa.String(length=20)),
+        *[sa.Column(name, sa.Integer()) for name in ROLLUP_COUNTS],
+        *[sa.Column(name, sa.Float()) for name in ROLLUP_QUANTITIES],
+    )
+    connection.execute(sa.insert(scratch).from_select(columns, merged))
+    connection.execute(sa.delete(rollups))
+    connection.execute(sa.insert(rollups).from_select(columns, sa.select(scratch)))
+    op.drop_table('request_rollups_canonical')
+
+
+def _rebuild_unit_totals(unit, quantity):
+    op.execute("DELETE FROM unit_totals")
+    op.execute(
+        f"INSERT INTO unit_totals (unit, quantity, entries) "
+        f"SELECT {unit}, COALESCE(SUM({quantity}), 0.0), COUNT(id) FROM wastes GROUP BY {unit}"
+    )
+
+
+def _bump_versions():
+    # Waste and analytics responses change shape: retire their ETags
+    op.execute("UPDATE table_versions SET version = version + 1 "
+               "WHERE table_name IN ('wastes', 'wasteRequests')")
+
+
+def upgrade():
+    op.add_column('wastes', sa.Column('canonical_unit', sa.String(length=20), nullable=True))
+    op.add_column('wastes', sa.Column('canonical_quantity', sa.Float(), nullable=True))
+
+    # One UPDATE per distinct unit as entered
+    connection = op.get_bind()
+    update = sa.text("UPDATE wastes SET canonical_unit = :canonical, "
+                     "canonical_quantity = COALESCE(quantity, 0.0) * :factor WHERE unit = :unit")
+    for unit in connection.execute(sa.text("SELECT DISTINCT unit FROM wastes")).scalars().all():
+        canonical, factor = _lookup(unit)
+        connection.execute(update, {'canonical': canonical, 'factor': factor, 'unit': unit})
+
+    _rebuild_unit_totals('canonical_unit', 'canonical_quantity')
+    _canonicalize_rollups(connection)
+    _bump_versions()
+
+
+def downgrade():
+    # request_rollups stay in canonical units: `flask analytics rebuild`
+    # brings back the units as entered
+    _rebuild_unit_totals('unit', 'quantity')
+    if op.get_bind().dialect.name == 'sqlite':
+        # Native DROP COLUMN keeps the FTS triggers a batch rebuild would drop
+        op.execute('ALTER TABLE wastes DROP COLUMN canonical_quantity')
+        op.execute('ALTER TABLE wastes DROP COLUMN canonical_unit')
+    else:
+        op.drop_column('wastes', 'canonical_quantity')
+        op.drop_column('wastes', 'canonical_unit')
+    _bump_versions()
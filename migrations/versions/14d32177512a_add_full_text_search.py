@@ -0,0 +1,61 @@
+"""Add full-text search
+
+Revision ID: 14d32177512a
+Revises: 3cd3ab9289b4
+Create Date: 2026-10-18 13:41:52.077364
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '14d32177512a'
+down_revision = '3cd3ab9289b4'
+branch_labels = None
+depends_on = None
+
+# External-content FTS5 tables: the text lives only in the base tables, the
+# FTS tables hold the index. Triggers keep them in sync for every write path,
+# including Core bulk inserts and database-level cascades.
+INDEXES = {
+    'industries': ('industries_fts', ['name', 'description']),
+    'wastes': ('wastes_fts', ['name', 'wasteType', 'notes']),
+}
+
+
+def _quote(columns, prefix=''):
+    return ', '.join(f'{prefix}"{column}"' for column in columns)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    for content, (fts, columns) in INDEXES.items():
+        op.execute(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({_quote(columns)}, "
+            f"content='{content}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        insert = (f"INSERT INTO {fts}(rowid, {_quote(columns)}) "
+                  f"VALUES (new.id, {_quote(columns, 'new.')});")
+        delete = (f"INSERT INTO {fts}({fts}, rowid, {_quote(columns)}) "
+                  f"VALUES ('delete', old.id, {_quote(columns, 'old.')});")
+        op.execute(f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {content} BEGIN {insert} END")
+        op.execute(f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {content} BEGIN {delete} END")
+        # Only re-index when a searchable column changes, not on stock updates
+        op.execute(
+            f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {_quote(columns)} ON {content} "
+            f"BEGIN {delete} {insert} END"
+        )
+        op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    for content, (fts, columns) in INDEXES.items():
+        for suffix in ('ai', 'ad', 'au'):
+            op.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+        op.execute(f"DROP TABLE IF EXISTS {fts}")
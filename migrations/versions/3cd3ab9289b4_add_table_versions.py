@@ -0,0 +1,35 @@
+"""Add table versions
+
+Revision ID: 3cd3ab9289b4
+Revises: ddc53022c37d
+Create Date: 2026-10-18 11:26:05.618370
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3cd3ab9289b4'
+down_revision = 'ddc53022c37d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('table_versions',
+    sa.Column('table_name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.execute(
+        "INSERT INTO table_versions (table_name, version, updated_at) "
+        "SELECT 'industries', 1, CURRENT_TIMESTAMP "
+        "UNION ALL SELECT 'wastes', 1, CURRENT_TIMESTAMP "
+        "UNION ALL SELECT 'wasteRequests', 1, CURRENT_TIMESTAMP"
+    )
+
+
+def downgrade():
+    op.drop_table('table_versions')
@@ -0,0 +1,79 @@
+"""Add request rollups
+
+Revision ID: 79a51a834145
+Revises: cb64bc0488c1
+Create Date: 2026-10-18 16:41:09.532817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '79a51a834145'
+down_revision = 'cb64bc0488c1'
+branch_labels = None
+depends_on = None
+
+
+GRAINS = ('hour', 'day', 'week', 'month', 'total')
+
+
+def _bucket(grain, dialect):
+    if grain == 'total':
+        # All-time rows share one bucket
+        epoch = "'1970-01-01 00:00:00.000000'"
+        return epoch if dialect == 'sqlite' else f'TIMESTAMP {epoch}'
+    if dialect != 'sqlite':
+        return f"date_trunc('{grain}', r.created_at)"
+    # Same text layout SQLAlchemy stores DateTime values in
+    if grain == 'hour':
+        return "strftime('%Y-%m-%d %H:00:00.000000', r.created_at)"
+    if grain == 'week':
+        # Monday of the week
+        return "strftime('%Y-%m-%d 00:00:00.000000', r.created_at, 'weekday 0', '-6 days')"
+    if grain == 'month':
+        return "strftime('%Y-%m-01 00:00:00.000000', r.created_at)"
+    return "strftime('%Y-%m-%d 00:00:00.000000', r.created_at)"
+
+
+def upgrade():
+    op.create_table('request_rollups',
+    sa.Column('grain', sa.String(length=10), nullable=False),
+    sa.Column('industry_id', sa.Integer(), nullable=False),
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.Column('wasteType', sa.String(length=50), nullable=False),
+    sa.Column('unit', sa.String(length=20), nullable=False),
+    sa.Column('requests', sa.Integer(), nullable=False),
+    sa.Column('requested_quantity', sa.Float(), nullable=False),
+    sa.Column('approved', sa.Integer(), nullable=False),
+    sa.Column('approved_quantity', sa.Float(), nullable=False),
+    sa.Column('rejected', sa.Integer(), nullable=False),
+    sa.Column('rejected_quantity', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('grain', 'industry_id', 'bucket', 'wasteType', 'unit')
+    )
+
+    # Backfill from the existing requests, per industry and for all
+    # industries (industry_id 0); `flask analytics rebuild` does the same
+    dialect = op.get_bind().dialect.name
+    for grain in GRAINS:
+        bucket = _bucket(grain, dialect)
+        group = '' if grain == 'total' else f'{bucket}, '
+        for industry, industry_group in (('r.industry_id', 'r.industry_id, '), ('0', '')):
+            op.execute(
+                'INSERT INTO request_rollups (grain, industry_id, bucket, "wasteType", unit, '
+                'requests, requested_quantity, approved, approved_quantity, rejected, '
+                'rejected_quantity) '
+                f"SELECT '{grain}', {industry}, {bucket}, w.\"wasteType\", w.unit, COUNT(*), "
+                'COALESCE(SUM(r.quantity_requested), 0.0), '
+                "SUM(CASE WHEN r.status = 'approved' THEN 1 ELSE 0 END), "
+                "COALESCE(SUM(CASE WHEN r.status = 'approved' THEN r.quantity_requested END), 0.0), "
+                "SUM(CASE WHEN r.status = 'rejected' THEN 1 ELSE 0 END), "
+                "COALESCE(SUM(CASE WHEN r.status = 'rejected' THEN r.quantity_requested END), 0.0) "
+                'FROM "wasteRequests" r JOIN wastes w ON w.id = r.waste_id '
+                f'GROUP BY {industry_group}{group}w."wasteType", w.unit'
+            )
+
+
+def downgrade():
+    op.drop_table('request_rollups')
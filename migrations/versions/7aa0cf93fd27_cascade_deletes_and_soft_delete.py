@@ -0,0 +1,102 @@
+"""Cascade deletes and soft delete
+
+Revision ID: 7aa0cf93fd27
+Revises: 79a51a834145
+Create Date: 2026-10-18 18:12:44.615203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7aa0cf93fd27'
+down_revision = '79a51a834145'
+branch_labels = None
+depends_on = None
+
+FOREIGN_KEYS = [
+    # (table, column, referred table)
+    ('wasteRequests', 'industry_id', 'industries'),
+    ('wasteRequests', 'waste_id', 'wastes'),
+    ('wastes', 'industry_id', 'industries'),
+]
+
+SOFT_DELETE = ['industries', 'wastes']
+
+# The initial migration left the foreign keys unnamed. SQLite keeps no name,
+# so batch mode matches them through this convention; PostgreSQL named them
+# <table>_<column>_fkey.
+NAMING = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+# Rebuilding wastes on SQLite drops the triggers that keep wastes_fts in sync
+# (see 14d32177512a); they are recreated afterwards
+FTS_COLUMNS = ['name', 'wasteType', 'notes']
+
+
+def _quote(columns, prefix=''):
+    return ', '.join(f'{prefix}"{column}"' for column in columns)
+
+
+def _create_fts_triggers():
+    insert = (f"INSERT INTO wastes_fts(rowid, {_quote(FTS_COLUMNS)}) "
+              f"VALUES (new.id, {_quote(FTS_COLUMNS, 'new.')});")
+    delete = (f"INSERT INTO wastes_fts(wastes_fts, rowid, {_quote(FTS_COLUMNS)}) "
+              f"VALUES ('delete', old.id, {_quote(FTS_COLUMNS, 'old.')});")
+    op.execute(f"CREATE TRIGGER IF NOT EXISTS wastes_fts_ai AFTER INSERT ON wastes "
+               f"BEGIN {insert} END")
+    op.execute(f"CREATE TRIGGER IF NOT EXISTS wastes_fts_ad AFTER DELETE ON wastes "
+               f"BEGIN {delete} END")
+    op.execute(f"CREATE TRIGGER IF NOT EXISTS wastes_fts_au AFTER UPDATE OF "
+               f"{_quote(FTS_COLUMNS)} ON wastes BEGIN {delete} {insert} END")
+
+
+def _replace_foreign_keys(ondelete, old_name, new_name):
+    # Children first; migrations/env.py turns SQLite foreign keys off so the
+    # table rebuilds do not cascade
+    for table in ('wasteRequests', 'wastes'):
+        with op.batch_alter_table(table, naming_convention=NAMING) as batch_op:
+            for fk_table, column, referred in FOREIGN_KEYS:
+                if fk_table != table:
+                    continue
+                batch_op.drop_constraint(old_name(table, column, referred), type_='foreignkey')
+                batch_op.create_foreign_key(new_name(table, column, referred), referred,
+                                            [column], ['id'], ondelete=ondelete)
+
+
+def _conventional(table, column, referred):
+    return f'fk_{table}_{column}_{referred}'
+
+
+def _original(table, column, referred):
+    if op.get_bind().dialect.name == 'sqlite':
+        return _conventional(table, column, referred)
+    return f'{table}_{column}_fkey'
+
+
+def upgrade():
+    for table in SOFT_DELETE:
+        op.add_column(table, sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        # Only soft-deleted rows are indexed, for the purge
+        op.create_index(f'ix_{table}_deleted', table, ['id'], unique=False,
+                        sqlite_where=sa.text('deleted_at IS NOT NULL'),
+                        postgresql_where=sa.text('deleted_at IS NOT NULL'))
+
+    _replace_foreign_keys('CASCADE', _original, _conventional)
+    if op.get_bind().dialect.name == 'sqlite':
+        _create_fts_triggers()
+
+
+def downgrade():
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    _replace_foreign_keys(None, _conventional, _original)
+    if sqlite:
+        _create_fts_triggers()
+
+    for table in SOFT_DELETE:
+        op.drop_index(f'ix_{table}_deleted', table_name=table)
+        if sqlite:
+            # Native DROP COLUMN keeps the FTS triggers a batch rebuild would drop
+            op.execute(f'ALTER TABLE "{table}" DROP COLUMN deleted_at')
+        else:
+            op.drop_column(table, 'deleted_at')
@@ -0,0 +1,48 @@
+"""Add PostgreSQL search indexes
+
+Revision ID: 85fb834d852b
+Revises: 02ee7abbb362
+Create Date: 2026-10-18 21:05:37.418209
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '85fb834d852b'
+down_revision = '02ee7abbb362'
+branch_labels = None
+depends_on = None
+
+# GIN indexes on the weighted document search.PostgresBackend matches
+# against. The planner only uses them for a query spelling the very same
+# expression, constants included; SQLite has its FTS5 tables instead.
+INDEXES = {
+    'industries': ('ix_industries_fts', ['name', 'description']),
+    'wastes': ('ix_wastes_fts', ['name', 'wasteType', 'notes']),
+}
+
+
+def _document(columns):
+    return ' || '.join(
+        f"""setweight(to_tsvector('simple'::regconfig, coalesce("{column}", '')), '{weight}')"""
+        for column, weight in zip(columns, 'ABCD')
+    )
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table, (name, columns) in INDEXES.items():
+        op.create_index(name, table, [sa.text(f'({_document(columns)})')],
+                        postgresql_using='gin')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table, (name, _) in INDEXES.items():
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,65 @@
+"""Add timestamps and change log
+
+Revision ID: cb64bc0488c1
+Revises: 14d32177512a
+Create Date: 2026-10-18 15:02:37.218446
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cb64bc0488c1'
+down_revision = '14d32177512a'
+branch_labels = None
+depends_on = None
+
+TABLES = ['industries', 'wastes', 'wasteRequests']
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('created_at', sa.DateTime(), nullable=True))
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        # Existing rows have no history; stamp them with the upgrade time
+        op.execute(f'UPDATE "{table}" SET created_at = CURRENT_TIMESTAMP, '
+                   f'updated_at = CURRENT_TIMESTAMP')
+        op.create_index(f'ix_{table}_updated_at', table, ['updated_at'], unique=False)
+    op.create_index('ix_wasteRequests_created_at', 'wasteRequests', ['created_at'], unique=False)
+
+    op.create_table('change_log',
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('table_name', sa.String(length=50), nullable=False),
+    sa.Column('row_id', sa.Integer(), nullable=False),
+    sa.Column('op', sa.String(length=10), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('seq'),
+    sqlite_autoincrement=True
+    )
+    op.create_index('ix_change_log_row', 'change_log', ['table_name', 'row_id'], unique=True)
+
+    # Seed the log with every existing row so a sync from the beginning
+    # returns the full data set
+    for table in TABLES:
+        op.execute(
+            f"INSERT INTO change_log (table_name, row_id, op, changed_at) "
+            f"SELECT '{table}', id, 'insert', CURRENT_TIMESTAMP FROM \"{table}\" ORDER BY id"
+        )
+
+
+def downgrade():
+    op.drop_index('ix_change_log_row', table_name='change_log')
+    op.drop_table('change_log')
+
+    op.drop_index('ix_wasteRequests_created_at', table_name='wasteRequests')
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    for table in TABLES:
+        op.drop_index(f'ix_{table}_updated_at', table_name=table)
+        for column in ('updated_at', 'created_at'):
+            if sqlite:
+                # Native DROP COLUMN (SQLite 3.35+) keeps the FTS triggers,
+                # which a batch table rebuild would drop
+                op.execute(f'ALTER TABLE "{table}" DROP COLUMN {column}')
+            else:
+                op.drop_column(table, column)
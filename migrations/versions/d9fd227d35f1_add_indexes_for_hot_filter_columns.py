@@ -0,0 +1,51 @@
+"""Add indexes for hot filter columns
+
+Revision ID: d9fd227d35f1
+Revises: c25e08828c1c
+Create Date: 2026-10-18 09:12:41.503112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9fd227d35f1'
+down_revision = 'c25e08828c1c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Waste.notes exists on the model but was missing from the initial
+    # migration; databases created with db.create_all() already have it
+    columns = [column['name'] for column in sa.inspect(op.get_bind()).get_columns('wastes')]
+    if 'notes' not in columns:
+        op.add_column('wastes', sa.Column('notes', sa.Text(), nullable=True))
+
+    # Unique index replaces the query-then-insert uniqueness check.
+    # Duplicate industry codes must be cleaned up before upgrading.
+    op.create_index('ix_industries_industry_code', 'industries', ['industry_code'], unique=True)
+
+    op.create_index('ix_wastes_industry_id', 'wastes', ['industry_id'], unique=False)
+    op.create_index('ix_wastes_wasteType', 'wastes', ['wasteType'], unique=False)
+    op.create_index('ix_wastes_available', 'wastes', ['id'], unique=False,
+                    sqlite_where=sa.text('quantity > 0'),
+                    postgresql_where=sa.text('quantity > 0'))
+
+    op.create_index('ix_wasteRequests_industry_id', 'wasteRequests', ['industry_id'], unique=False)
+    op.create_index('ix_wasteRequests_waste_id', 'wasteRequests', ['waste_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_wasteRequests_waste_id', table_name='wasteRequests')
+    op.drop_index('ix_wasteRequests_industry_id', table_name='wasteRequests')
+
+    op.drop_index('ix_wastes_available', table_name='wastes')
+    op.drop_index('ix_wastes_wasteType', table_name='wastes')
+    op.drop_index('ix_wastes_industry_id', table_name='wastes')
+
+    op.drop_index('ix_industries_industry_code', table_name='industries')
+
+    with op.batch_alter_table('wastes') as batch_op:
+        batch_op.drop_column('notes')
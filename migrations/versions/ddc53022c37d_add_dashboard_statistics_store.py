@@ -0,0 +1,47 @@
+"""Add dashboard statistics store
+
+Revision ID: ddc53022c37d
+Revises: d9fd227d35f1
+Create Date: 2026-10-18 10:03:17.220954
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ddc53022c37d'
+down_revision = 'd9fd227d35f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stat_counters',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.create_table('unit_totals',
+    sa.Column('unit', sa.String(length=20), nullable=False),
+    sa.Column('quantity', sa.Float(), nullable=False),
+    sa.Column('entries', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('unit')
+    )
+
+    # Backfill from the existing rows; `flask stats rebuild` does the same
+    op.execute(
+        "INSERT INTO stat_counters (name, value) "
+        "SELECT 'industries', COUNT(*) FROM industries "
+        "UNION ALL SELECT 'wastes', COUNT(*) FROM wastes "
+        "UNION ALL SELECT 'waste_requests', COUNT(*) FROM \"wasteRequests\""
+    )
+    op.execute(
+        "INSERT INTO unit_totals (unit, quantity, entries) "
+        "SELECT unit, COALESCE(SUM(quantity), 0.0), COUNT(id) FROM wastes GROUP BY unit"
+    )
+
+
+def downgrade():
+    op.drop_table('unit_totals')
+    op.drop_table('stat_counters')
@@ -1,20 +1,41 @@
+from datetime import datetime, timezone
+
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import MetaData
 from flask_marshmallow import Marshmallow
 
+from instrumentation import TimedJSONMixin
+
 metadata = MetaData()
 db = SQLAlchemy(metadata=metadata)
 ma = Marshmallow()
 
+def utcnow():
+    """Naive UTC timestamp, as stored in every DateTime column"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 class Industry(db.Model):
     __tablename__ = "industries"
     id = db.Column(db.Integer(), primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    industry_code = db.Column(db.Integer(), nullable=False)
+    industry_code = db.Column(db.Integer(), nullable=False, unique=True, index=True)
     description = db.Column(db.Text())
+    created_at = db.Column(db.DateTime(), default=utcnow)
+    updated_at = db.Column(db.DateTime(), default=utcnow, onupdate=utcnow, index=True)
+    # Set by a soft delete until the purge removes the row (see deletion.py)
+    deleted_at = db.Column(db.DateTime())
 
-    wastes = db.relationship('Waste', backref='industry', lazy=True, cascade="all, delete-orphan")
-    waste_requests = db.relationship('WasteRequest', backref='industry', lazy=True, cascade="all, delete-orphan")
+    # Children are deleted set-based, never loaded (see deletion.py)
+    wastes = db.relationship('Waste', backref='industry', lazy=True, cascade="all, delete-orphan",
+                             passive_deletes=True)
+    waste_requests = db.relationship('WasteRequest', backref='industry', lazy=True,
+                                     cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_industries_deleted', 'id',
+                 sqlite_where=db.text('deleted_at IS NOT NULL'),
+                 postgresql_where=db.text('deleted_at IS NOT NULL')),
+    )
 
 class Waste(db.Model):
     __tablename__ = "wastes"
@@ -24,9 +45,29 @@ class Waste(db.Model):
     quantity = db.Column(db.Float(), default=0.0)
     unit = db.Column(db.String(20), nullable=False)
     notes = db.Column(db.Text()) 
-    industry_id = db.Column(db.Integer(), db.ForeignKey('industries.id'), nullable=False)
+    industry_id = db.Column(db.Integer(), db.ForeignKey('industries.id', ondelete='CASCADE'),
+                            nullable=False, index=True)
+    created_at = db.Column(db.DateTime(), default=utcnow)
+    updated_at = db.Column(db.DateTime(), default=utcnow, onupdate=utcnow, index=True)
+    deleted_at = db.Column(db.DateTime())
+    # `quantity` in the canonical unit for `unit`, set on write (see units.py)
+    canonical_unit = db.Column(db.String(20))
+    canonical_quantity = db.Column(db.Float())
+
+    waste_requests = db.relationship('WasteRequest', backref='waste', lazy=True,
+                                     cascade="all, delete-orphan", passive_deletes=True)
 
-    waste_requests = db.relationship('WasteRequest', backref='waste', lazy=True, cascade="all, delete-orphan")
+    __table_args__ = (
+        db.Index('ix_wastes_wasteType', 'wasteType'),
+        # Partial index backing /api/wastes/available
+        db.Index('ix_wastes_available', 'id',
+                 sqlite_where=db.text('quantity > 0'),
+                 postgresql_where=db.text('quantity > 0')),
+        # Soft-deleted wastes still waiting for the purge
+        db.Index('ix_wastes_deleted', 'id',
+                 sqlite_where=db.text('deleted_at IS NOT NULL'),
+                 postgresql_where=db.text('deleted_at IS NOT NULL')),
+    )
 
 class WasteRequest(db.Model):
     __tablename__ = "wasteRequests"
@@ -34,25 +75,84 @@ class WasteRequest(db.Model):
     quantity_requested = db.Column(db.Float(), default=0.0)
     status = db.Column(db.String(20), default='pending')
     details = db.Column(db.Text())
-    industry_id = db.Column(db.Integer(), db.ForeignKey('industries.id'), nullable=False)
-    waste_id = db.Column(db.Integer(), db.ForeignKey('wastes.id'), nullable=False)
+    industry_id = db.Column(db.Integer(), db.ForeignKey('industries.id', ondelete='CASCADE'),
+                            nullable=False, index=True)
+    waste_id = db.Column(db.Integer(), db.ForeignKey('wastes.id', ondelete='CASCADE'),
+                         nullable=False, index=True)
+    created_at = db.Column(db.DateTime(), default=utcnow, index=True)
+    updated_at = db.Column(db.DateTime(), default=utcnow, onupdate=utcnow, index=True)
+
+class StatCounter(db.Model):
+    """Running row counts, maintained by stats.py on every flush"""
+    __tablename__ = "stat_counters"
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer(), nullable=False, default=0)
+
+class UnitTotal(db.Model):
+    """Running SUM(canonical_quantity) of wastes per canonical unit,
+    maintained by stats.py"""
+    __tablename__ = "unit_totals"
+    unit = db.Column(db.String(20), primary_key=True)
+    quantity = db.Column(db.Float(), nullable=False, default=0.0)
+    entries = db.Column(db.Integer(), nullable=False, default=0)
+
+class TableVersion(db.Model):
+    """Change counter per table, bumped by versions.py whenever rows change"""
+    __tablename__ = "table_versions"
+    table_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer(), nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(), nullable=False)
+
+class ChangeLog(db.Model):
+    """Latest change per row, in commit order; maintained by sync.py"""
+    __tablename__ = "change_log"
+    seq = db.Column(db.Integer(), primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    row_id = db.Column(db.Integer(), nullable=False)
+    op = db.Column(db.String(10), nullable=False)
+    changed_at = db.Column(db.DateTime(), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_change_log_row', 'table_name', 'row_id', unique=True),
+        # Never reuse a seq, even when the newest entry is replaced
+        {'sqlite_autoincrement': True},
+    )
+
+class RequestRollup(db.Model):
+    """Waste request totals per time bucket of created_at, industry (0 for
+    all industries), waste type and canonical unit; maintained by analytics.py"""
+    __tablename__ = "request_rollups"
+    grain = db.Column(db.String(10), primary_key=True)
+    industry_id = db.Column(db.Integer(), primary_key=True)
+    bucket = db.Column(db.DateTime(), primary_key=True)
+    wasteType = db.Column(db.String(50), primary_key=True)
+    unit = db.Column(db.String(20), primary_key=True)
+    requests = db.Column(db.Integer(), nullable=False, default=0)
+    requested_quantity = db.Column(db.Float(), nullable=False, default=0.0)
+    approved = db.Column(db.Integer(), nullable=False, default=0)
+    approved_quantity = db.Column(db.Float(), nullable=False, default=0.0)
+    rejected = db.Column(db.Integer(), nullable=False, default=0)
+    rejected_quantity = db.Column(db.Float(), nullable=False, default=0.0)
 
-class WasteSchema(ma.SQLAlchemyAutoSchema):
+class WasteSchema(TimedJSONMixin, ma.SQLAlchemyAutoSchema):
     class Meta:
         model = Waste
         load_instance = True
         include_fk = True
+        exclude = ('deleted_at',)
+        dump_only = ('canonical_unit', 'canonical_quantity')
     industry = ma.Nested('IndustrySchema', only=('id', 'name'))
     waste_requests = ma.List(ma.Nested('WasteRequestSchema', exclude=('waste',)))
 
-class IndustrySchema(ma.SQLAlchemyAutoSchema):
+class IndustrySchema(TimedJSONMixin, ma.SQLAlchemyAutoSchema):
     class Meta:
         model = Industry
         load_instance = True
+        exclude = ('deleted_at',)
     wastes = ma.List(ma.Nested(WasteSchema, exclude=('industry', 'waste_requests')))
     waste_requests = ma.List(ma.Nested('WasteRequestSchema', exclude=('industry',)))
 
-class WasteRequestSchema(ma.SQLAlchemyAutoSchema):
+class WasteRequestSchema(TimedJSONMixin, ma.SQLAlchemyAutoSchema):
     class Meta:
         model = WasteRequest
         load_instance = True
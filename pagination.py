@@ -0,0 +1,97 @@
+import base64
+import json
+
+from flask import request
+from sqlalchemy.sql import Select
+
+from models import db
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class PaginationError(ValueError):
+    """Raised when the client sends a malformed `limit` or `cursor`"""
+
+
+def encode_cursor(payload):
+    """Turn a small dict into an opaque, URL-safe cursor token"""
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Reverse of encode_cursor; raises PaginationError on garbage input"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+    if not isinstance(payload, dict):
+        raise PaginationError('Invalid cursor')
+    return payload
+
+
+def get_limit():
+    """Read `?limit=` from the request, clamped to MAX_PAGE_SIZE"""
+    value = request.args.get('limit')
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def get_cursor():
+    """Decoded `?cursor=` payload from the request, or None"""
+    token = request.args.get('cursor')
+    return decode_cursor(token) if token else None
+
+
+def get_cursor_id():
+    """Read `?cursor=` from the request and return the last seen id (or None)"""
+    cursor = get_cursor()
+    if cursor is None:
+        return None
+    last_id = cursor.get('id')
+    if not isinstance(last_id, int):
+        raise PaginationError('Invalid cursor')
+    return last_id
+
+
+class Page:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+
+def paginate(query, column, descending=False):
+    """Keyset-paginate `query` (ORM Query or Core Select) on the unique integer `column`.
+
+    Instead of OFFSET, each page filters on the last id the client saw, so
+    the database seeks straight to the start of the page via the index and
+    the cost stays the same however deep the client pages.
+    """
+    limit = get_limit()
+    last_id = get_cursor_id()
+
+    if last_id is not None:
+        query = query.filter(column < last_id if descending else column > last_id)
+    query = query.order_by(column.desc() if descending else column.asc())
+
+    # Fetch one extra row to know whether there is another page
+    if isinstance(query, Select):
+        rows = db.session.execute(query.limit(limit + 1)).all()
+    else:
+        rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor({'id': rows[-1].id})
+
+    return Page(rows, next_cursor)
+
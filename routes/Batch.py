@@ -0,0 +1,11 @@
+from flask import Blueprint, current_app, request
+import batch
+
+batch_bp = Blueprint('batch', __name__, url_prefix='/api/batch')
+
+
+@batch_bp.route('', methods=['POST'])
+def run_batch():
+    """Several GET requests in one round trip (see batch.py)"""
+    body = batch.run(request.get_json(silent=True))
+    return current_app.response_class(body, mimetype='application/json')
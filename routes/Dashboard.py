@@ -1,30 +1,96 @@
-from flask import Blueprint, jsonify, request
-from models import db, Industry, Waste, WasteRequest, waste_requests_schema
+from flask import Blueprint, Response, current_app, jsonify, request, abort
+from models import db, Industry, Waste, WasteRequest
+from pagination import paginate, get_cursor_id
+from serializers import waste_request_select, dump_waste_requests, fast_page_response, fieldset
+from exports import stream_export
+import stats
+import inventory
+import matching
+import events
+import analytics
+import ingest
+from versions import conditional, INDUSTRIES, WASTES, WASTE_REQUESTS
+from batch import streaming
 
 dashboard_bp = Blueprint("dashboard", __name__, url_prefix="/api/dashboard")
 
+MAX_BATCH_SIZE = 500
+
+def filter_waste_requests(query):
+    """Apply the ?industry_id=, ?waste_id= and ?status= filters"""
+    for arg, column in (("industry_id", WasteRequest.industry_id),
+                        ("waste_id", WasteRequest.waste_id),
+                        ("status", WasteRequest.status)):
+        value = request.args.get(arg)
+        if value:
+            query = query.where(column == value)
+    return query
+
 @dashboard_bp.route("/stats", methods=["GET"])
+@conditional(WASTE_REQUESTS, WASTES, INDUSTRIES)
 def get_dashboard_stats():
     """Get overview statistics for the dashboard cards"""
-    total_industries = Industry.query.count()
-    total_waste_types = Waste.query.count()
-    total_requests = WasteRequest.query.count()
-
-    waste_totals = db.session.query(
-        Waste.unit, db.func.sum(Waste.quantity)
-    ).group_by(Waste.unit).all()
-
-    total_waste_quantity = {unit: qty for unit, qty in waste_totals}
+    # Read from the incrementally maintained store (see stats.py)
+    counts = stats.get_counts()
 
     return jsonify({
         "overview": {
-            "total_industries": total_industries,
-            "total_waste_types": total_waste_types,
-            "total_requests": total_requests,
-            "total_waste_quantity": total_waste_quantity
+            "total_industries": counts['industries'],
+            "total_waste_types": counts['wastes'],
+            "total_requests": counts['waste_requests'],
+            "total_waste_quantity": stats.get_unit_totals()
         }
     })
 
+@dashboard_bp.route("/analytics", methods=["GET"])
+@conditional(WASTE_REQUESTS, WASTES)
+def get_request_analytics():
+    """Request trends from the rollups: ?bucket=, ?group_by=, ?from=, ?to=,
+    ?wasteType=, ?industry_id=, ?order_by= and ?limit="""
+    try:
+        query = analytics.parse_query(request.args)
+    except analytics.AnalyticsError as error:
+        return jsonify({'error': str(error)}), error.status_code
+
+    return jsonify({
+        "bucket": query['bucket'],
+        "group_by": query['group_by'],
+        "rows": analytics.summarise(**query),
+    })
+
+@dashboard_bp.route("/events", methods=["GET"])
+@streaming
+def stream_events():
+    """Server-Sent Events: stats deltas and request changes as they commit"""
+    broker = events.get_broker()
+    if broker is None:
+        abort(404)
+
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID must be an integer'}), 400
+
+    subscription = broker.subscribe(last_event_id)
+    snapshot = None
+    if last_event_id is None:
+        # Fresh dashboards get the current totals first, then deltas
+        snapshot = events.Event(None, 'stats.snapshot', {
+            'counts': stats.get_counts(),
+            'quantities': stats.get_unit_totals(),
+        })
+    heartbeat = current_app.config.get('EVENTS_HEARTBEAT', 15)
+
+    # No database access in the stream: the session is released before it
+    # starts. The ASGI server picks it up to run it on its event loop.
+    stream = events.EventStream(subscription, heartbeat, snapshot)
+    request.environ[events.STREAM_KEY] = stream
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
 @dashboard_bp.route("/waste-requests", methods=["POST"])
 def create_waste_request():
     """Submit a new waste request from the frontend"""
@@ -34,9 +100,13 @@ def create_waste_request():
     if not data or not data.get('industry_id') or not data.get('waste_id'):
         return jsonify({'error': 'Industry ID and Waste ID are required'}), 400
 
+    ingester = ingest.get_ingester()
+    if ingester is not None:
+        return submit_waste_request(ingester, data)
+
     # Verify that the industry and waste actually exist
-    industry = Industry.query.get(data['industry_id'])
-    waste = Waste.query.get(data['waste_id'])
+    industry = Industry.query.filter_by(id=data['industry_id'], deleted_at=None).first()
+    waste = Waste.query.filter_by(id=data['waste_id'], deleted_at=None).first()
 
     if not industry or not waste:
         return jsonify({'error': 'Selected Industry or Waste not found'}), 404
@@ -58,37 +128,128 @@ def create_waste_request():
         "request_id": new_request.id
     }), 201
 
+def submit_waste_request(ingester, data):
+    """Group-commit path for create_waste_request (see ingest.py)"""
+    try:
+        industry_id, waste_id = int(data['industry_id']), int(data['waste_id'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Selected Industry or Waste not found'}), 404
+    try:
+        quantity = float(data.get('quantity_requested', 0.0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'quantity_requested must be a number'}), 400
+
+    try:
+        request_id = ingester.submit(industry_id, waste_id, quantity, data.get('details', ''))
+    except ingest.IngestError as error:
+        response = jsonify({'error': str(error)})
+        if error.status_code == 503:
+            response.headers['Retry-After'] = '1'
+        return response, error.status_code
+
+    return jsonify({
+        "message": "Waste request submitted successfully",
+        "request_id": request_id
+    }), 201
+
+@dashboard_bp.route("/waste-requests/match", methods=["POST"])
+def create_matched_requests():
+    """Submit a demand by type and unit, split across the best-matching wastes"""
+    data = request.get_json()
+
+    if not data or not data.get('industry_id'):
+        return jsonify({'error': 'Industry ID is required'}), 400
+    industry = Industry.query.filter_by(id=data['industry_id'], deleted_at=None).first()
+    if not industry:
+        return jsonify({'error': 'Selected Industry not found'}), 404
+
+    try:
+        waste_type, unit, quantity, strategy, max_sources = matching.parse_demand(data)
+        plan, requests = matching.create_requests(
+            industry.id, waste_type, unit, quantity, strategy, max_sources,
+            details=data.get('details', ''))
+    except matching.MatchError as error:
+        return jsonify({'error': str(error)}), error.status_code
+
+    if not requests:
+        return jsonify({'error': f'No available {waste_type} in {unit}', **plan.to_dict()}), 404
+
+    return jsonify({
+        "message": "Waste requests submitted successfully",
+        "request_ids": [new_request.id for new_request in requests],
+        **plan.to_dict()
+    }), 201
+
 @dashboard_bp.route("/waste-requests", methods=["GET"])
+@conditional(WASTE_REQUESTS, WASTES, INDUSTRIES)
 def get_all_waste_requests():
-    """Fetch all submitted requests for the 'Recent Requests' list"""
-    # Using .desc() ensures new submissions appear at the top of your UI list
-    all_requests = WasteRequest.query.order_by(WasteRequest.id.desc()).all()
-    return waste_requests_schema.jsonify(all_requests)
+    """Fetch submitted requests for the 'Recent Requests' list, newest first"""
+    # Paging backwards on id keeps new submissions at the top of your UI list
+    fields = fieldset(WasteRequest)
+    query = filter_waste_requests(waste_request_select(fields))
+    page = paginate(query, WasteRequest.id, descending=True)
+    return fast_page_response(dump_waste_requests, page, fields)
+
+@dashboard_bp.route("/waste-requests/export", methods=["GET"])
+@streaming
+def export_waste_requests():
+    """Stream the request history as NDJSON, a JSON array or CSV; ?cursor=
+    resumes after a request (a waste export's waste_requests_next)"""
+    query = filter_waste_requests(waste_request_select()).order_by(WasteRequest.id)
+    last_id = get_cursor_id()
+    if last_id is not None:
+        query = query.where(WasteRequest.id > last_id)
+    return stream_export(query, dump_waste_requests, "waste-requests")
 
 @dashboard_bp.route("/waste-requests/<int:id>/status", methods=["PATCH"])
 def update_request_status(id):
     """Approve or Reject a waste request and update inventory"""
-    request_record = WasteRequest.query.get_or_404(id)
     data = request.get_json()
 
-    if 'status' not in data:
+    if not data or 'status' not in data:
         return jsonify({'error': 'Status is required'}), 400
 
-    new_status = data['status'].lower()
-
-    # Logic: If approved, subtract requested quantity from the Waste stock
-    if new_status == 'approved':
-        waste_item = Waste.query.get(request_record.waste_id)
-        
-        if waste_item.quantity < request_record.quantity_requested:
-            return jsonify({'error': 'Insufficient waste quantity in stock'}), 400
-        
-        waste_item.quantity -= request_record.quantity_requested
+    new_status = str(data['status']).lower()
 
-    request_record.status = new_status
-    db.session.commit()
+    # If approved, the requested quantity is taken from the Waste stock in the
+    # same atomic step (see inventory.set_status)
+    try:
+        inventory.set_status(id, new_status)
+    except inventory.RequestNotFound:
+        abort(404)
+    except inventory.StatusError as error:
+        return jsonify({'error': str(error)}), error.status_code
 
     return jsonify({
         "message": f"Request {new_status} successfully",
         "new_status": new_status
-    })
\ No newline at end of file
+    })
+
+@dashboard_bp.route("/waste-requests/status", methods=["PATCH"])
+def update_request_statuses():
+    """Approve or Reject many waste requests in one transaction"""
+    data = request.get_json()
+    items = data.get('items') if isinstance(data, dict) else None
+    mode = data.get('mode', 'atomic') if isinstance(data, dict) else None
+
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'items must be a non-empty list of {id, status}'}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} items per batch'}), 400
+    if mode not in ('atomic', 'best_effort'):
+        return jsonify({'error': "mode must be 'atomic' or 'best_effort'"}), 400
+    if not all(isinstance(item, dict) and isinstance(item.get('id'), int)
+               and isinstance(item.get('status'), str) for item in items):
+        return jsonify({'error': 'Each item needs an integer id and a status'}), 400
+
+    pairs = [(item['id'], item['status'].lower()) for item in items]
+    try:
+        outcomes, applied = inventory.set_statuses(pairs, atomic=(mode == 'atomic'))
+    except inventory.StatusError as error:
+        return jsonify({'error': str(error)}), error.status_code
+
+    return jsonify({
+        "mode": mode,
+        "applied": applied,
+        "results": [outcome.to_dict() for outcome in outcomes]
+    }), 200 if applied or mode == 'best_effort' else 409
@@ -1,21 +1,38 @@
 from flask import Blueprint, request, jsonify
-from models import db, Industry, industry_schema, industries_schema
+from sqlalchemy.exc import IntegrityError
+from models import db, Industry, industry_schema
+from pagination import paginate
+from serializers import (industry_select, dump_industries, fast_page_response, fieldset,
+                         sparse_schema)
+from loading import eager_options
+import stats
+import bulk
+from search import search_page
+from versions import conditional, INDUSTRIES, WASTES, WASTE_REQUESTS
+from cache import cached, industry_tags
+import deletion
 
 industries_bp = Blueprint('industries', __name__, url_prefix='/api/industries')
 
 
 @industries_bp.route('', methods=['GET'])
+@conditional(INDUSTRIES, WASTES, WASTE_REQUESTS)
 def get_all_industries():
-    """Get all industries"""
-    all_industries = Industry.query.all()
-    return industries_schema.jsonify(all_industries)
+    """Get all industries, one page at a time"""
+    fields = fieldset(Industry)
+    page = paginate(industry_select(fields), Industry.id)
+    return fast_page_response(dump_industries, page, fields)
 
 
 @industries_bp.route('/<int:id>', methods=['GET'])
+@conditional(INDUSTRIES, WASTES, WASTE_REQUESTS)
+@cached(industry_tags)
 def get_industry(id):
     """Get a single industry by ID"""
-    industry = Industry.query.get_or_404(id)
-    return industry_schema.jsonify(industry)
+    fields = fieldset(Industry)
+    industry = (Industry.query.options(*eager_options(industry_schema, fields))
+                .filter_by(id=id, deleted_at=None).first_or_404())
+    return sparse_schema(industry_schema, fields).jsonify(industry)
 
 
 @industries_bp.route('', methods=['POST'])
@@ -26,10 +43,6 @@ def create_industry():
     if not data or not data.get('name') or not data.get('industry_code'):
         return jsonify({'error': 'Name and industry_code are required'}), 400
     
-    existing = Industry.query.filter_by(industry_code=data['industry_code']).first()
-    if existing:
-        return jsonify({'error': f'Industry with code {data["industry_code"]} already exists'}), 400
-    
     new_industry = Industry(
         name=data['name'],
         industry_code=data['industry_code'],
@@ -37,15 +50,27 @@ def create_industry():
     )
     
     db.session.add(new_industry)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The unique index on industry_code rejects duplicates atomically
+        db.session.rollback()
+        return jsonify({'error': f'Industry with code {data["industry_code"]} already exists'}), 400
     
     return industry_schema.jsonify(new_industry), 201
 
 
+@industries_bp.route('/bulk', methods=['POST'])
+def bulk_create_industries():
+    """Create many industries from a JSON array, CSV or NDJSON upload"""
+    result = bulk.import_industries(bulk.read_rows())
+    return jsonify(result.to_dict())
+
+
 @industries_bp.route('/<int:id>', methods=['PUT'])
 def update_industry(id):
     """Update an existing industry"""
-    industry = Industry.query.get_or_404(id)
+    industry = Industry.query.filter_by(id=id, deleted_at=None).first_or_404()
     data = request.get_json()
     
     if not data:
@@ -54,27 +79,28 @@ def update_industry(id):
     if 'name' in data:
         industry.name = data['name']
     if 'industry_code' in data:
-    
-        existing = Industry.query.filter(
-            Industry.industry_code == data['industry_code'],
-            Industry.id != id
-        ).first()
-        if existing:
-            return jsonify({'error': f'Industry with code {data["industry_code"]} already exists'}), 400
         industry.industry_code = data['industry_code']
     if 'description' in data:
         industry.description = data['description']
     
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': f'Industry with code {data["industry_code"]} already exists'}), 400
     
     return industry_schema.jsonify(industry)
 
 
 @industries_bp.route('/<int:id>', methods=['DELETE'])
 def delete_industry(id):
-    """Delete an industry"""
-    industry = Industry.query.get_or_404(id)
-    
+    """Delete an industry with its wastes and requests"""
+    industry = Industry.query.filter_by(id=id, deleted_at=None).first_or_404()
+
+    if deletion.soft_deletes():
+        deletion.soft_delete(industry)
+        return jsonify({'message': f'Industry {id} scheduled for deletion'}), 202
+
     db.session.delete(industry)
     db.session.commit()
     
@@ -82,16 +108,17 @@ def delete_industry(id):
 
 
 @industries_bp.route('/search', methods=['GET'])
+@conditional(INDUSTRIES, WASTES, WASTE_REQUESTS)
 def search_industries():
-    """Search industries by name"""
-    query = request.args.get('q', '')
-    industries = Industry.query.filter(Industry.name.ilike(f'%{query}%')).all()
-    return industries_schema.jsonify(industries)
+    """Search industries by name and description, best match first"""
+    fields = fieldset(Industry)
+    page = search_page('industries', request.args.get('q', ''), industry_select(fields))
+    return fast_page_response(dump_industries, page, fields)
 
 
 @industries_bp.route('/count', methods=['GET'])
 def get_industry_count():
     """Get total count of industries"""
-    count = Industry.query.count()
+    count = stats.get_count('industries')
     return jsonify({'count': count})
 
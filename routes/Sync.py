@@ -0,0 +1,20 @@
+from flask import Blueprint, request, jsonify
+from pagination import PaginationError
+import sync
+
+sync_bp = Blueprint('sync', __name__, url_prefix='/api/sync')
+
+
+@sync_bp.route('', methods=['GET'])
+def get_changes():
+    """Industries, wastes and requests changed since ?since=<token>"""
+    limit = request.args.get('limit', sync.DEFAULT_SYNC_SIZE)
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+
+    result = sync.changes_since(request.args.get('since'), min(limit, sync.MAX_SYNC_SIZE))
+    return jsonify(result)
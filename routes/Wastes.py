@@ -1,27 +1,64 @@
 from flask import Blueprint, request, jsonify
-from models import db, Waste, waste_schema, wastes_schema, Industry
+from models import db, Waste, waste_schema, Industry
+from pagination import paginate
+from serializers import waste_select, dump_wastes, fast_page_response, fieldset, sparse_schema
+from exports import stream_export, EXPORT_NESTED_LIMIT
+from loading import eager_options
+import stats
+import bulk
+from search import search_page
+from versions import conditional, INDUSTRIES, WASTES, WASTE_REQUESTS
+from cache import cached, waste_tags, waste_list_tags
+import matching
+import deletion
+from batch import streaming
 
 wastes_bp = Blueprint('wastes', __name__, url_prefix='/api/wastes')
 
 
-@wastes_bp.route('', methods=['GET'])
-def get_all_wastes():
-    """Get all wastes"""
+def filter_wastes(query):
+    """Apply the ?industry_id=, ?wasteType= and ?available= filters"""
     industry_id = request.args.get('industry_id')
+    waste_type = request.args.get('wasteType')
+    available = request.args.get('available', '').lower() in ('1', 'true', 'yes')
 
     if industry_id:
-        wastes = Waste.query.filter_by(industry_id=industry_id).all()
-    else:
-        wastes = Waste.query.all()
+        query = query.where(Waste.industry_id == industry_id)
+    if waste_type:
+        query = query.where(Waste.wasteType == waste_type)
+    if available:
+        query = query.where(Waste.quantity > db.literal_column('0'))
+    return query
+
+
+@wastes_bp.route('', methods=['GET'])
+@conditional(WASTES, INDUSTRIES, WASTE_REQUESTS)
+@cached(waste_list_tags)
+def get_all_wastes():
+    """Get all wastes, one page at a time"""
+    fields = fieldset(Waste)
+    page = paginate(filter_wastes(waste_select(fields)), Waste.id)
+    return fast_page_response(dump_wastes, page, fields)
+
 
-    return wastes_schema.jsonify(wastes)
+@wastes_bp.route('/export', methods=['GET'])
+@streaming
+def export_wastes():
+    """Stream every matching waste as NDJSON, a JSON array or CSV"""
+    query = filter_wastes(waste_select()).order_by(Waste.id)
+    return stream_export(query, lambda rows: dump_wastes(rows, nested_limit=EXPORT_NESTED_LIMIT),
+                         'wastes')
 
 
 @wastes_bp.route('/<int:id>', methods=['GET'])
+@conditional(WASTES, INDUSTRIES, WASTE_REQUESTS)
+@cached(waste_tags)
 def get_waste(id):
     """Get a single waste by ID"""
-    waste = Waste.query.get_or_404(id)
-    return waste_schema.jsonify(waste)
+    fields = fieldset(Waste)
+    waste = (Waste.query.options(*eager_options(waste_schema, fields))
+             .filter_by(id=id, deleted_at=None).first_or_404())
+    return sparse_schema(waste_schema, fields).jsonify(waste)
 
 
 @wastes_bp.route('', methods=['POST'])
@@ -35,7 +72,7 @@ def create_waste():
     if not data.get('industry_id'):
         return jsonify({'error': 'industry_id is required'}), 400
 
-    industry = Industry.query.get(data['industry_id'])
+    industry = Industry.query.filter_by(id=data['industry_id'], deleted_at=None).first()
     if not industry:
         return jsonify({'error': f'Industry with id {data["industry_id"]} not found'}), 404
 
@@ -54,10 +91,17 @@ def create_waste():
     return waste_schema.jsonify(new_waste), 201
 
 
+@wastes_bp.route('/bulk', methods=['POST'])
+def bulk_create_wastes():
+    """Create many wastes from a JSON array, CSV or NDJSON upload"""
+    result = bulk.import_wastes(bulk.read_rows())
+    return jsonify(result.to_dict())
+
+
 @wastes_bp.route('/<int:id>', methods=['PUT'])
 def update_waste(id):
     """Update an existing waste entry"""
-    waste = Waste.query.get_or_404(id)
+    waste = Waste.query.filter_by(id=id, deleted_at=None).first_or_404()
     data = request.get_json()
 
     if not data:
@@ -75,7 +119,7 @@ def update_waste(id):
         waste.notes = data['notes']
 
     if 'industry_id' in data:
-        industry = Industry.query.get(data['industry_id'])
+        industry = Industry.query.filter_by(id=data['industry_id'], deleted_at=None).first()
         if not industry:
             return jsonify({'error': f'Industry with id {data["industry_id"]} not found'}), 404
         waste.industry_id = data['industry_id']
@@ -86,8 +130,13 @@ def update_waste(id):
 
 @wastes_bp.route('/<int:id>', methods=['DELETE'])
 def delete_waste(id):
-    """Delete a waste entry"""
-    waste = Waste.query.get_or_404(id)
+    """Delete a waste entry with its requests"""
+    waste = Waste.query.filter_by(id=id, deleted_at=None).first_or_404()
+
+    if deletion.soft_deletes():
+        deletion.soft_delete(waste)
+        return jsonify({'message': f'Waste {id} scheduled for deletion'}), 202
+
     db.session.delete(waste)
     db.session.commit()
 
@@ -95,37 +144,62 @@ def delete_waste(id):
 
 
 @wastes_bp.route('/type/<waste_type>', methods=['GET'])
+@conditional(WASTES, INDUSTRIES, WASTE_REQUESTS)
+@cached(waste_list_tags)
 def get_wastes_by_type(waste_type):
     """Get all wastes of a specific type"""
-    wastes = Waste.query.filter_by(wasteType=waste_type).all()
-    return wastes_schema.jsonify(wastes)
+    fields = fieldset(Waste)
+    query = waste_select(fields).where(Waste.wasteType == waste_type)
+    page = paginate(query, Waste.id)
+    return fast_page_response(dump_wastes, page, fields)
+
+
+@wastes_bp.route('/search', methods=['GET'])
+@conditional(WASTES, INDUSTRIES, WASTE_REQUESTS)
+def search_wastes():
+    """Search wastes by name, type and notes, best match first"""
+    fields = fieldset(Waste)
+    page = search_page('wastes', request.args.get('q', ''), waste_select(fields))
+    return fast_page_response(dump_wastes, page, fields)
 
 
 @wastes_bp.route('/available', methods=['GET'])
+@conditional(WASTES, INDUSTRIES, WASTE_REQUESTS)
 def get_available_wastes():
     """Get all wastes with quantity > 0"""
-    wastes = Waste.query.filter(Waste.quantity > 0).all()
-    return wastes_schema.jsonify(wastes)
+    fields = fieldset(Waste)
+    # A literal 0 (not a bound parameter) lets SQLite match the partial index
+    query = waste_select(fields).where(Waste.quantity > db.literal_column('0'))
+    page = paginate(query, Waste.id)
+    return fast_page_response(dump_wastes, page, fields)
 
 
-@wastes_bp.route('/total-quantity', methods=['GET'])
-def get_total_quantity():
-    """Get total quantity of all wastes"""
-    from sqlalchemy import func
+@wastes_bp.route('/match', methods=['GET'])
+def match_wastes():
+    """Plan how to source ?quantity= of ?wasteType= in ?unit= from available stock"""
+    try:
+        waste_type, unit, quantity, strategy, max_sources = matching.parse_demand(request.args)
+        exclude = request.args.get('industry_id', type=int)
+    except matching.MatchError as error:
+        return jsonify({'error': str(error)}), error.status_code
+
+    plan = matching.get_index().plan(waste_type, unit, quantity, strategy, max_sources,
+                                     exclude_industry=exclude)
+    return jsonify(plan.to_dict())
 
-    result = db.session.query(
-        func.sum(Waste.quantity),
-        func.count(Waste.id)
-    ).first()
 
+@wastes_bp.route('/total-quantity', methods=['GET'])
+def get_total_quantity():
+    """Get total quantity of all wastes, overall and per canonical unit"""
     return jsonify({
-        'total_quantity': result[0] or 0,
-        'total_types': result[1] or 0
+        'total_quantity': stats.get_total_quantity(),
+        'by_unit': stats.get_unit_totals(),
+        'total_types': stats.get_count('wastes')
     })
 
 
 @wastes_bp.route('/count', methods=['GET'])
 def get_waste_count():
     """Get total count of waste entries"""
-    count = Waste.query.count()
+    count = stats.get_count('wastes')
     return jsonify({'count': count})
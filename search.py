@@ -0,0 +1,203 @@
+import re
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select, or_, func, literal_column, table, text, tuple_
+
+from models import db, Industry, Waste
+from pagination import Page, PaginationError, paginate, get_limit, get_cursor, encode_cursor
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(query):
+    """Split user input into lower-case word tokens (drops FTS syntax)"""
+    return _TOKEN.findall(query.lower())
+
+
+class SearchIndex:
+    """A searchable model: its columns with ranking weights and FTS table"""
+
+    def __init__(self, model, fts_table, columns):
+        self.model = model
+        self.fts_table = fts_table
+        self.columns = columns
+
+
+INDEXES = {
+    'industries': SearchIndex(Industry, 'industries_fts',
+                              [('name', 10.0), ('description', 1.0)]),
+    'wastes': SearchIndex(Waste, 'wastes_fts',
+                          [('name', 10.0), ('wasteType', 5.0), ('notes', 1.0)]),
+}
+
+
+def _ranked_page(ranked, limit, cursor):
+    """Keyset-paginate a subquery of (id, rank) ordered by rank, then id.
+
+    Lower rank sorts first. Returns (ids, next cursor payload or None).
+    """
+    stmt = select(ranked.c.id, ranked.c.rank)
+    if cursor is not None:
+        rank, last_id = cursor.get('rank'), cursor.get('id')
+        if not isinstance(rank, (int, float)) or not isinstance(last_id, int):
+            raise PaginationError('Invalid cursor')
+        stmt = stmt.where(tuple_(ranked.c.rank, ranked.c.id) > tuple_(rank, last_id))
+    rows = db.session.execute(
+        stmt.order_by(ranked.c.rank, ranked.c.id).limit(limit + 1)
+    ).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = {'rank': rows[-1].rank, 'id': rows[-1].id}
+    return [row.id for row in rows], next_cursor
+
+
+class SearchBackend:
+    """Finds ids matching every search term, best match first.
+
+    Subclasses implement `search(index, terms, limit, cursor)` returning
+    (ids, next cursor payload or None), and may override `available()` when
+    they depend on objects a migration creates.
+    """
+
+    def available(self, index):
+        return True
+
+    def search(self, index, terms, limit, cursor):
+        raise NotImplementedError
+
+
+class LikeBackend(SearchBackend):
+    """Portable fallback: substring matching on every column, in id order"""
+
+    def search(self, index, terms, limit, cursor):
+        model = index.model
+        stmt = select(model.id)
+        for term in terms:
+            pattern = '%' + term.replace('_', '\\_') + '%'
+            stmt = stmt.where(or_(*[
+                getattr(model, column).ilike(pattern, escape='\\')
+                for column, _ in index.columns
+            ]))
+        if cursor is not None:
+            if not isinstance(cursor.get('id'), int):
+                raise PaginationError('Invalid cursor')
+            stmt = stmt.where(model.id > cursor['id'])
+        ids = db.session.execute(stmt.order_by(model.id).limit(limit + 1)).scalars().all()
+        if len(ids) > limit:
+            return ids[:limit], {'id': ids[limit - 1]}
+        return ids, None
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """FTS5 external-content tables, kept in sync by triggers (see the
+    add_full_text_search migration), ranked with bm25"""
+
+    def __init__(self):
+        self._known = {}
+
+    def available(self, index):
+        key = (id(db.engine), index.fts_table)
+        if key not in self._known:
+            self._known[key] = db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': index.fts_table}
+            ).first() is not None
+        return self._known[key]
+
+    def search(self, index, terms, limit, cursor):
+        fts = literal_column(index.fts_table)
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = [weight for _, weight in index.columns]
+        ranked = (
+            select(literal_column('rowid').label('id'), func.bm25(fts, *weights).label('rank'))
+            .select_from(table(index.fts_table))
+            .where(fts.op('MATCH')(match))
+            .subquery()
+        )
+        return _ranked_page(ranked, limit, cursor)
+
+
+class PostgresBackend(SearchBackend):
+    """tsvector/tsquery matching ranked with ts_rank, backed by GIN indexes
+    on the same weighted to_tsvector() expression (see the
+    add_postgresql_search_indexes migration)"""
+
+    @staticmethod
+    def document(index):
+        # Constants are inlined, not bound: an expression index only
+        # matches a query that spells the indexed expression exactly
+        model = index.model
+        document = None
+        for (column, _), weight in zip(index.columns, 'ABCD'):
+            vector = func.setweight(
+                func.to_tsvector(literal_column("'simple'::regconfig"),
+                                 func.coalesce(getattr(model, column), literal_column("''"))),
+                literal_column(f"'{weight}'"))
+            document = vector if document is None else document.op('||')(vector)
+        return document
+
+    def search(self, index, terms, limit, cursor):
+        model = index.model
+        document = self.document(index)
+        query = func.to_tsquery('simple', ' & '.join(f'{term}:*' for term in terms))
+        ranked = (
+            select(model.id.label('id'), (-func.ts_rank(document, query)).label('rank'))
+            .where(document.op('@@')(query))
+            .subquery()
+        )
+        return _ranked_page(ranked, limit, cursor)
+
+
+FALLBACK = LikeBackend()
+
+# Keyed by SQLAlchemy dialect name, or by the SEARCH_BACKEND config value
+BACKENDS = {
+    'sqlite': SQLiteFTSBackend(),
+    'postgresql': PostgresBackend(),
+    'like': FALLBACK,
+}
+
+
+def register_backend(name, backend):
+    BACKENDS[name] = backend
+
+
+def get_backend(index):
+    name = current_app.config.get('SEARCH_BACKEND') or db.engine.dialect.name
+    backend = BACKENDS.get(name, FALLBACK)
+    return backend if backend.available(index) else FALLBACK
+
+
+def search_page(kind, query, base_select):
+    """Search `kind` for `query` and return a Page of rows from `base_select`
+    (a Core select over the model) in ranking order. An empty query lists
+    everything in id order."""
+    index = INDEXES[kind]
+    terms = tokenize(query)
+    if not terms:
+        return paginate(base_select, index.model.id)
+
+    ids, next_cursor = get_backend(index).search(index, terms, get_limit(), get_cursor())
+    rows = db.session.execute(base_select.where(index.model.id.in_(ids))).all() if ids else []
+    position = {row_id: n for n, row_id in enumerate(ids)}
+    rows.sort(key=lambda row: position[row.id])
+    return Page(rows, encode_cursor(next_cursor) if next_cursor else None)
+
+
+search_cli = AppGroup('search', help='Maintain the full-text search index.')
+
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild the SQLite FTS5 tables from their content tables."""
+    backend = BACKENDS['sqlite']
+    for index in INDEXES.values():
+        if db.engine.dialect.name == 'sqlite' and backend.available(index):
+            db.session.execute(text(
+                f"INSERT INTO {index.fts_table}({index.fts_table}) VALUES('rebuild')"
+            ))
+            click.echo(f'Rebuilt {index.fts_table}.')
+    db.session.commit()
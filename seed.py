@@ -1,5 +1,10 @@
+from sqlalchemy import delete
+
 from app import app
-from models import db, Industry, Waste, WasteRequest
+from models import db, Industry, Waste, WasteRequest, ChangeLog
+import analytics
+import stats
+import versions
 
 with app.app_context():
     print("Clearing database...")
@@ -7,6 +12,12 @@ with app.app_context():
     WasteRequest.query.delete()
     Waste.query.delete()
     Industry.query.delete()
+    # The bulk deletes above bypass the change hub: drop the sync log of the
+    # old rows and bump every table version by hand, so cached responses and
+    # sync tokens from before the reseed are not reused
+    db.session.execute(delete(ChangeLog))
+    versions.bump(db.session.connection(),
+                  [versions.INDUSTRIES, versions.WASTES, versions.WASTE_REQUESTS])
     db.session.commit()
 
     print("Seeding industries...")
@@ -69,4 +80,8 @@ with app.app_context():
     db.session.add_all(requests)
     db.session.commit()
 
+    # Nor did they update the counters and rollups, so recompute both
+    stats.rebuild()
+    analytics.rebuild()
+
     print("Database seeded successfully!")
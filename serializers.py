@@ -0,0 +1,327 @@
+import json
+from collections import defaultdict
+
+from flask import current_app, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import func, select, DateTime
+
+from models import db, Industry, Waste, WasteRequest
+from instrumentation import timed_serialization
+from pagination import encode_cursor
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+# Read-path serializers for the list endpoints. They select plain column
+# tuples with Core and build the same dicts IndustrySchema, WasteSchema and
+# WasteRequestSchema would dump, without per-object Marshmallow field
+# dispatch. Nested relationships are fetched with one set-based query each.
+# The schemas are still used for single objects and write responses.
+#
+# ?fields= and ?expand= narrow a response to a Fieldset: only its columns are
+# selected and only its relationships are joined or fetched.
+
+
+# Bookkeeping columns the schemas exclude
+INTERNAL = frozenset(['deleted_at'])
+
+
+def _fields(model):
+    """(key, column, converter) for every scalar column the schemas dump"""
+    fields = []
+    for attr in model.__mapper__.column_attrs:
+        if attr.key in INTERNAL:
+            continue
+        column = attr.columns[0]
+        convert = (lambda value: value.isoformat() if value is not None else None) \
+            if isinstance(column.type, DateTime) else None
+        fields.append((attr.key, column, convert))
+    return fields
+
+
+INDUSTRY_FIELDS = _fields(Industry)
+WASTE_FIELDS = _fields(Waste)
+WASTE_REQUEST_FIELDS = _fields(WasteRequest)
+
+
+def columns(fields):
+    return [column for _, column, _ in fields]
+
+
+def _row_dict(row, fields):
+    item = {}
+    for index, (key, _, convert) in enumerate(fields):
+        value = row[index]
+        item[key] = convert(value) if convert else value
+    return item
+
+
+def row_dicts(rows, fields):
+    """Flat dicts for rows selected with columns(fields)"""
+    return [_row_dict(row, fields) for row in rows]
+
+
+class FieldsetError(ValueError):
+    """Raised when ?fields= or ?expand= names something the resource lacks"""
+
+
+class Fieldset:
+    """The columns (a subset of *_FIELDS) and relationships to return"""
+
+    def __init__(self, fields, relations):
+        self.fields = fields
+        self.relations = relations
+
+    def __contains__(self, relation):
+        return relation in self.relations
+
+    @property
+    def keys(self):
+        return [key for key, _, _ in self.fields]
+
+
+# Relationships each schema nests by default
+RELATIONS = {
+    Industry: ('wastes', 'waste_requests'),
+    Waste: ('industry', 'waste_requests'),
+    WasteRequest: ('waste', 'industry'),
+}
+
+_FULL = {
+    Industry: Fieldset(INDUSTRY_FIELDS, frozenset(RELATIONS[Industry])),
+    Waste: Fieldset(WASTE_FIELDS, frozenset(RELATIONS[Waste])),
+    WasteRequest: Fieldset(WASTE_REQUEST_FIELDS, frozenset(RELATIONS[WasteRequest])),
+}
+
+
+def _names(arg):
+    value = request.args.get(arg)
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def fieldset(model):
+    """Fieldset for `model` from ?fields= and ?expand=, or None for everything.
+
+    ?fields= lists the columns and relationships to return (id is always
+    included); ?expand= lists relationships to nest. With ?fields= alone only
+    the relationships it names are nested; with ?expand= alone every column
+    is returned.
+    """
+    fields, expand = _names('fields'), _names('expand')
+    if fields is None and expand is None:
+        return None
+
+    full = _FULL[model]
+    relations = RELATIONS[model]
+    for name in fields or ():
+        if name not in full.keys and name not in relations:
+            raise FieldsetError(f"Unknown field '{name}'; "
+                                f"choose from: {', '.join(full.keys + list(relations))}")
+    for name in expand or ():
+        if name not in relations:
+            raise FieldsetError(f"Cannot expand '{name}'; choose from: {', '.join(relations)}")
+
+    if fields is None:
+        selected = full.fields
+    else:
+        selected = [field for field in full.fields if field[0] == 'id' or field[0] in fields]
+    nested = set(expand or ()) | {name for name in fields or () if name in relations}
+    return Fieldset(selected, frozenset(nested))
+
+
+_schemas = {}
+
+
+def sparse_schema(schema, fieldset):
+    """`schema`, or one limited to `fieldset` (cached per shape)"""
+    if fieldset is None:
+        return schema
+    only = tuple(fieldset.keys) + tuple(sorted(fieldset.relations))
+    key = (type(schema), only)
+    sparse = _schemas.get(key)
+    if sparse is None:
+        sparse = _schemas.setdefault(key, type(schema)(only=only))
+    return sparse
+
+
+def _industry_ref(industry_id, name):
+    # Nested IndustrySchema(only=('id', 'name'))
+    return {'id': industry_id, 'name': name} if industry_id is not None else None
+
+
+def waste_select(fieldset=None):
+    """Waste columns in WASTE_FIELDS order, plus the owning industry's name"""
+    fieldset = fieldset or _FULL[Waste]
+    query = select(*columns(fieldset.fields)).where(Waste.deleted_at.is_(None))
+    if 'industry' in fieldset:
+        query = (query.add_columns(Waste.industry_id.label('industry_ref_id'),
+                                   Industry.name.label('industry_name'))
+                 .outerjoin(Industry, Industry.id == Waste.industry_id))
+    return query
+
+
+def dump_wastes(rows, fieldset=None, nested_limit=None):
+    """Rows from waste_select() -> WasteSchema(many=True) output.
+
+    With `nested_limit`, each waste nests at most that many requests, oldest
+    first, and `waste_requests_next` holds a cursor for the rest (see
+    GET /api/dashboard/waste-requests/export), or None.
+    """
+    fieldset = fieldset or _FULL[Waste]
+    waste_ids = [row.id for row in rows]
+    requests_by_waste = defaultdict(list)
+    if waste_ids and 'waste_requests' in fieldset:
+        # Nested WasteRequestSchema(exclude=('waste',))
+        query = (select(*columns(WASTE_REQUEST_FIELDS), Industry.name)
+                 .outerjoin(Industry, Industry.id == WasteRequest.industry_id)
+                 .where(WasteRequest.waste_id.in_(waste_ids))
+                 .order_by(WasteRequest.id))
+        if nested_limit is not None:
+            # One extra per waste tells whether there are more
+            ranked = (select(WasteRequest.id,
+                             func.row_number().over(partition_by=WasteRequest.waste_id,
+                                                    order_by=WasteRequest.id).label('position'))
+                      .where(WasteRequest.waste_id.in_(waste_ids))
+                      .subquery())
+            query = (query.join(ranked, ranked.c.id == WasteRequest.id)
+                     .where(ranked.c.position <= nested_limit + 1))
+        for row in db.session.execute(query):
+            item = _row_dict(row, WASTE_REQUEST_FIELDS)
+            item['industry'] = _industry_ref(row.industry_id, row[-1])
+            requests_by_waste[row.waste_id].append(item)
+
+    items = []
+    for row in rows:
+        item = _row_dict(row, fieldset.fields)
+        if 'industry' in fieldset:
+            item['industry'] = _industry_ref(row.industry_ref_id, row.industry_name)
+        if 'waste_requests' in fieldset:
+            nested = requests_by_waste[row.id]
+            if nested_limit is not None:
+                more = len(nested) > nested_limit
+                nested = nested[:nested_limit]
+                item['waste_requests_next'] = \
+                    encode_cursor({'id': nested[-1]['id']}) if more else None
+            item['waste_requests'] = nested
+        items.append(item)
+    return items
+
+
+def industry_select(fieldset=None):
+    return (select(*columns((fieldset or _FULL[Industry]).fields))
+            .where(Industry.deleted_at.is_(None)))
+
+
+def dump_industries(rows, fieldset=None):
+    """Rows from industry_select() -> IndustrySchema(many=True) output"""
+    fieldset = fieldset or _FULL[Industry]
+    industry_ids = [row.id for row in rows]
+    wastes_by_industry = defaultdict(list)
+    requests_by_industry = defaultdict(list)
+    if industry_ids and 'wastes' in fieldset:
+        # Nested WasteSchema(exclude=('industry', 'waste_requests'))
+        waste_rows = db.session.execute(
+            select(*columns(WASTE_FIELDS))
+            .where(Waste.industry_id.in_(industry_ids), Waste.deleted_at.is_(None))
+            .order_by(Waste.id)
+        ).all()
+        for row in waste_rows:
+            wastes_by_industry[row.industry_id].append(_row_dict(row, WASTE_FIELDS))
+
+    if industry_ids and 'waste_requests' in fieldset:
+        # Nested WasteRequestSchema(exclude=('industry',))
+        request_rows = db.session.execute(
+            select(*columns(WASTE_REQUEST_FIELDS), Waste.id, Waste.name, Waste.wasteType)
+            .outerjoin(Waste, Waste.id == WasteRequest.waste_id)
+            .where(WasteRequest.industry_id.in_(industry_ids))
+            .order_by(WasteRequest.id)
+        ).all()
+        for row in request_rows:
+            item = _row_dict(row, WASTE_REQUEST_FIELDS)
+            waste_id, name, waste_type = row[-3:]
+            item['waste'] = {'id': waste_id, 'name': name, 'wasteType': waste_type} \
+                if waste_id is not None else None
+            requests_by_industry[row.industry_id].append(item)
+
+    items = []
+    for row in rows:
+        item = _row_dict(row, fieldset.fields)
+        if 'wastes' in fieldset:
+            item['wastes'] = wastes_by_industry[row.id]
+        if 'waste_requests' in fieldset:
+            item['waste_requests'] = requests_by_industry[row.id]
+        items.append(item)
+    return items
+
+
+def waste_request_select(fieldset=None):
+    """Request columns plus the nested waste and industry references"""
+    fieldset = fieldset or _FULL[WasteRequest]
+    query = select(*columns(fieldset.fields))
+    if 'waste' in fieldset:
+        query = (query.add_columns(Waste.id.label('waste_ref_id'), Waste.name.label('waste_name'),
+                                   Waste.wasteType.label('waste_type'))
+                 .outerjoin(Waste, Waste.id == WasteRequest.waste_id))
+    if 'industry' in fieldset:
+        query = (query.add_columns(WasteRequest.industry_id.label('industry_ref_id'),
+                                   Industry.name.label('industry_name'))
+                 .outerjoin(Industry, Industry.id == WasteRequest.industry_id))
+    return query
+
+
+def dump_waste_requests(rows, fieldset=None):
+    """Rows from waste_request_select() -> WasteRequestSchema(many=True) output"""
+    fieldset = fieldset or _FULL[WasteRequest]
+    items = []
+    for row in rows:
+        item = _row_dict(row, fieldset.fields)
+        if 'waste' in fieldset:
+            item['waste'] = {'id': row.waste_ref_id, 'name': row.waste_name,
+                             'wasteType': row.waste_type} if row.waste_ref_id is not None else None
+        if 'industry' in fieldset:
+            item['industry'] = _industry_ref(row.industry_ref_id, row.industry_name)
+        items.append(item)
+    return items
+
+
+def dumps(payload, default=None):
+    """Encode like flask.jsonify (sorted keys, compact), preferring orjson"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=default,
+                            option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE
+                            | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(payload, default=default, sort_keys=True, separators=(',', ':')) + '\n'
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider with its responses encoded by dumps(), so a
+    schema's jsonify() and the fast path give the same bytes: orjson writes
+    non-ASCII text as UTF-8 and formats some floats differently from json"""
+
+    def response(self, *args, **kwargs):
+        if self._app.debug:
+            return super().response(*args, **kwargs)
+        payload = self._prepare_response_obj(args, kwargs)
+        # Dates and the like still go through Flask's own conversions
+        return self._app.response_class(dumps(payload, default=self.default),
+                                        mimetype=self.mimetype)
+
+
+def fast_jsonify(payload):
+    if current_app.debug:
+        # Keep Flask's pretty-printed debug output
+        return jsonify(payload)
+    return current_app.response_class(dumps(payload), mimetype='application/json')
+
+
+def fast_page_response(dump, page, fieldset=None):
+    """Serialize a Page of Core rows with one of the dump_* functions"""
+    with timed_serialization():
+        return fast_jsonify({
+            'items': dump(page.items, fieldset),
+            'next_cursor': page.next_cursor
+        })
@@ -0,0 +1,45 @@
+"""Serve the API for many long-lived connections (the SSE change feed).
+
+With gevent installed, every connection runs in a greenlet, so thousands of
+idle /api/dashboard/events streams cost a little memory each instead of a
+WSGI thread. Without gevent it falls back to Werkzeug's threaded server.
+
+    pip install gevent
+    python serve.py --port 5555
+
+Under gunicorn the equivalent is:
+
+    gunicorn -k gevent --worker-connections 2000 -w 4 'app:create_app()'
+
+(with EVENTS_BROKER=redis so every worker sees every commit).
+"""
+try:
+    from gevent import monkey
+    # Must run before anything imports threading, socket or queue
+    monkey.patch_all()
+except ImportError:
+    monkey = None
+
+import argparse
+
+from app import create_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5555)
+    args = parser.parse_args()
+
+    app = create_app()
+    if monkey is not None:
+        from gevent.pywsgi import WSGIServer
+        print(f"Serving on http://{args.host}:{args.port} (gevent)")
+        WSGIServer((args.host, args.port), app).serve_forever()
+    else:
+        print("gevent is not installed; falling back to one thread per connection")
+        app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
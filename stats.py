@@ -0,0 +1,157 @@
+from collections import defaultdict
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, insert, update, delete, select
+
+from models import db, Industry, Waste, WasteRequest, StatCounter, UnitTotal
+import changes
+
+# Dashboard aggregates are kept in two small tables and adjusted in the same
+# transaction as the rows they summarise, so reading them is a primary-key
+# lookup instead of COUNT(*)/SUM() over the whole table. Quantities are
+# totalled per canonical unit (see units.py), so "kg" and "t" share a bucket.
+# Soft-deleted rows (deleted_at set) are not counted: stamping deleted_at
+# takes a row out of the totals, and its later purge changes nothing.
+
+COUNTED_TABLES = {
+    Industry.__tablename__: 'industries',
+    Waste.__tablename__: 'wastes',
+    WasteRequest.__tablename__: 'waste_requests',
+}
+
+
+def _waste_totals(values):
+    return values['canonical_unit'], values['canonical_quantity'] or 0.0
+
+
+def _counted(values):
+    return values is not None and values.get('deleted_at') is None
+
+
+def deltas(batch):
+    """({counter: delta}, {canonical unit: [quantity delta, entries delta]})
+    for a batch of row changes; zero deltas are left out"""
+    counts = defaultdict(int)
+    units = defaultdict(lambda: [0.0, 0])
+
+    for change in batch:
+        counter = COUNTED_TABLES.get(change.table)
+        if counter is None:
+            continue
+        old, new = _counted(change.old), _counted(change.new)
+        counts[counter] += new - old
+
+        if change.table != Waste.__tablename__:
+            continue
+        if old:
+            unit, quantity = _waste_totals(change.old)
+            units[unit][0] -= quantity
+            units[unit][1] -= 1
+        if new:
+            unit, quantity = _waste_totals(change.new)
+            units[unit][0] += quantity
+            units[unit][1] += 1
+
+    return ({name: delta for name, delta in counts.items() if delta},
+            {unit: totals for unit, totals in units.items() if totals[0] or totals[1]})
+
+
+@changes.on_flush
+def apply_changes(session, batch):
+    """Fold a batch of row changes into the counters"""
+    counts, units = deltas(batch)
+    connection = session.connection()
+    for name, delta in counts.items():
+        _bump_counter(connection, name, delta)
+    for unit, (quantity, entries) in units.items():
+        _bump_unit(connection, unit, quantity, entries)
+
+
+def _bump_counter(connection, name, delta):
+    result = connection.execute(
+        update(StatCounter)
+        .where(StatCounter.name == name)
+        .values(value=StatCounter.value + delta)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(StatCounter).values(name=name, value=delta))
+
+
+def _bump_unit(connection, unit, quantity, entries):
+    result = connection.execute(
+        update(UnitTotal)
+        .where(UnitTotal.unit == unit)
+        .values(quantity=UnitTotal.quantity + quantity,
+                entries=UnitTotal.entries + entries)
+    )
+    if result.rowcount == 0:
+        connection.execute(
+            insert(UnitTotal).values(unit=unit, quantity=quantity, entries=entries)
+        )
+
+
+def get_count(name):
+    """Current value of one of the COUNTED_TABLES counters"""
+    value = db.session.execute(
+        select(StatCounter.value).where(StatCounter.name == name)
+    ).scalar()
+    return value or 0
+
+
+def get_counts():
+    rows = db.session.execute(select(StatCounter.name, StatCounter.value)).all()
+    counts = {name: 0 for name in COUNTED_TABLES.values()}
+    counts.update({name: value for name, value in rows})
+    return counts
+
+
+def get_unit_totals():
+    """{canonical unit: total quantity} for every unit that still has wastes"""
+    rows = db.session.execute(
+        select(UnitTotal.unit, UnitTotal.quantity).where(UnitTotal.entries > 0)
+    ).all()
+    return {unit: quantity for unit, quantity in rows}
+
+
+def get_total_quantity():
+    """Sum of every canonical unit's total"""
+    return db.session.execute(
+        select(func.coalesce(func.sum(UnitTotal.quantity), 0.0)).where(UnitTotal.entries > 0)
+    ).scalar()
+
+
+def rebuild():
+    """Recompute every counter from the base tables"""
+    session = db.session
+    session.execute(delete(StatCounter))
+    session.execute(delete(UnitTotal))
+
+    for query, name in ((select(func.count()).where(Industry.deleted_at.is_(None)),
+                         'industries'),
+                        (select(func.count()).where(Waste.deleted_at.is_(None)), 'wastes'),
+                        (select(func.count()).select_from(WasteRequest), 'waste_requests')):
+        total = session.execute(query).scalar()
+        session.execute(insert(StatCounter).values(name=name, value=total))
+
+    session.execute(
+        insert(UnitTotal).from_select(
+            ['unit', 'quantity', 'entries'],
+            select(Waste.canonical_unit,
+                   func.coalesce(func.sum(Waste.canonical_quantity), 0.0),
+                   func.count(Waste.id))
+            .where(Waste.deleted_at.is_(None))
+            .group_by(Waste.canonical_unit)
+        )
+    )
+    session.commit()
+
+
+stats_cli = AppGroup('stats', help='Maintain the dashboard statistics store.')
+
+
+@stats_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild dashboard statistics from the base tables."""
+    rebuild()
+    click.echo('Dashboard statistics rebuilt.')
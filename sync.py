@@ -0,0 +1,106 @@
+from collections import OrderedDict
+
+from sqlalchemy import delete, insert, select, text
+
+from models import db, Industry, Waste, WasteRequest, ChangeLog, utcnow
+from pagination import PaginationError, encode_cursor, decode_cursor
+from serializers import (INDUSTRY_FIELDS, WASTE_FIELDS, WASTE_REQUEST_FIELDS,
+                         columns, row_dicts)
+import changes
+
+# change_log holds one entry per row that was ever inserted, updated or
+# deleted: the latest change and a sequence number. Every write replaces the
+# row's entry with a fresh, higher seq, so "everything since token N" is an
+# index range scan on seq, and the log never grows past one entry per row
+# (plus one tombstone per deleted row).
+#
+# Entries must become visible in seq order. SQLite serializes writers, so
+# they do; on PostgreSQL writers take a transaction-level advisory lock
+# before writing their entries.
+
+DEFAULT_SYNC_SIZE = 500
+MAX_SYNC_SIZE = 5000
+
+# Advisory lock key for change_log writers on PostgreSQL
+_PG_LOCK_KEY = 0x6563_6f73
+
+SYNCED = OrderedDict([
+    (Industry.__tablename__, (Industry, INDUSTRY_FIELDS)),
+    (Waste.__tablename__, (Waste, WASTE_FIELDS)),
+    (WasteRequest.__tablename__, (WasteRequest, WASTE_REQUEST_FIELDS)),
+])
+
+
+@changes.on_flush
+def apply_changes(session, batch):
+    """Replace the change_log entry of every changed row"""
+    latest = OrderedDict()
+    for change in batch:
+        if change.table in SYNCED:
+            row_id = (change.new or change.old)['id']
+            latest.pop((change.table, row_id), None)
+            latest[(change.table, row_id)] = change.op
+    if not latest:
+        return
+
+    connection = session.connection()
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': _PG_LOCK_KEY})
+    for table in SYNCED:
+        row_ids = [row_id for (name, row_id) in latest if name == table]
+        if row_ids:
+            connection.execute(delete(ChangeLog).where(
+                ChangeLog.table_name == table, ChangeLog.row_id.in_(row_ids)))
+    now = utcnow()
+    connection.execute(insert(ChangeLog), [
+        {'table_name': table, 'row_id': row_id, 'op': op, 'changed_at': now}
+        for (table, row_id), op in latest.items()
+    ])
+
+
+def _since(token):
+    if not token:
+        return 0
+    seq = decode_cursor(token).get('seq')
+    if not isinstance(seq, int) or seq < 0:
+        raise PaginationError('Invalid sync token')
+    return seq
+
+
+def changes_since(token, limit=DEFAULT_SYNC_SIZE):
+    """Rows changed after `token`, oldest change first.
+
+    Returns {'changes': {table: {'upserted': [rows], 'deleted': [ids]}},
+    'next': token, 'has_more': bool}. An empty token starts from the
+    beginning, which returns every live row.
+    """
+    since = _since(token)
+    entries = db.session.execute(
+        select(ChangeLog.seq, ChangeLog.table_name, ChangeLog.row_id, ChangeLog.op)
+        .where(ChangeLog.seq > since)
+        .order_by(ChangeLog.seq)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    result = {}
+    for table, (model, fields) in SYNCED.items():
+        touched = [entry for entry in entries if entry.table_name == table]
+        live = [entry.row_id for entry in touched if entry.op != changes.DELETE]
+        query = select(*columns(fields)).where(model.id.in_(live)).order_by(model.id)
+        if 'deleted_at' in model.__table__.c:
+            query = query.where(model.deleted_at.is_(None))
+        rows = row_dicts(db.session.execute(query), fields) if live else []
+        found = {row['id'] for row in rows}
+        # Soft-deleted rows, and rows deleted after their entry was read,
+        # count as deleted too
+        deleted = sorted(entry.row_id for entry in touched if entry.row_id not in found)
+        result[table] = {'upserted': rows, 'deleted': deleted}
+
+    last_seq = entries[-1].seq if entries else since
+    return {
+        'changes': result,
+        'next': encode_cursor({'seq': last_seq}),
+        'has_more': has_more,
+    }
@@ -0,0 +1,56 @@
+import os
+import shutil
+import sys
+
+import flask_migrate
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from app import create_app  # noqa: E402
+from models import db  # noqa: E402
+
+
+def make_app(path, **overrides):
+    """An app on the SQLite file at `path`, with the response cache off"""
+    config = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'CACHE_BACKEND': '',
+              'TESTING': True}
+    config.update(overrides)
+    return create_app(**config)
+
+
+@pytest.fixture(scope='session')
+def migrated_db(tmp_path_factory):
+    """A SQLite file migrated to head once per run; tests work on copies"""
+    path = str(tmp_path_factory.mktemp('schema') / 'ecocycle.db')
+    app = make_app(path)
+    with app.app_context():
+        flask_migrate.upgrade(directory=os.path.join(ROOT, 'migrations'))
+        db.session.remove()
+        db.engine.dispose()
+    return path
+
+
+@pytest.fixture
+def app(migrated_db, tmp_path):
+    path = str(tmp_path / 'ecocycle.db')
+    shutil.copyfile(migrated_db, path)
+    app = make_app(path)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def populate(app, industries, wastes, requests, seed=0):
+    """Fill the app's database with datagen.generate()"""
+    from datagen import generate
+    with app.app_context():
+        generate(industries, wastes, requests, seed=seed)
+        db.session.remove()
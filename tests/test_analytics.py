@@ -0,0 +1,64 @@
+"""Waste type and unit changes move their requests within the rollups."""
+from sqlalchemy import select
+
+import analytics
+from models import db, RequestRollup, Waste, WasteRequest
+from tests.conftest import populate
+
+
+def _rollups():
+    rows = db.session.execute(select(RequestRollup).where(RequestRollup.requests != 0))
+    return sorted((row.grain, row.industry_id, row.bucket, row.wasteType, row.unit,
+                   row.requests, round(row.requested_quantity, 6), row.approved,
+                   round(row.approved_quantity, 6), row.rejected,
+                   round(row.rejected_quantity, 6))
+                  for row in rows.scalars())
+
+
+def _rebuilt():
+    analytics.rebuild()
+    return _rollups()
+
+
+def _busiest_waste():
+    return db.session.execute(
+        select(WasteRequest.waste_id).group_by(WasteRequest.waste_id)
+        .order_by(db.func.count().desc()).limit(1)).scalar()
+
+
+def test_type_and_unit_change_moves_requests(app):
+    populate(app, 5, 20, 200)
+    client = app.test_client()
+    with app.app_context():
+        waste_id = _busiest_waste()
+
+    response = client.put(f'/api/wastes/{waste_id}', json={'wasteType': 'Renamed'})
+    assert response.status_code == 200
+    with app.app_context():
+        incremental = _rollups()
+        assert 'Renamed' in {row[3] for row in incremental}
+        assert incremental == _rebuilt()
+
+    response = client.put(f'/api/wastes/{waste_id}', json={'unit': 't'})
+    assert response.status_code == 200
+    with app.app_context():
+        assert _rollups() == _rebuilt()
+
+
+def test_requests_changed_in_the_same_flush(app):
+    populate(app, 5, 20, 200)
+    with app.app_context():
+        waste = db.session.get(Waste, _busiest_waste())
+        waste.wasteType = 'Renamed'
+        waste.unit = 'g'
+        requests = WasteRequest.query.filter_by(waste_id=waste.id).limit(2).all()
+        requests[0].status = 'approved' if requests[0].status != 'approved' else 'rejected'
+        requests[0].quantity_requested += 5
+        # Moved onto another waste, and one moved onto this one
+        other = WasteRequest.query.filter(WasteRequest.waste_id != waste.id).first()
+        requests[1].waste_id, other.waste_id = other.waste_id, waste.id
+        db.session.add(WasteRequest(quantity_requested=7, status='pending',
+                                    industry_id=waste.industry_id, waste_id=waste.id))
+        db.session.commit()
+
+        assert _rollups() == _rebuilt()
@@ -0,0 +1,78 @@
+"""The ASGI server keeps event streams off its thread pool."""
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip('greenlet')
+pytest.importorskip('aiosqlite')
+
+from asgi import AsyncAPI  # noqa: E402
+from models import db, Industry, Waste  # noqa: E402
+from tests.conftest import make_app  # noqa: E402
+
+
+def scope(method, path):
+    return {'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+            'headers': [(b'content-type', b'application/json')]}
+
+
+class Client:
+    """One request against an ASGI app, its response read as it arrives"""
+
+    def __init__(self, api, method, path, body=b''):
+        self.requests = asyncio.Queue()
+        self.requests.put_nowait({'type': 'http.request', 'body': body, 'more_body': False})
+        self.messages = asyncio.Queue()
+        self.task = asyncio.ensure_future(api(scope(method, path), self.requests.get,
+                                              self.messages.put))
+
+    async def status(self):
+        return (await asyncio.wait_for(self.messages.get(), 5))['status']
+
+    async def read_until(self, text, timeout=5):
+        body = b''
+        while text.encode() not in body:
+            body += (await asyncio.wait_for(self.messages.get(), timeout))['body']
+        return body.decode()
+
+    async def disconnect(self):
+        self.requests.put_nowait({'type': 'http.disconnect'})
+        await asyncio.wait_for(self.task, 5)
+
+
+def test_open_event_streams_leave_the_pool_free(migrated_db, tmp_path):
+    import shutil
+    path = str(tmp_path / 'ecocycle.db')
+    shutil.copyfile(migrated_db, path)
+    app = make_app(path, ASGI_WSGI_THREADS=2)
+    with app.app_context():
+        industry = Industry(name='Buyer', industry_code=1)
+        db.session.add(industry)
+        db.session.flush()
+        waste = Waste(name='Scrap', wasteType='Metal', quantity=10, unit='kg',
+                      industry_id=industry.id)
+        db.session.add(waste)
+        db.session.commit()
+        ids = {'industry_id': industry.id, 'waste_id': waste.id}
+    api = AsyncAPI(app)
+
+    async def run():
+        streams = [Client(api, 'GET', '/api/dashboard/events') for _ in range(8)]
+        for stream in streams:
+            assert await stream.status() == 200
+            await stream.read_until('stats.snapshot')
+
+        # More streams than pool threads, and a write still gets through
+        write = Client(api, 'POST', '/api/dashboard/waste-requests',
+                       json.dumps(dict(ids, quantity_requested=1)).encode())
+        assert await write.status() == 201
+        await asyncio.wait_for(write.task, 5)
+
+        for stream in streams:
+            assert 'event: request.created' in await stream.read_until('request.created')
+            await stream.disconnect()
+        assert app.extensions['events'].hub.subscriber_count == 0
+        await api.close()
+
+    asyncio.run(run())
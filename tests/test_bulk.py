@@ -0,0 +1,33 @@
+"""Bulk uploads are read from the spooled upload file."""
+import io
+import tempfile
+
+import bulk
+
+CSV = 'name,industry_code,description\nSteelworks,"7","Rolls, casts\nand forges"\nPaperMill,8,\n'
+
+
+def test_csv_upload(client):
+    # Large enough for Werkzeug to spool it to disk
+    rows = CSV + ''.join(f'Plant {n},{100 + n},{"x" * 200}\n' for n in range(3000))
+    response = client.post('/api/industries/bulk', data={
+        'file': (io.BytesIO(rows.encode()), 'industries.csv')})
+    assert response.status_code == 200
+    assert response.get_json() == {'inserted': 3002, 'failed': 0, 'errors': []}
+    description = client.get('/api/industries/1').get_json()['description']
+    assert description == 'Rolls, casts\nand forges'
+
+
+class _OldSpooledFile(tempfile.SpooledTemporaryFile):
+    """SpooledTemporaryFile as it was before Python 3.11"""
+
+    @property
+    def readable(self):
+        raise AttributeError('readable')
+
+
+def test_text_stream_reads_spooled_files_without_io_methods():
+    upload = _OldSpooledFile()
+    upload.write(CSV.encode())
+    upload.seek(0)
+    assert bulk._text_stream(upload).read() == CSV
@@ -0,0 +1,61 @@
+"""Response cache entries follow writes made by other processes."""
+from models import db
+from tests.conftest import make_app, populate
+
+
+def test_write_through_another_instance_is_not_served_stale(app):
+    populate(app, 3, 10, 20)
+    with app.app_context():
+        path = db.engine.url.database
+    # Two instances on one database, each with its own in-memory cache
+    first = make_app(path, CACHE_BACKEND='memory').test_client()
+    second = make_app(path, CACHE_BACKEND='memory').test_client()
+
+    for client in (first, second):
+        client.get('/api/wastes/1')
+    response = second.get('/api/wastes/1')
+    assert response.headers['X-Cache'] == 'HIT'
+    etag = response.headers['ETag']
+
+    assert first.put('/api/wastes/1', json={'name': 'Renamed'}).status_code == 200
+
+    response = second.get('/api/wastes/1')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert response.get_json()['name'] == 'Renamed'
+    assert response.headers['ETag'] != etag
+    assert second.get('/api/wastes/1', headers={'If-None-Match': etag}).status_code == 200
+    assert second.get('/api/wastes/1').headers['X-Cache'] == 'HIT'
+
+
+def test_unrelated_writes_keep_entries(app):
+    populate(app, 3, 10, 20)
+    with app.app_context():
+        path = db.engine.url.database
+    first = make_app(path, CACHE_BACKEND='memory')
+    client = first.test_client()
+    other = make_app(path, CACHE_BACKEND='memory').test_client()
+
+    waste = client.get('/api/wastes/1').get_json()
+    assert client.get('/api/wastes/1').headers['X-Cache'] == 'HIT'
+    unrelated = next(item for item in client.get('/api/wastes').get_json()['items']
+                     if item['id'] != 1 and item['industry_id'] != waste['industry_id'])
+
+    # Through this instance and through another one
+    assert client.put(f"/api/wastes/{unrelated['id']}", json={'name': 'Other'}).status_code == 200
+    assert other.put(f"/api/wastes/{unrelated['id']}", json={'notes': 'x'}).status_code == 200
+    response = client.post('/api/dashboard/waste-requests', json={
+        'waste_id': unrelated['id'], 'industry_id': unrelated['industry_id'],
+        'quantity_requested': 1})
+    assert response.status_code == 201
+    assert client.get('/api/wastes/1').headers['X-Cache'] == 'HIT'
+    assert first.extensions['response_cache'].stats()['invalidations'] == 0
+
+    # A request against the waste itself is nested in its response
+    response = other.post('/api/dashboard/waste-requests', json={
+        'waste_id': 1, 'industry_id': unrelated['industry_id'], 'quantity_requested': 1})
+    assert response.status_code == 201
+    response = client.get('/api/wastes/1')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert len(response.get_json()['waste_requests']) == len(waste['waste_requests']) + 1
+    assert client.get('/api/wastes/1').headers['X-Cache'] == 'HIT'
+    assert first.extensions['response_cache'].stats()['invalidations'] == 1
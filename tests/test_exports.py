@@ -0,0 +1,40 @@
+"""Exported wastes nest a bounded number of requests and page the rest."""
+import json
+
+from sqlalchemy import select
+
+import routes.Wastes
+from models import db, WasteRequest
+from tests.conftest import populate
+
+
+def _lines(response):
+    return [json.loads(line) for line in response.get_data().splitlines()]
+
+
+def test_nested_requests_are_capped_and_paged(app, monkeypatch):
+    populate(app, 5, 20, 200)
+    monkeypatch.setattr(routes.Wastes, 'EXPORT_NESTED_LIMIT', 3)
+    client = app.test_client()
+    with app.app_context():
+        expected = {}
+        for waste_id, request_id in db.session.execute(
+                select(WasteRequest.waste_id, WasteRequest.id).order_by(WasteRequest.id)):
+            expected.setdefault(waste_id, []).append(request_id)
+
+    wastes = _lines(client.get('/api/wastes/export'))
+    assert len(wastes) == 20
+    assert any(waste['waste_requests_next'] for waste in wastes)
+    for waste in wastes:
+        assert len(waste['waste_requests']) <= 3
+        ids = [item['id'] for item in waste['waste_requests']]
+        if waste['waste_requests_next']:
+            rest = client.get(f"/api/dashboard/waste-requests/export?waste_id={waste['id']}"
+                              f"&cursor={waste['waste_requests_next']}")
+            ids += [item['id'] for item in _lines(rest)]
+        assert ids == expected.get(waste['id'], [])
+
+
+def test_bad_cursor_is_refused(client):
+    response = client.get('/api/dashboard/waste-requests/export?cursor=nonsense')
+    assert response.status_code == 400
@@ -0,0 +1,47 @@
+"""Group-commit ingestion only acknowledges fully synced commits."""
+from sqlalchemy import event
+
+from models import db, Industry, Waste
+from tests.conftest import make_app
+
+# PRAGMA synchronous values
+NORMAL, FULL = 1, 2
+
+
+def test_writer_commits_with_synchronous_full(app):
+    app = make_app(app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):],
+                   INGEST_MODE=True)
+    with app.app_context():
+        industry = Industry(name='Buyer', industry_code=1)
+        db.session.add(industry)
+        db.session.flush()
+        waste = Waste(name='Scrap', wasteType='Metal', quantity=10, unit='kg',
+                      industry_id=industry.id)
+        db.session.add(waste)
+        db.session.commit()
+        ids = {'industry_id': industry.id, 'waste_id': waste.id}
+        engine = db.engine
+
+    levels = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO "wasteRequests"'):
+            levels.append(cursor.connection.execute('PRAGMA synchronous').fetchone()[0])
+
+    event.listen(engine, 'before_cursor_execute', record)
+    client = app.test_client()
+    try:
+        for _ in range(3):
+            response = client.post('/api/dashboard/waste-requests',
+                                   json=dict(ids, quantity_requested=1))
+            assert response.status_code == 201
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+        app.extensions['ingest'].close()
+    assert levels == [FULL] * 3
+
+    # Connections the writer hands back are reset for everyone else
+    with app.app_context():
+        for _ in range(3):
+            with engine.connect() as connection:
+                assert connection.exec_driver_sql('PRAGMA synchronous').scalar() == NORMAL
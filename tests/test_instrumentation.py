@@ -0,0 +1,19 @@
+"""Schema serialization is timed without patching flask_marshmallow."""
+import re
+
+import flask_marshmallow
+
+from tests.conftest import make_app, populate
+
+
+def test_schema_jsonify_is_timed_without_patching(app):
+    jsonify = flask_marshmallow.Schema.jsonify
+    populate(app, 3, 10, 20)
+    timed = make_app(app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):],
+                     INSTRUMENTATION=True)
+    assert flask_marshmallow.Schema.jsonify is jsonify
+
+    response = timed.test_client().get('/api/wastes/1')
+    assert response.status_code == 200
+    serialize_ms = float(re.search(r'ser;dur=([\d.]+)', response.headers['Server-Timing'])[1])
+    assert serialize_ms > 0
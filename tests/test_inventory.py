@@ -0,0 +1,64 @@
+"""Concurrent approvals never take more stock than a waste holds."""
+import queue
+import threading
+
+from sqlalchemy import text
+
+from models import db, Industry, Waste, WasteRequest
+
+STOCK = 23.0
+EACH = 5.0
+REQUESTS = 20
+THREADS = 8
+
+
+def test_concurrent_approvals_share_one_lot(app):
+    with app.app_context():
+        industry = Industry(name='Seller', industry_code=1)
+        db.session.add(industry)
+        db.session.flush()
+        waste = Waste(name='Lot', wasteType='Metal', quantity=STOCK, unit='kg',
+                      industry_id=industry.id)
+        db.session.add(waste)
+        db.session.flush()
+        db.session.add_all([WasteRequest(quantity_requested=EACH, status='pending',
+                                         industry_id=industry.id, waste_id=waste.id)
+                            for _ in range(REQUESTS)])
+        # Any statement taking stock below zero fails its request
+        db.session.execute(text(
+            "CREATE TRIGGER no_negative_stock BEFORE UPDATE OF quantity ON wastes "
+            "WHEN NEW.quantity < 0 BEGIN SELECT RAISE(ABORT, 'negative stock'); END"))
+        db.session.commit()
+        waste_id = waste.id
+        pending = queue.Queue()
+        for request_id in db.session.execute(text('SELECT id FROM "wasteRequests"')).scalars():
+            pending.put(request_id)
+
+    barrier = threading.Barrier(THREADS)
+    statuses = []
+
+    def approve():
+        client = app.test_client()
+        barrier.wait()
+        while True:
+            try:
+                request_id = pending.get_nowait()
+            except queue.Empty:
+                return
+            response = client.patch(f'/api/dashboard/waste-requests/{request_id}/status',
+                                    json={'status': 'approved'})
+            statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=approve) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    approvals = int(STOCK // EACH)
+    assert len(statuses) == REQUESTS
+    assert statuses.count(200) == approvals
+    assert statuses.count(409) == REQUESTS - approvals
+    with app.app_context():
+        assert db.session.get(Waste, waste_id).quantity == STOCK - approvals * EACH
+        assert WasteRequest.query.filter_by(status='approved').count() == approvals
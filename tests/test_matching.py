@@ -0,0 +1,64 @@
+"""Demand matching across spellings and scales of a unit."""
+import pytest
+
+from models import db, Industry, Waste, WasteRequest
+
+
+@pytest.fixture
+def stock(app):
+    with app.app_context():
+        seller = Industry(name='Seller', industry_code=1)
+        buyer = Industry(name='Buyer', industry_code=2)
+        db.session.add_all([seller, buyer])
+        db.session.flush()
+        db.session.add_all([
+            Waste(name='Scrap', wasteType='Metal', quantity=2, unit='t', industry_id=seller.id),
+            Waste(name='Offcuts', wasteType='Metal', quantity=300, unit='kg',
+                  industry_id=seller.id),
+            Waste(name='Solvent', wasteType='Chemical', quantity=5, unit='l',
+                  industry_id=seller.id),
+        ])
+        db.session.commit()
+        return {'buyer': buyer.id}
+
+
+def test_demand_in_kg_draws_on_a_lot_in_tonnes(client, stock):
+    plan = client.get('/api/wastes/match?wasteType=Metal&unit=kg&quantity=1000').get_json()
+    assert plan['allocated'] == pytest.approx(1000)
+    assert plan['shortfall'] == 0
+    [source] = plan['sources']
+    assert source['unit'] == 't'
+    assert source['available'] == 2
+    assert source['take'] == pytest.approx(1)
+
+
+def test_unit_spelling_does_not_matter(client, stock):
+    plan = client.get('/api/wastes/match?wasteType=Metal&unit=KG&quantity=2300').get_json()
+    assert plan['unit'] == 'KG'
+    assert plan['allocated'] == pytest.approx(2300)
+    assert {source['unit']: source['take'] for source in plan['sources']} == \
+        {'t': 2, 'kg': 300}
+
+
+def test_other_dimensions_do_not_match(client, stock):
+    plan = client.get('/api/wastes/match?wasteType=Chemical&unit=kg&quantity=1').get_json()
+    assert plan['sources'] == []
+    assert plan['shortfall'] == 1
+
+
+def test_requests_are_saved_in_the_lot_unit(app, client, stock):
+    response = client.post('/api/dashboard/waste-requests/match', json={
+        'industry_id': stock['buyer'], 'wasteType': 'Metal', 'unit': 'tonnes',
+        'quantity': 0.5})
+    assert response.status_code == 201, response.get_json()
+    with app.app_context():
+        [saved] = WasteRequest.query.all()
+        assert db.session.get(Waste, saved.waste_id).unit == 't'
+        assert saved.quantity_requested == pytest.approx(0.5)
+
+    response = client.post('/api/dashboard/waste-requests/match', json={
+        'industry_id': stock['buyer'], 'wasteType': 'Metal', 'unit': 'kg',
+        'quantity': 250, 'strategy': 'nearest'})
+    assert response.status_code == 201, response.get_json()
+    [source] = response.get_json()['sources']
+    assert (source['unit'], source['take']) == ('kg', 250)
@@ -0,0 +1,31 @@
+"""The migrations and the models describe the same schema."""
+import os
+
+import flask_migrate
+from sqlalchemy import inspect, text
+
+from models import db
+from tests.conftest import ROOT, make_app
+
+
+def test_models_match_migrations(app):
+    # Exits (and so fails) if autogenerate would emit any operation,
+    # drops of the hand-made search tables included
+    with app.app_context():
+        flask_migrate.check(directory=os.path.join(ROOT, 'migrations'))
+
+
+def test_upgrade_keeps_an_existing_notes_column(tmp_path):
+    # Databases made by db.create_all() before the migrations caught up
+    # already have wastes.notes
+    app = make_app(str(tmp_path / 'ecocycle.db'))
+    directory = os.path.join(ROOT, 'migrations')
+    with app.app_context():
+        flask_migrate.upgrade(directory=directory, revision='c25e08828c1c')
+        db.session.execute(text('ALTER TABLE wastes ADD COLUMN notes TEXT'))
+        db.session.commit()
+        flask_migrate.upgrade(directory=directory)
+        columns = [column['name'] for column in inspect(db.engine).get_columns('wastes')]
+        assert columns.count('notes') == 1
+        db.session.remove()
+        db.engine.dispose()
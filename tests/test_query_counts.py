@@ -0,0 +1,70 @@
+"""Each read route runs the same number of SQL statements however many rows
+it serialises: nested relationships are eager-loaded (see loading.py), not
+lazy-loaded once per row."""
+import shutil
+
+import pytest
+from sqlalchemy import event
+
+from models import db
+from tests.conftest import make_app, populate
+
+ROUTES = [
+    '/api/industries',
+    '/api/industries?fields=name,wastes',
+    '/api/industries/1',
+    '/api/industries/search?q=recycling',
+    '/api/industries/count',
+    '/api/wastes',
+    '/api/wastes?available=true',
+    '/api/wastes/1',
+    '/api/wastes/type/Metal',
+    '/api/wastes/search?q=metal',
+    '/api/wastes/available',
+    '/api/wastes/match?wasteType=Metal&unit=kg&quantity=500',
+    '/api/wastes/total-quantity',
+    '/api/wastes/count',
+    '/api/dashboard/stats',
+    '/api/dashboard/analytics',
+    '/api/dashboard/waste-requests',
+    '/api/dashboard/waste-requests?status=pending',
+    '/api/sync',
+]
+
+# SMALL fits every list in less than a page (DEFAULT_PAGE_SIZE rows), so
+# the two runs serialise different numbers of rows
+SMALL = (10, 20, 40)
+LARGE = (60, 600, 6000)
+
+
+def count_statements(migrated_db, path, size, url):
+    shutil.copyfile(migrated_db, path)
+    app = make_app(path)
+    populate(app, *size)
+    seen = []
+    with app.app_context():
+        engine = db.engine
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = app.test_client().get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+        with app.app_context():
+            db.engine.dispose()
+    assert response.status_code == 200, response.get_data(as_text=True)
+    payload = response.get_json()
+    rows = len(payload['items']) if isinstance(payload, dict) and 'items' in payload else None
+    return len(seen), rows
+
+
+@pytest.mark.parametrize('url', ROUTES)
+def test_query_count_does_not_grow_with_rows(migrated_db, tmp_path, url):
+    small, small_rows = count_statements(migrated_db, str(tmp_path / 'small.db'), SMALL, url)
+    large, large_rows = count_statements(migrated_db, str(tmp_path / 'large.db'), LARGE, url)
+    assert small == large
+    if small_rows is not None:
+        assert 0 < small_rows < large_rows
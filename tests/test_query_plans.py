@@ -0,0 +1,101 @@
+"""EXPLAIN QUERY PLAN for the statements each route runs: lookups on the
+data tables go through an index, never a full table scan."""
+import pytest
+from sqlalchemy import event, update
+
+from models import db, WasteRequest
+from tests.conftest import populate
+
+# Tables that grow with use; the stats store, table versions and the like
+# hold a handful of rows and may be scanned
+DATA_TABLES = ('industries', 'wastes', 'wasteRequests', 'change_log', 'request_rollups')
+
+READS = [
+    '/api/industries',
+    '/api/industries/1',
+    '/api/industries/search?q=recycling',
+    '/api/wastes',
+    '/api/wastes?industry_id=2',
+    '/api/wastes?wasteType=Metal',
+    '/api/wastes?available=true',
+    '/api/wastes/1',
+    '/api/wastes/type/Metal',
+    '/api/wastes/search?q=metal',
+    '/api/wastes/available',
+    '/api/wastes/match?wasteType=Metal&unit=kg&quantity=500',
+    '/api/dashboard/analytics',
+    '/api/dashboard/analytics?industry_id=3',
+    '/api/dashboard/waste-requests',
+    '/api/dashboard/waste-requests?waste_id=3',
+    '/api/dashboard/waste-requests?industry_id=3',
+    '/api/sync',
+]
+
+WRITES = [
+    ('post', '/api/industries', {'name': 'New', 'industry_code': 99999, 'description': 'd'}),
+    ('put', '/api/industries/3', {'name': 'Renamed', 'industry_code': 99998}),
+    ('patch', '/api/dashboard/waste-requests/10/status', {'status': 'rejected'}),
+    ('delete', '/api/wastes/5', None),
+    ('delete', '/api/industries/2', None),
+]
+
+
+# Unfiltered pages walk the primary key in order and stop at LIMIT
+PAGED = frozenset(['/api/industries', '/api/wastes', '/api/dashboard/waste-requests'])
+
+
+def full_scans(connection, statement, parameters, paged=False):
+    """Plan lines that scan a data table without an index"""
+    plan = [row[-1] for row in
+            connection.execute(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()]
+    # A sort would make even a paged walk touch every row
+    paged = paged and 'LIMIT' in statement and not any('TEMP B-TREE FOR ORDER BY' in line
+                                                        for line in plan)
+    return [line for line in plan
+            if line.split(' ')[0] == 'SCAN' and line.split(' ')[1] in DATA_TABLES
+            and 'INDEX' not in line and not paged]
+
+
+def assert_indexed(app, call, paged=False):
+    seen = []
+    with app.app_context():
+        engine = db.engine
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if executemany:
+            parameters = parameters[0]
+        seen.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = call(app.test_client())
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code < 400, response.get_data(as_text=True)
+
+    with app.app_context():
+        connection = db.engine.raw_connection()
+        try:
+            for statement, parameters in seen:
+                if statement.lstrip().split(' ')[0].upper() not in ('SELECT', 'UPDATE',
+                                                                    'DELETE', 'WITH'):
+                    continue
+                assert full_scans(connection, statement, parameters, paged) == [], statement
+        finally:
+            connection.close()
+
+
+@pytest.mark.parametrize('url', READS)
+def test_reads_use_indexes(app, url):
+    populate(app, 20, 60, 200)
+    assert_indexed(app, lambda client: client.get(url), url in PAGED)
+
+
+@pytest.mark.parametrize('method, url, body', WRITES)
+def test_writes_use_indexes(app, method, url, body):
+    populate(app, 20, 60, 200)
+    with app.app_context():
+        db.session.execute(update(WasteRequest).where(WasteRequest.id == 10)
+                           .values(status='pending'))
+        db.session.commit()
+    assert_indexed(app, lambda client: getattr(client, method)(url, json=body))
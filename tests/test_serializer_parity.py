@@ -0,0 +1,88 @@
+"""The Core-row serializers in serializers.py give byte-for-byte the
+response the Marshmallow schemas give for the same rows."""
+import pytest
+
+import serializers
+from loading import eager_options
+from models import (db, Industry, Waste, WasteRequest, industries_schema, wastes_schema,
+                    waste_requests_schema)
+from tests.conftest import populate
+
+SERIALIZERS = {
+    Industry: (industries_schema, serializers.industry_select, serializers.dump_industries),
+    Waste: (wastes_schema, serializers.waste_select, serializers.dump_wastes),
+    WasteRequest: (waste_requests_schema, serializers.waste_request_select,
+                   serializers.dump_waste_requests),
+}
+
+# ?fields= / ?expand= shapes per resource
+QUERIES = [
+    (Industry, ''),
+    (Industry, 'fields=name'),
+    (Industry, 'fields=name,waste_requests'),
+    (Industry, 'fields=industry_code,wastes'),
+    (Industry, 'expand=wastes'),
+    (Waste, ''),
+    (Waste, 'fields=name'),
+    (Waste, 'fields=name,waste_requests'),
+    (Waste, 'fields=quantity,unit,industry'),
+    (Waste, 'expand=industry'),
+    (WasteRequest, ''),
+    (WasteRequest, 'fields=status'),
+    (WasteRequest, 'fields=status,waste'),
+    (WasteRequest, 'expand=industry'),
+]
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def encoder(request, monkeypatch):
+    if request.param == 'json':
+        monkeypatch.setattr(serializers, 'orjson', None)
+    elif serializers.orjson is None:
+        pytest.skip('orjson is not installed')
+    return request.param
+
+
+@pytest.fixture
+def data(app):
+    populate(app, 10, 40, 150)
+    with app.app_context():
+        # Text and numbers the two encoders could disagree on
+        industry = Industry(name='Usine de récupération "Ünïcode" ✓', industry_code=90001,
+                            description='Line\nbreak\tand \\ backslash </script>')
+        db.session.add(industry)
+        db.session.flush()
+        waste = Waste(name='Déchets 日本', wasteType='Metal', quantity=0.1 + 0.2, unit='kg',
+                      notes=None, industry_id=industry.id)
+        db.session.add(waste)
+        db.session.flush()
+        db.session.add_all([
+            WasteRequest(quantity_requested=1e-7, details='tiny', industry_id=industry.id,
+                         waste_id=waste.id),
+            WasteRequest(quantity_requested=123456789012.5, details=None,
+                         industry_id=industry.id, waste_id=waste.id),
+        ])
+        db.session.commit()
+    return app
+
+
+def schema_body(model, schema, fieldset):
+    schema = serializers.sparse_schema(schema, fieldset)
+    objects = (model.query.options(*eager_options(schema, fieldset))
+               .filter(*([model.deleted_at.is_(None)] if hasattr(model, 'deleted_at') else []))
+               .order_by(model.id).all())
+    return schema.jsonify(objects, many=True).get_data()
+
+
+def fast_body(model, select_fn, dump_fn, fieldset):
+    rows = db.session.execute(select_fn(fieldset).order_by(model.id)).all()
+    return serializers.fast_jsonify(dump_fn(rows, fieldset)).get_data()
+
+
+@pytest.mark.parametrize('model, query', QUERIES)
+def test_fast_path_matches_schema(data, encoder, model, query):
+    schema, select_fn, dump_fn = SERIALIZERS[model]
+    with data.test_request_context(f'/?{query}'):
+        fieldset = serializers.fieldset(model)
+        assert fast_body(model, select_fn, dump_fn, fieldset) == \
+            schema_body(model, schema, fieldset)
@@ -0,0 +1,120 @@
+"""Soft-deleted rows leave the counters and the sync feed straight away."""
+import pytest
+
+import deletion
+from models import db, Industry, Waste
+from tests.conftest import make_app
+
+
+@pytest.fixture
+def soft(app):
+    app = make_app(app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):],
+                   DELETE_MODE='soft')
+    with app.app_context():
+        industry = Industry(name='Seller', industry_code=1)
+        db.session.add(industry)
+        db.session.flush()
+        db.session.add_all([
+            Waste(name='Scrap', wasteType='Metal', quantity=2, unit='t', industry_id=industry.id),
+            Waste(name='Offcuts', wasteType='Metal', quantity=300, unit='kg',
+                  industry_id=industry.id),
+        ])
+        db.session.commit()
+    # Purge only when the test says so
+    app.extensions['purge'] = None
+    return app
+
+
+def test_counters_drop_soft_deleted_rows(soft):
+    client = soft.test_client()
+    assert client.delete('/api/wastes/1').status_code == 202
+    overview = client.get('/api/dashboard/stats').get_json()['overview']
+    assert overview['total_waste_types'] == 1
+    assert overview['total_waste_quantity'] == {'kg': 300}
+
+    with soft.app_context():
+        deletion.purge(100)
+    overview = client.get('/api/dashboard/stats').get_json()['overview']
+    assert overview['total_waste_types'] == 1
+    assert overview['total_waste_quantity'] == {'kg': 300}
+
+    assert client.delete('/api/industries/1').status_code == 202
+    assert client.get('/api/dashboard/stats').get_json()['overview']['total_industries'] == 0
+
+
+def test_rebuild_skips_soft_deleted_rows(soft):
+    import stats
+    client = soft.test_client()
+    client.delete('/api/wastes/1')
+    before = client.get('/api/dashboard/stats').get_json()
+    with soft.app_context():
+        stats.rebuild()
+    assert client.get('/api/dashboard/stats').get_json() == before
+
+
+def test_sync_reports_soft_deleted_rows_as_deleted(soft):
+    client = soft.test_client()
+    token = client.get('/api/sync').get_json()['next']
+    client.delete('/api/wastes/1')
+    changes = client.get(f'/api/sync?since={token}').get_json()['changes']['wastes']
+    assert changes == {'upserted': [], 'deleted': [1]}
+
+    # A full sync lists it as deleted, not upserted
+    changes = client.get('/api/sync').get_json()['changes']['wastes']
+    assert [row['id'] for row in changes['upserted']] == [2]
+    assert changes['deleted'] == [1]
+
+
+def test_soft_deleted_industry_hides_its_wastes(soft):
+    with soft.app_context():
+        buyer = Industry(name='Buyer', industry_code=2)
+        db.session.add(buyer)
+        db.session.commit()
+        buyer_id = buyer.id
+    client = soft.test_client()
+    # Loads the matching index before the delete
+    match = '/api/wastes/match?wasteType=Metal&unit=kg&quantity=100'
+    assert client.get(match).get_json()['sources']
+
+    assert client.delete('/api/industries/1').status_code == 202
+    assert client.get('/api/wastes').get_json()['items'] == []
+    assert client.get('/api/wastes/1').status_code == 404
+    assert client.get('/api/wastes/type/Metal').get_json()['items'] == []
+    assert client.get(match).get_json()['sources'] == []
+    assert client.get('/api/dashboard/stats').get_json()['overview']['total_waste_types'] == 0
+
+    response = client.post('/api/dashboard/waste-requests',
+                           json={'industry_id': buyer_id, 'waste_id': 1, 'quantity_requested': 1})
+    assert response.status_code == 404
+    response = client.post('/api/dashboard/waste-requests/match', json={
+        'industry_id': buyer_id, 'wasteType': 'Metal', 'unit': 'kg', 'quantity': 100})
+    assert response.status_code == 404
+
+    with soft.app_context():
+        deletion.purge(100)
+        assert db.session.get(Industry, buyer_id) is not None
+        assert Waste.query.count() == 0
+
+
+def test_grouped_submissions_refuse_wastes_of_a_deleted_industry(soft):
+    app = make_app(soft.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):],
+                   DELETE_MODE='soft', INGEST_MODE=True)
+    app.extensions['purge'] = None
+    with app.app_context():
+        buyer = Industry(name='Buyer', industry_code=2)
+        db.session.add(buyer)
+        db.session.commit()
+        buyer_id = buyer.id
+    client = app.test_client()
+    try:
+        response = client.post('/api/dashboard/waste-requests',
+                               json={'industry_id': buyer_id, 'waste_id': 1,
+                                     'quantity_requested': 1})
+        assert response.status_code == 201
+        assert client.delete('/api/industries/1').status_code == 202
+        response = client.post('/api/dashboard/waste-requests',
+                               json={'industry_id': buyer_id, 'waste_id': 2,
+                                     'quantity_requested': 1})
+        assert response.status_code == 404
+    finally:
+        app.extensions['ingest'].close()
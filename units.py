@@ -0,0 +1,102 @@
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import Session
+
+from models import db, Waste
+import versions
+
+# Waste.unit is free text. Every waste also stores its quantity converted to
+# the canonical unit of its dimension (canonical_unit, canonical_quantity),
+# set on every write, so totals are a plain SUM grouped by canonical_unit and
+# "kg", "KG", "tonnes" and "t" add up in one bucket. Units missing from the
+# registry are only normalised (trimmed, lower-cased) and kept as they are.
+#
+# The request analytics rollups are kept in canonical units too. After
+# registering new units, `flask units backfill` re-derives the stored values,
+# then `flask stats rebuild` and `flask analytics rebuild` the totals.
+
+KILOGRAM = 'kg'
+LITRE = 'l'
+PIECE = 'pcs'
+
+# {spelling: (canonical unit, factor to it)}; keys are normalised
+UNITS = {}
+
+
+def normalize(unit):
+    return (unit or '').strip().lower()
+
+
+def register_unit(names, canonical, factor=1.0):
+    """Register spellings of a unit worth `factor` of `canonical`"""
+    for name in names:
+        UNITS[normalize(name)] = (canonical, float(factor))
+
+
+register_unit(['kg', 'kgs', 'kilo', 'kilos', 'kilogram', 'kilograms'], KILOGRAM)
+register_unit(['g', 'gram', 'grams'], KILOGRAM, 0.001)
+register_unit(['t', 'tonne', 'tonnes', 'metric ton', 'metric tons'], KILOGRAM, 1000)
+register_unit(['lb', 'lbs', 'pound', 'pounds'], KILOGRAM, 0.45359237)
+register_unit(['l', 'ltr', 'litre', 'litres', 'liter', 'liters'], LITRE)
+register_unit(['ml', 'millilitre', 'millilitres', 'milliliter', 'milliliters'], LITRE, 0.001)
+register_unit(['m3', 'm³', 'cubic metre', 'cubic metres', 'cubic meter', 'cubic meters'],
+              LITRE, 1000)
+register_unit(['gal', 'gallon', 'gallons'], LITRE, 3.785411784)
+register_unit(['pc', 'pcs', 'piece', 'pieces', 'unit', 'units', 'item', 'items', 'each'],
+              PIECE)
+
+
+def lookup(unit):
+    """(canonical unit, factor) for a unit as entered"""
+    name = normalize(unit)
+    return UNITS.get(name, (name, 1.0))
+
+
+def canonical(unit, quantity):
+    """{'canonical_unit', 'canonical_quantity'} for a waste's unit and quantity"""
+    canonical_unit, factor = lookup(unit)
+    return {'canonical_unit': canonical_unit,
+            'canonical_quantity': (quantity or 0.0) * factor}
+
+
+@event.listens_for(Session, 'before_flush')
+def _canonicalize(session, flush_context, instances):
+    # Core writes (bulk inserts, stock updates) set the columns themselves
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Waste) and obj not in session.deleted:
+            values = canonical(obj.unit, obj.quantity)
+            if obj.canonical_unit != values['canonical_unit']:
+                obj.canonical_unit = values['canonical_unit']
+            if obj.canonical_quantity != values['canonical_quantity']:
+                obj.canonical_quantity = values['canonical_quantity']
+
+
+def backfill():
+    """Recompute the canonical columns of every waste, one UPDATE per
+    distinct unit; returns the number of rows changed"""
+    session = db.session
+    changed = 0
+    for unit in session.execute(select(Waste.unit).distinct()).scalars().all():
+        canonical_unit, factor = lookup(unit)
+        changed += session.execute(
+            update(Waste)
+            .where(Waste.unit == unit)
+            .values(canonical_unit=canonical_unit,
+                    canonical_quantity=func.coalesce(Waste.quantity, 0.0) * factor)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    # Bulk UPDATEs skip the change hub, so bump the version it would have
+    versions.bump(session.connection(), [versions.WASTES])
+    session.commit()
+    return changed
+
+
+units_cli = AppGroup('units', help='Maintain the canonical waste quantities.')
+
+
+@units_cli.command('backfill')
+def backfill_command():
+    """Recompute canonical_unit and canonical_quantity for every waste."""
+    count = backfill()
+    click.echo(f'Canonical quantities recomputed ({count} rows).')
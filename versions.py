@@ -0,0 +1,90 @@
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import request, make_response
+from sqlalchemy import insert, update, select
+
+from models import db, Industry, Waste, WasteRequest, TableVersion, utcnow
+import changes
+
+# Every committed change to a table bumps its version. A response built from a
+# set of tables is fully described by the request URL plus those versions, so
+# the ETag can be checked with one tiny query before doing any real work.
+
+INDUSTRIES = Industry.__tablename__
+WASTES = Waste.__tablename__
+WASTE_REQUESTS = WasteRequest.__tablename__
+
+
+def bump(connection, tables):
+    """Bump the version of each table in `tables`"""
+    now = utcnow()
+    for table in tables:
+        result = connection.execute(
+            update(TableVersion)
+            .where(TableVersion.table_name == table)
+            .values(version=TableVersion.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(
+                insert(TableVersion).values(table_name=table, version=1, updated_at=now)
+            )
+
+
+@changes.on_flush
+def apply_changes(session, batch):
+    bump(session.connection(), sorted({change.table for change in batch}))
+
+
+def get_stamps(tables):
+    """{table: (version, updated_at)} for the given tables"""
+    rows = db.session.execute(
+        select(TableVersion.table_name, TableVersion.version, TableVersion.updated_at)
+        .where(TableVersion.table_name.in_(tables))
+    ).all()
+    stamps = {table: (0, None) for table in tables}
+    stamps.update({name: (version, updated_at) for name, version, updated_at in rows})
+    return stamps
+
+
+def _make_etag(stamps):
+    parts = [request.path]
+    parts += [f'{key}={value}' for key, value in sorted(request.args.items(multi=True))]
+    parts += [f'{table}:{stamps[table][0]}' for table in sorted(stamps)]
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def conditional(*tables):
+    """Answer GETs with 304 Not Modified while `tables` are unchanged.
+
+    `tables` must cover every table whose rows end up in the response.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            stamps = get_stamps(tables)
+            etag = _make_etag(stamps)
+            modified = [updated_at for _, updated_at in stamps.values() if updated_at]
+            last_modified = max(modified).replace(tzinfo=timezone.utc) if modified else None
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = bool(since and last_modified
+                                    and last_modified.replace(microsecond=0) <= since)
+
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            return response
+        return wrapper
+    return decorator